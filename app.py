@@ -1,22 +1,52 @@
 import os
+import sys
+import signal
 import torch
 import numpy as np
-from flask import Flask, render_template, request, redirect, url_for, session, flash
+from flask import Flask, Response, render_template, request, redirect, url_for, session, flash, stream_with_context
 from flask_socketio import SocketIO, emit, disconnect
+from werkzeug.utils import secure_filename
 import io
+import contextlib
+import copy
+import functools
+import atexit
+import gc
+import bisect
+import unicodedata
+from collections import OrderedDict
 import base64
+import hashlib
+from datetime import datetime, timezone
 import logging
-import tempfile
 import json
+import math
+import re
 import subprocess
 import shutil
+import threading
+import queue
+import time
+import itertools
+import collections
+import multiprocessing
+from multiprocessing import shared_memory, resource_tracker
+from concurrent.futures import CancelledError, Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
 import requests
-from transformers import pipeline, M2M100ForConditionalGeneration, M2M100Tokenizer
+from transformers import pipeline, M2M100ForConditionalGeneration, M2M100Tokenizer, StoppingCriteria, StoppingCriteriaList
+from transformers.generation.streamers import BaseStreamer
+from transformers.models.m2m_100.tokenization_m2m_100 import FAIRSEQ_LANGUAGE_CODES
 import torchaudio
 import soundfile as sf
 from flask_pymongo import PyMongo
+import pymongo
+from pymongo.errors import BulkWriteError, ConnectionFailure, PyMongoError
+from bson import ObjectId
 from flask_bcrypt import Bcrypt
 from flask_session import Session
+from flask_session.sessions import FileSystemSessionInterface
+from flask.sessions import SessionInterface
+from cachelib import SimpleCache
 from authlib.integrations.flask_client import OAuth
 
 # Picked 20 diverse languages
@@ -65,7 +95,6 @@ except (ImportError, ModuleNotFoundError):
 app = Flask(__name__)
 app.config['SECRET_KEY'] = os.getenv('FLASK_SECRET_KEY', 'fallback-dev-key-12345')
 app.config["MONGO_URI"] = os.getenv("MONGO_URI", "mongodb://localhost:27017/realtimeASR")
-app.config["SESSION_TYPE"] = "filesystem"
 app.config["SESSION_COOKIE_SAMESITE"] = "Lax"
 app.config["SESSION_COOKIE_HTTPONLY"] = True
 app.config["SESSION_COOKIE_SECURE"] = False  # Set to True in production with HTTPS
@@ -74,7 +103,50 @@ app.config["SESSION_COOKIE_PATH"] = "/"  # Make sure cookie is available for all
 
 mongo = PyMongo(app)
 bcrypt = Bcrypt(app)
-Session(app)
+
+# SESSION_BACKEND picks where Flask sessions live: "filesystem" (the
+# default), "mongodb" (the app's own Mongo database, for several nodes) or
+# "memory" (an in-process store for single-node setups, lost on restart)
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "filesystem").lower()
+SESSION_MEMORY_THRESHOLD = int(os.getenv("SESSION_MEMORY_THRESHOLD", "10000"))
+
+class InProcessSessionInterface(FileSystemSessionInterface):
+    """Flask-Session's filesystem interface with an in-memory cachelib store in place of the files."""
+
+    def __init__(self, threshold, key_prefix="session:", use_signer=False, permanent=True):
+        self.cache = SimpleCache(threshold=threshold)
+        self.key_prefix = key_prefix
+        self.use_signer = use_signer
+        self.permanent = permanent
+        self.has_same_site_capability = hasattr(self, "get_cookie_samesite")
+
+class SocketIOSessionInterface(SessionInterface):
+    """
+    Wraps the session backend so Socket.IO events skip it. Flask opens the
+    session on every request context push, but after connect Flask-SocketIO
+    replaces it with its own per-socket copy, so that read would be wasted.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+
+    def open_session(self, app, request):
+        if 'saved_session' in request.environ:
+            return self.make_null_session(app)
+        return self.backend.open_session(app, request)
+
+    def save_session(self, app, session, response):
+        return self.backend.save_session(app, session, response)
+
+if SESSION_BACKEND == "memory":
+    app.session_interface = InProcessSessionInterface(SESSION_MEMORY_THRESHOLD)
+else:
+    app.config["SESSION_TYPE"] = SESSION_BACKEND
+    if SESSION_BACKEND == "mongodb":
+        app.config["SESSION_MONGODB"] = mongo.cx
+        app.config["SESSION_MONGODB_DB"] = mongo.db.name
+    Session(app)
+app.session_interface = SocketIOSessionInterface(app.session_interface)
 
 # Use threading instead of eventlet for Python 3.13 compatibility
 # Allow credentials for WebSocket connections
@@ -86,240 +158,2792 @@ socketio = SocketIO(
     cookie=None  # Let Flask handle cookies
 )
 
-# OAuth Configuration
-GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID", "").strip()
-GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET", "").strip()
+# OAuth Configuration
+GOOGLE_CLIENT_ID = os.getenv("GOOGLE_CLIENT_ID", "").strip()
+GOOGLE_CLIENT_SECRET = os.getenv("GOOGLE_CLIENT_SECRET", "").strip()
+
+# Initialize OAuth
+oauth = OAuth(app)
+google = None
+
+# Only configure Google OAuth if both values are provided and not empty
+if GOOGLE_CLIENT_ID and GOOGLE_CLIENT_SECRET and len(GOOGLE_CLIENT_ID) > 0 and len(GOOGLE_CLIENT_SECRET) > 0:
+    google = oauth.register(
+        name="google",
+        client_id=GOOGLE_CLIENT_ID,
+        client_secret=GOOGLE_CLIENT_SECRET,
+        authorize_url="https://accounts.google.com/o/oauth2/auth",
+        access_token_url="https://oauth2.googleapis.com/token",
+        api_base_url="https://www.googleapis.com/oauth2/v2/",
+        client_kwargs={"scope": "email profile"},
+    )
+    logger.info("Google OAuth client registered successfully")
+else:
+    logger.info("Google OAuth not configured. Set GOOGLE_CLIENT_ID and GOOGLE_CLIENT_SECRET env vars to enable Google login.")
+
+# ----- Metrics -----
+# A minimal Prometheus registry served as text from /metrics. Counters only
+# go up, gauges may be set or computed at scrape time, and histograms keep
+# cumulative bucket counts plus a sum and a count.
+METRICS = []
+LATENCY_BUCKETS_S = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + "}"
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}  # label values -> value
+        self.lock = threading.Lock()
+        METRICS.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def samples(self):
+        with self.lock:
+            items = list(self.values.items())
+        for key, value in items:
+            yield self.name, list(zip(self.labelnames, key)), value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{name}{_format_labels(pairs)} {value:g}" for name, pairs, value in self.samples()]
+        return "\n".join(lines)
+
+class CounterMetric(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+class GaugeMetric(Metric):
+    """A gauge that is either set/inc/dec'd, or read from `function` on every scrape."""
+    kind = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=(), function=None):
+        super().__init__(name, documentation, labelnames)
+        self.function = function
+
+    def set(self, value, **labels):
+        with self.lock:
+            self.values[self._key(labels)] = value
+
+    def inc(self, amount=1.0, **labels):
+        key = self._key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0.0) + amount
+
+    def dec(self, amount=1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def samples(self):
+        if self.function is None:
+            yield from super().samples()
+            return
+        # function() returns {label values: value}, or a bare number when there are no labels
+        values = self.function()
+        if not isinstance(values, dict):
+            values = {(): values}
+        for key, value in values.items():
+            key = key if isinstance(key, tuple) else (key,)
+            yield self.name, list(zip(self.labelnames, key)), value
+
+class HistogramMetric(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=LATENCY_BUCKETS_S):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self.lock:
+            counts, total = self.values.get(key, ([0] * (len(self.buckets) + 1), 0.0))
+            counts[bisect.bisect_left(self.buckets, value)] += 1
+            self.values[key] = (counts, total + value)
+
+    def samples(self):
+        with self.lock:
+            items = [(key, (list(counts), total)) for key, (counts, total) in self.values.items()]
+        for key, (counts, total) in items:
+            pairs = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float('inf') else f"{bound:g}"
+                yield f"{self.name}_bucket", pairs + [('le', le)], cumulative
+            yield f"{self.name}_sum", pairs, total
+            yield f"{self.name}_count", pairs, cumulative
+
+def render_metrics():
+    return "\n".join(metric.render() for metric in METRICS) + "\n"
+
+STAGE_SECONDS = HistogramMetric('stt_stage_duration_seconds', 'Time spent per pipeline stage', ('stage',))
+REQUESTS = CounterMetric('stt_requests_total', 'Socket.IO requests received', ('event',))
+ERRORS = CounterMetric('stt_errors_total', 'Errors by stage and exception type', ('stage', 'type'))
+DECODE_PATHS = CounterMetric('stt_decode_path_total', 'Audio payloads decoded, by decoder used', ('path',))
+AUDIO_SECONDS = CounterMetric('stt_audio_seconds_total', 'Seconds of decoded audio processed')
+ACTIVE_SOCKETS = GaugeMetric('stt_active_sockets', 'Connected Socket.IO clients')
+
+@contextlib.contextmanager
+def timed_stage(stage, timings=None):
+    """Observe a stage's duration in STAGE_SECONDS and, if given, record it in timings as <stage>_ms."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        STAGE_SECONDS.observe(elapsed, stage=stage)
+        if timings is not None:
+            timings[f'{stage}_ms'] = round(elapsed * 1000, 1)
+
+# ----- Model setup -----
+device = "cuda:0" if torch.cuda.is_available() else "cpu"
+torch_dtype = torch.float16 if torch.cuda.is_available() else torch.float32
+
+# INFERENCE_PRECISION=int8 applies dynamic int8 quantization to the Linear
+# layers of both models on CPU, trading a little accuracy for latency and RSS
+INFERENCE_PRECISION = os.getenv("INFERENCE_PRECISION", "fp32").lower()
+
+# Model tiers, smallest first. ASR_MODEL_TIERS / MT_MODEL_TIERS choose which
+# ones to load (comma separated); requests are spread across the loaded tiers
+# by the routers in the "Tier routing" section.
+ASR_MODEL_REGISTRY = {
+    "tiny": "openai/whisper-tiny",
+    "base": "openai/whisper-base",
+    "small": "openai/whisper-small",
+    "medium": "openai/whisper-medium",
+}
+MT_MODEL_REGISTRY = {
+    "418M": "facebook/m2m100_418M",
+    "1.2B": "facebook/m2m100_1.2B",
+}
+
+def _configured_tiers(variable, registry, default):
+    requested = [name.strip() for name in os.getenv(variable, default).split(",") if name.strip()]
+    unknown = [name for name in requested if name not in registry]
+    if unknown:
+        logger.warning(f"Ignoring unknown {variable} entries: {', '.join(unknown)}")
+    return [name for name in registry if name in requested] or [default]
+
+ASR_TIERS = _configured_tiers("ASR_MODEL_TIERS", ASR_MODEL_REGISTRY, "medium")
+MT_TIERS = _configured_tiers("MT_MODEL_TIERS", MT_MODEL_REGISTRY, "418M")
+
+asr_models = {}  # tier -> pipeline
+mt_models = {}   # tier -> (model, tokenizer)
+# The largest loaded tier of each model, used when no tier is asked for
+asr_pipeline = None
+m2m_model = None
+m2m_tokenizer = None
+
+# Models load in the background so the server accepts connections at once.
+# Each tier goes pending -> loading -> warming -> ready (or failed); a model's
+# state is that of its most advanced tier, and a tier only becomes usable
+# once it is warmed up.
+MODEL_WAIT_TIMEOUT_S = float(os.getenv("MODEL_WAIT_TIMEOUT_S", "300"))
+MODEL_STATES = ('failed', 'pending', 'loading', 'warming', 'ready')
+model_states = {
+    'asr': {'state': 'pending', 'tiers': {tier: {'state': 'pending'} for tier in ASR_TIERS}},
+    'mt': {'state': 'pending', 'tiers': {tier: {'state': 'pending'} for tier in MT_TIERS}},
+}
+model_state_listener = None  # Worker processes forward state changes to the pool
+
+def _set_model_state(model, tier, state, **info):
+    tiers = model_states[model]['tiers']
+    tiers[tier] = {**tiers[tier], 'state': state, **info}
+    model_states[model]['state'] = max((status['state'] for status in tiers.values()), key=MODEL_STATES.index)
+    if model_state_listener:
+        model_state_listener(copy.deepcopy(model_states))
+
+def quantize_for_cpu(model, name):
+    """Quantize a model's Linear layers to int8 in place when INFERENCE_PRECISION=int8 on CPU."""
+    if INFERENCE_PRECISION != "int8":
+        return model
+    if device != "cpu":
+        logger.warning(f"INFERENCE_PRECISION=int8 only applies on CPU; keeping {name} in {torch_dtype}")
+        return model
+    model = torch.ao.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8, inplace=True)
+    logger.info(f"{name} quantized to dynamic int8")
+    return model
+
+def warmup_asr(asr):
+    """Run one pass over a second of synthetic audio to initialise kernels and allocations."""
+    t = np.arange(TARGET_SAMPLE_RATE) / TARGET_SAMPLE_RATE
+    samples = (0.1 * np.sin(2 * np.pi * 220 * t) + 0.01 * np.random.default_rng(0).standard_normal(len(t))).astype(np.float32)
+    asr({"raw": samples, "sampling_rate": TARGET_SAMPLE_RATE})
+
+def warmup_translation(model, tokenizer):
+    tokenizer.src_lang = "en"
+    encoded = tokenizer("Hello, how are you?", return_tensors="pt").to(device)
+    model.generate(**encoded, forced_bos_token_id=tokenizer.get_lang_id("es"), max_new_tokens=8)
+
+def load_asr_tier(tier):
+    global asr_pipeline
+    _set_model_state('asr', tier, 'loading')
+    started = time.perf_counter()
+    try:
+        logger.info(f"Loading ASR model ({ASR_MODEL_REGISTRY[tier]})...")
+        asr = pipeline(
+            "automatic-speech-recognition",
+            model=ASR_MODEL_REGISTRY[tier],
+            device=device,
+            torch_dtype=torch_dtype,
+            chunk_length_s=20
+        )
+        asr.model = quantize_for_cpu(asr.model, f"Whisper-{tier}")
+        logger.info(f"ASR model {tier} loaded successfully")
+        logger.info(f"ASR pipeline device: {asr.model.device}")
+    except Exception as e:
+        logger.error(f"Failed to load ASR model {tier}: {e}")
+        _set_model_state('asr', tier, 'failed', error=str(e))
+        return
+
+    _set_model_state('asr', tier, 'warming', load_s=round(time.perf_counter() - started, 2), precision=INFERENCE_PRECISION)
+    started = time.perf_counter()
+    try:
+        warmup_asr(asr)
+    except Exception as e:
+        logger.warning(f"ASR {tier} warmup failed: {e}")
+    asr_models[tier] = asr
+    asr_pipeline = asr_models[max(asr_models, key=ASR_TIERS.index)]
+    _set_model_state('asr', tier, 'ready', warmup_s=round(time.perf_counter() - started, 2))
+
+def load_translation_tier(tier):
+    global m2m_model, m2m_tokenizer
+    _set_model_state('mt', tier, 'loading')
+    started = time.perf_counter()
+    try:
+        logger.info(f"Loading M2M100 multilingual translation model ({MT_MODEL_REGISTRY[tier]})...")
+        model = quantize_for_cpu(M2M100ForConditionalGeneration.from_pretrained(MT_MODEL_REGISTRY[tier]).to(device), f"M2M100-{tier}")
+        tokenizer = M2M100Tokenizer.from_pretrained(MT_MODEL_REGISTRY[tier])
+        logger.info(f"M2M100 model {tier} loaded successfully")
+        logger.info(f"Translation model device: {next(model.parameters()).device}")
+    except Exception as e:
+        logger.error(f"Failed to load M2M100 model {tier}: {e}")
+        _set_model_state('mt', tier, 'failed', error=str(e))
+        return
+
+    _set_model_state('mt', tier, 'warming', load_s=round(time.perf_counter() - started, 2), precision=INFERENCE_PRECISION)
+    started = time.perf_counter()
+    try:
+        warmup_translation(model, tokenizer)
+    except Exception as e:
+        logger.warning(f"Translation {tier} warmup failed: {e}")
+    mt_models[tier] = (model, tokenizer)
+    m2m_model, m2m_tokenizer = mt_models[max(mt_models, key=MT_TIERS.index)]
+    _set_model_state('mt', tier, 'ready', warmup_s=round(time.perf_counter() - started, 2))
+
+def load_asr_model():
+    for tier in ASR_TIERS:
+        load_asr_tier(tier)
+
+def load_translation_model():
+    for tier in MT_TIERS:
+        load_translation_tier(tier)
+
+def model_loading_plan():
+    """The smallest tier of each model first, so the server is usable early, then the larger ones."""
+    plan = [(load_asr_tier, ASR_TIERS[0]), (load_translation_tier, MT_TIERS[0])]
+    plan += [(load_asr_tier, tier) for tier in ASR_TIERS[1:]]
+    plan += [(load_translation_tier, tier) for tier in MT_TIERS[1:]]
+    return plan
+
+def load_models():
+    for load, tier in model_loading_plan():
+        load(tier)
+
+def start_model_loading(then=None):
+    """
+    Load and warm up the models on a background thread, announcing each tier
+    as it becomes ready, and call `then` once every tier is loaded.
+    """
+    def run():
+        for load, tier in model_loading_plan():
+            load(tier)
+            broadcast_model_status()
+        if then:
+            then()
+
+    thread = threading.Thread(target=run, name="model-loader", daemon=True)
+    thread.start()
+    return thread
+
+# ----- Audio processing -----
+TARGET_SAMPLE_RATE = 16000
+# A resample kernel has about (rate / g) * (16000 / g) taps, g = gcd(rate,
+# 16000): 76k for 44.1 kHz, but hundreds of millions for an odd rate such as
+# 44111 Hz, enough to exhaust memory. Decoded files may use any rate whose
+# kernel stays under MAX_RESAMPLE_KERNEL; rates that clients declare for raw
+# PCM must also be one of the common device rates.
+SUPPORTED_SAMPLE_RATES = (8000, 16000, 22050, 24000, 32000, 44100, 48000)
+MAX_RESAMPLE_KERNEL = 1_000_000
+
+@functools.lru_cache(maxsize=1)
+def check_ffmpeg():
+    """Check if ffmpeg is available in the system."""
+    return shutil.which("ffmpeg") is not None
+
+@functools.lru_cache(maxsize=16)
+def get_resampler(orig_freq, new_freq=TARGET_SAMPLE_RATE):
+    """Return a cached Resample transform so its kernel is only built once per rate pair."""
+    return torchaudio.transforms.Resample(orig_freq=orig_freq, new_freq=new_freq)
+
+def requested_sample_rate(data, default):
+    """The sample_rate an audio event declares, or None when it is not one of SUPPORTED_SAMPLE_RATES."""
+    try:
+        sample_rate = int(data.get('sample_rate') or default)
+    except (TypeError, ValueError):
+        return None
+    return sample_rate if sample_rate in SUPPORTED_SAMPLE_RATES else None
+
+def resample_kernel_size(sample_rate):
+    common = math.gcd(sample_rate, TARGET_SAMPLE_RATE)
+    return (sample_rate // common) * (TARGET_SAMPLE_RATE // common)
+
+def to_mono_16k(samples, sample_rate):
+    """Down-mix a (frames, channels) or (frames,) array to mono float32 at 16kHz."""
+    if sample_rate <= 0 or resample_kernel_size(sample_rate) > MAX_RESAMPLE_KERNEL:
+        raise ValueError(f"Unsupported sample rate: {sample_rate} Hz")
+    samples = np.asarray(samples, dtype=np.float32)
+    if samples.ndim > 1:
+        samples = samples.mean(axis=1)
+    if sample_rate != TARGET_SAMPLE_RATE:
+        with torch.no_grad():
+            samples = get_resampler(sample_rate)(torch.from_numpy(samples)).numpy()
+    return np.ascontiguousarray(samples, dtype=np.float32)
+
+def _decode_with_ffmpeg(audio_data):
+    """Pipe the container through ffmpeg and read raw float32 PCM back from stdout."""
+    ffmpeg_cmd = [
+        'ffmpeg',
+        '-hide_banner',
+        '-loglevel', 'error',
+        '-i', 'pipe:0',
+        '-f', 'f32le',                        # Raw little-endian float32
+        '-ac', '1',                           # Mono channel
+        '-ar', str(TARGET_SAMPLE_RATE),       # Sample rate 16kHz
+        'pipe:1'
+    ]
+    result = subprocess.run(
+        ffmpeg_cmd,
+        input=audio_data,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        timeout=10
+    )
+    if result.returncode != 0:
+        raise RuntimeError(result.stderr.decode(errors='replace').strip())
+    return np.frombuffer(result.stdout, dtype=np.float32)
+
+def _decode_with_pydub(audio_data):
+    audio = AudioSegment.from_file(io.BytesIO(bytes(audio_data)), format="webm")
+    audio = audio.set_channels(1).set_frame_rate(TARGET_SAMPLE_RATE)
+    scale = float(1 << (8 * audio.sample_width - 1))
+    return np.array(audio.get_array_of_samples(), dtype=np.float32) / scale
+
+def _decode_with_torchaudio(audio_data):
+    waveform, sample_rate = torchaudio.load(io.BytesIO(bytes(audio_data)))
+    return to_mono_16k(waveform.numpy().T, sample_rate)
+
+# Raw PCM frame formats accepted on the audio events (e.g. from an AudioWorklet)
+PCM_FORMATS = {
+    'pcm16': np.dtype('<i2'),
+    's16le': np.dtype('<i2'),
+    'f32': np.dtype('<f4'),
+    'f32le': np.dtype('<f4'),
+    'float32': np.dtype('<f4'),
+}
+
+def pcm_to_float32(buffer, fmt='pcm16'):
+    """View raw PCM bytes as float32 samples; float32 input is not copied."""
+    dtype = PCM_FORMATS[fmt]
+    view = memoryview(buffer).cast('B')
+    usable = len(view) - (len(view) % dtype.itemsize)
+    samples = np.frombuffer(view[:usable], dtype=dtype)
+    if dtype.kind == 'i':
+        return samples.astype(np.float32) / 32768.0
+    return samples
+
+def read_audio_payload(data, default_format='webm'):
+    """
+    Return (buffer, format) for an audio event payload.
+    Binary Socket.IO attachments arrive as bytes and are wrapped in a
+    memoryview; older clients send a base64 data URL string instead.
+    """
+    audio = data['audio']
+    if isinstance(audio, str):
+        audio = base64.b64decode(audio.split(',')[-1])
+    return memoryview(audio), str(data.get('format') or default_format).lower()
+
+def decode_audio_payload(buffer, fmt, sample_rate=TARGET_SAMPLE_RATE):
+    """Decode a payload buffer to 16kHz mono float32, either raw PCM or a WebM container."""
+    if fmt in PCM_FORMATS:
+        DECODE_PATHS.inc(path='pcm')
+        return to_mono_16k(pcm_to_float32(buffer, fmt), sample_rate), TARGET_SAMPLE_RATE
+    return process_webm_audio(buffer)
+
+def process_webm_audio(audio_data):
+    """
+    Decode WebM audio bytes to 16kHz mono float32 samples entirely in memory.
+    Uses ffmpeg over stdin/stdout pipes, then falls back to pydub and finally
+    to torchaudio reading from a BytesIO. No temporary files are written.
+    """
+    if check_ffmpeg():
+        try:
+            samples = _decode_with_ffmpeg(audio_data)
+            DECODE_PATHS.inc(path='ffmpeg')
+            return samples, TARGET_SAMPLE_RATE
+        except Exception as ffmpeg_error:
+            logger.warning(f"ffmpeg processing failed: {ffmpeg_error}")
+
+    if PYDUB_AVAILABLE:
+        try:
+            samples = _decode_with_pydub(audio_data)
+            DECODE_PATHS.inc(path='pydub')
+            return samples, TARGET_SAMPLE_RATE
+        except Exception as pydub_error:
+            logger.warning(f"pydub processing failed: {pydub_error}")
+
+    try:
+        samples = _decode_with_torchaudio(audio_data)
+        DECODE_PATHS.inc(path='torchaudio')
+        return samples, TARGET_SAMPLE_RATE
+    except Exception as torch_error:
+        logger.error(f"torchaudio direct load failed: {torch_error}")
+        ERRORS.inc(stage='decode', type=type(torch_error).__name__)
+        raise Exception(f"Unable to process WebM audio. Please install ffmpeg or ensure pydub is available. Error: {torch_error}")
+
+# ----- Inference scheduling -----
+ASR_BATCH_MAX_SIZE = int(os.getenv("ASR_BATCH_MAX_SIZE", "8"))
+ASR_BATCH_MAX_WAIT_MS = float(os.getenv("ASR_BATCH_MAX_WAIT_MS", "25"))
+
+# Decode, ASR and MT each run on their own threads with their own torch
+# intra-op thread budget and, optionally, their own cores (e.g. ASR_CPUS=0-5),
+# so utterance N can be translating while N+1 is transcribing and N+2 is
+# decoding, without every request thread using all cores. Both settings are
+# per thread: OpenMP keeps the thread count of each calling thread, and Linux
+# CPU affinity is per thread as well. By default one core goes to decode and
+# the rest are split 2:1 between ASR and MT.
+def _cpu_list(value):
+    """Parse a CPU list such as "0-3,8" into a set of core ids."""
+    cpus = set()
+    for part in value.split(","):
+        if part.strip():
+            first, _, last = part.strip().partition("-")
+            cpus.update(range(int(first), int(last or first) + 1))
+    return cpus
+
+_model_cores = max(1, (os.cpu_count() or 1) - 1)
+STAGE_TORCH_THREADS = {
+    'decode': int(os.getenv("DECODE_TORCH_THREADS", "1")),
+    'asr': int(os.getenv("ASR_TORCH_THREADS", str(max(1, _model_cores * 2 // 3)))),
+    'mt': int(os.getenv("MT_TORCH_THREADS", str(max(1, _model_cores - _model_cores * 2 // 3)))),
+}
+STAGE_CPUS = {stage: _cpu_list(os.getenv(f"{stage.upper()}_CPUS", "")) for stage in STAGE_TORCH_THREADS}
+DECODE_WORKERS = int(os.getenv("DECODE_WORKERS", "2"))
+MT_WORKERS = int(os.getenv("MT_WORKERS", "1"))
+
+def configure_stage_thread(stage):
+    """Give the calling thread its stage's torch thread budget and cores."""
+    # torch initialises each thread's count lazily from the last global value;
+    # trigger that first so it cannot overwrite the budget later
+    torch.get_num_threads()
+    # A preloading parent must stay single-threaded to fork its workers safely
+    torch.set_num_threads(1 if INFERENCE_PRELOAD else STAGE_TORCH_THREADS[stage])
+    cpus = STAGE_CPUS[stage]
+    if cpus and hasattr(os, "sched_setaffinity"):
+        try:
+            os.sched_setaffinity(0, cpus)
+        except OSError as e:
+            logger.warning(f"Could not pin the {stage} stage to CPUs {sorted(cpus)}: {e}")
+
+decode_stage = ThreadPoolExecutor(DECODE_WORKERS, thread_name_prefix="decode-stage",
+                                  initializer=configure_stage_thread, initargs=('decode',))
+mt_stage = ThreadPoolExecutor(MT_WORKERS, thread_name_prefix="mt-stage",
+                              initializer=configure_stage_thread, initargs=('mt',))
+
+def stage_stats():
+    return {stage: {'torch_threads': threads, 'cpus': sorted(STAGE_CPUS[stage]) or None}
+            for stage, threads in STAGE_TORCH_THREADS.items()}
+
+class MicroBatcher:
+    """
+    Collects inference requests from every socket into one queue and runs them
+    through `run_batch` together. A batch is dispatched once it holds
+    max_batch_size items or its oldest item has waited max_wait_ms. With an
+    executor the batch runs on that instead of on the batcher's own thread.
+    """
+
+    def __init__(self, name, run_batch, max_batch_size, max_wait_ms, concurrency=1, executor=None):
+        self.name = name
+        self.run_batch = run_batch
+        self.executor = executor
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_s = max(0.0, max_wait_ms) / 1000.0
+        self.concurrency = max(1, concurrency)
+        self.queue = queue.Queue()
+        self.threads = []
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+
+    def submit(self, item):
+        """Queue one item and return a Future for its result."""
+        future = Future()
+        self._ensure_started()
+        self.queue.put((item, future))
+        return future
+
+    def _ensure_started(self):
+        # Started lazily so importing the module never spawns threads. With
+        # concurrency > 1 several batches can be in flight, one per loop.
+        with self.lock:
+            self.threads = [thread for thread in self.threads if thread.is_alive()]
+            while len(self.threads) < self.concurrency:
+                thread = threading.Thread(target=self._loop, name=f"{self.name}-batcher-{len(self.threads)}", daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def _collect(self):
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + self.max_wait_s
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        # Drop requests whose caller already gave up on them
+        return [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+
+    def _loop(self):
+        while True:
+            batch = self._collect()
+            if not batch:
+                continue
+            items = [item for item, _ in batch]
+            try:
+                results = self.executor.submit(self.run_batch, items).result() if self.executor else self.run_batch(items)
+            except Exception as e:
+                logger.error(f"{self.name} batch of {len(items)} failed: {e}")
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            self.batches += 1
+            self.items += len(items)
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
+
+    def stats(self):
+        return {
+            'queue_depth': self.queue.qsize(),
+            'batches': self.batches,
+            'items': self.items,
+            'avg_batch_size': round(self.items / self.batches, 2) if self.batches else 0.0,
+        }
+
+# ----- Model worker pool -----
+# With INFERENCE_WORKERS > 0 the models live in separate worker processes
+# instead of this one, so Flask/Socket.IO request handling and inference no
+# longer compete for the GIL and a hung inference cannot stall the server.
+# Audio is handed over through shared memory; results come back as futures.
+INFERENCE_WORKERS = int(os.getenv("INFERENCE_WORKERS", "0"))
+INFERENCE_JOB_TIMEOUT_S = float(os.getenv("INFERENCE_JOB_TIMEOUT_S", "120"))
+INFERENCE_START_METHOD = os.getenv("INFERENCE_START_METHOD", "spawn")
+
+# INFERENCE_PRELOAD=1 loads the models once in this process and only then
+# forks the workers, so they all map the same physical copy of the read-only
+# weights (copy-on-write) instead of each loading a private one. CPU only:
+# a process that has initialised CUDA cannot be forked.
+INFERENCE_PRELOAD = os.getenv("INFERENCE_PRELOAD", "0") == "1"
+if INFERENCE_PRELOAD and INFERENCE_WORKERS <= 0:
+    logger.warning("INFERENCE_PRELOAD needs INFERENCE_WORKERS > 0; loading the models in-process instead")
+    INFERENCE_PRELOAD = False
+if INFERENCE_PRELOAD and device != "cpu":
+    logger.warning("INFERENCE_PRELOAD only applies on CPU; each worker loads its own models")
+    INFERENCE_PRELOAD = False
+if INFERENCE_PRELOAD and INFERENCE_START_METHOD != "fork":
+    logger.info("INFERENCE_PRELOAD forks the model workers; ignoring INFERENCE_START_METHOD")
+    INFERENCE_START_METHOD = "fork"
+# libgomp is not fork-safe: a process forked after its parent ran an OpenMP
+# parallel region hangs in its own first one. With preloading the parent
+# therefore stays single-threaded, and each worker takes its share of the cores.
+INFERENCE_WORKER_THREADS = int(os.getenv("INFERENCE_WORKER_THREADS", "0")) or max(1, (os.cpu_count() or 1) // max(1, INFERENCE_WORKERS))
+if INFERENCE_PRELOAD:
+    torch.set_num_threads(1)
+
+def process_memory_mb(pid):
+    """
+    Resident memory of a process from /proc/<pid>/smaps_rollup, split into
+    pages shared with other processes and pages private to it. PSS charges
+    each shared page to its sharers in equal parts. None off Linux.
+    """
+    fields = {}
+    try:
+        with open(f"/proc/{pid}/smaps_rollup") as f:
+            for line in f:
+                name, _, value = line.partition(':')
+                if value.strip().endswith('kB'):
+                    fields[name] = int(value.split()[0]) / 1024
+    except (OSError, ValueError):
+        return None
+    return {
+        'rss_mb': round(fields.get('Rss', 0.0), 1),
+        'pss_mb': round(fields.get('Pss', 0.0), 1),
+        'shared_mb': round(fields.get('Shared_Clean', 0.0) + fields.get('Shared_Dirty', 0.0), 1),
+        'private_mb': round(fields.get('Private_Clean', 0.0) + fields.get('Private_Dirty', 0.0), 1),
+    }
+
+def _run_asr_job(payload):
+    """Worker side of an ASR batch: view the arrays in shared memory and run the pipeline."""
+    name, lengths, tier, languages = payload
+    # Workers share the parent's resource tracker, so the parent's unlink() clears the registration
+    shm = shared_memory.SharedMemory(name=name)
+    try:
+        flat = np.ndarray((sum(lengths),), dtype=np.float32, buffer=shm.buf)
+        offsets = np.cumsum([0] + lengths)
+        batch = [(flat[start:end], language, identify)
+                 for start, end, (language, identify) in zip(offsets[:-1], offsets[1:], languages)]
+        results = _run_asr_batch_local(batch, tier)
+        del flat, batch
+        return results
+    finally:
+        try:
+            shm.close()
+        except BufferError:
+            pass
+
+def _model_worker_main(index, inbox, results, cancel):
+    """
+    Entry point of an inference worker process: load the models, then serve
+    jobs. The parent sets `cancel` to a running job's id to cut it short.
+    """
+    global model_state_listener
+    pid = os.getpid()
+    model_state_listener = lambda states: results.put((index, pid, None, 'state', states))
+    if INFERENCE_PRELOAD:
+        torch.set_num_threads(INFERENCE_WORKER_THREADS)
+    if not (asr_models and mt_models):
+        load_models()  # Otherwise inherited from the preloading parent
+    results.put((index, pid, None, 'ready', copy.deepcopy(model_states)))
+    while True:
+        job_id, kind, payload = inbox.get()
+        try:
+            if kind == 'asr':
+                value = _run_asr_job(payload)
+            elif kind == 'translate':
+                rows, source_lang, tier, stream = payload
+                on_token = None
+                if stream:
+                    # Streamed text goes back as progress messages ahead of the result
+                    on_token = lambda row, delta: results.put((index, pid, job_id, 'progress', (row, delta)))
+                value = _generate_rows(rows, source_lang, tier, on_token, lambda: cancel.value == job_id)
+            else:
+                raise ValueError(f"Unknown job kind: {kind}")
+            results.put((index, pid, job_id, 'ok', value))
+        except Exception as e:
+            results.put((index, pid, job_id, 'error', str(e)))
+
+class PoolFuture(Future):
+    """Future of a pool job; cancelling one that is already running asks its worker to stop early."""
+
+    def __init__(self, pool, job_id):
+        super().__init__()
+        self.pool = pool
+        self.job_id = job_id
+
+    def cancel(self):
+        self.pool.interrupt(self.job_id)
+        return super().cancel()
+
+class ModelWorkerPool:
+    """
+    Fixed-size pool of inference processes that own the models. Jobs are
+    dispatched one at a time to idle workers. A monitor thread restarts
+    workers that die, and kills and restarts workers whose current job
+    exceeds the per-job timeout; the affected job's future fails. Jobs may
+    report progress (streamed tokens) before their result.
+    """
+
+    def __init__(self, size, job_timeout_s, start_method):
+        self.size = size
+        self.job_timeout_s = job_timeout_s
+        self.context = multiprocessing.get_context(start_method)
+        self.results = None
+        self.workers = []
+        self.pending = collections.deque()
+        self.jobs = {}  # job_id -> (future, cleanup)
+        self.progress = {}  # job_id -> on_progress callback
+        self.job_ids = itertools.count()
+        self.condition = threading.Condition()
+        self.started = False
+
+    def start(self):
+        with self.condition:
+            if self.started:
+                return
+            self.started = True
+            # Workers must inherit this process's resource tracker; one of their
+            # own would unlink our shared-memory blocks when the worker exits
+            resource_tracker.ensure_running()
+            if self.context.get_start_method() == "fork":
+                # Keep the collector from writing to, and so un-sharing, the
+                # pages of objects the forked workers inherit
+                gc.collect()
+                gc.freeze()
+            self.results = self.context.Queue()
+            self.workers = [self._spawn(index) for index in range(self.size)]
+        for target in (self._dispatch_loop, self._result_loop, self._monitor_loop):
+            threading.Thread(target=target, name=f"model-pool{target.__name__}", daemon=True).start()
+        logger.info(f"Started {self.size} model worker process(es) ({self.context.get_start_method()})")
+
+    def _spawn(self, index, restarts=0):
+        inbox = self.context.Queue()
+        cancel = self.context.Value('q', -1)
+        process = self.context.Process(
+            target=_model_worker_main,
+            args=(index, inbox, self.results, cancel),
+            name=f"model-worker-{index}",
+            daemon=True
+        )
+        process.start()
+        return {'process': process, 'inbox': inbox, 'cancel': cancel, 'ready': False, 'models': {}, 'job': None,
+                'deadline': None, 'restarts': restarts, 'jobs_done': 0}
+
+    def ready(self, model):
+        """True once any live worker has loaded the given model ('asr' or 'mt')."""
+        return self.model_status(model)['state'] == 'ready'
+
+    def model_status(self, model):
+        """The most advanced state of a model across live workers."""
+        states = []
+        with self.condition:
+            for worker in self.workers:
+                if not worker['process'].is_alive():
+                    continue
+                status = worker['models'].get(model, {'state': 'pending'})
+                if status['state'] == 'ready' and not worker['ready']:
+                    # Loaded, but the worker takes no jobs until its other model is up too
+                    status = {**status, 'state': 'warming'}
+                states.append(status)
+        return max(states, key=lambda status: MODEL_STATES.index(status['state']), default={'state': 'pending'})
+
+    def submit(self, kind, payload, cleanup=None, on_progress=None):
+        with self.condition:
+            job_id = next(self.job_ids)
+            future = PoolFuture(self, job_id)
+            self.jobs[job_id] = (future, cleanup)
+            if on_progress:
+                self.progress[job_id] = on_progress
+            self.pending.append((job_id, kind, payload))
+            self.condition.notify_all()
+        return future
+
+    def interrupt(self, job_id):
+        """Ask the worker running a job to stop it; jobs still queued are dropped by their cancelled future."""
+        with self.condition:
+            for worker in self.workers:
+                if worker['job'] == job_id:
+                    worker['cancel'].value = job_id
+
+    def _finish(self, job_id, result=None, error=None):
+        with self.condition:
+            future, cleanup = self.jobs.pop(job_id, (None, None))
+            self.progress.pop(job_id, None)
+        if cleanup:
+            try:
+                cleanup()
+            except Exception as e:
+                logger.warning(f"Cleanup for inference job {job_id} failed: {e}")
+        if future is None or future.done():
+            return
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def _idle_worker(self):
+        for worker in self.workers:
+            if worker['ready'] and worker['job'] is None and worker['process'].is_alive():
+                return worker
+        return None
+
+    def _dispatch_loop(self):
+        while True:
+            with self.condition:
+                worker = self._idle_worker()
+                while not (self.pending and worker):
+                    self.condition.wait(timeout=1.0)
+                    worker = self._idle_worker()
+                job_id, kind, payload = self.pending.popleft()
+                future, _ = self.jobs[job_id]
+                if future.set_running_or_notify_cancel():
+                    worker['job'] = job_id
+                    worker['deadline'] = time.monotonic() + self.job_timeout_s
+                    worker['inbox'].put((job_id, kind, payload))
+                    continue
+            self._finish(job_id)
+
+    def _result_loop(self):
+        while True:
+            try:
+                index, pid, job_id, status, value = self.results.get(timeout=1.0)
+            except queue.Empty:
+                continue
+            if status == 'progress':
+                on_progress = self.progress.get(job_id)
+                try:
+                    if on_progress:
+                        on_progress(*value)
+                except Exception as e:
+                    logger.warning(f"Progress callback for inference job {job_id} failed: {e}")
+                continue
+            with self.condition:
+                worker = self.workers[index]
+                if worker['process'].pid == pid:
+                    if status == 'state':
+                        worker['models'] = value
+                    elif status == 'ready':
+                        worker['ready'] = True
+                        worker['models'] = value
+                        logger.info(f"Model worker {index} ready (pid={pid})")
+                    elif worker['job'] == job_id:
+                        worker['job'] = None
+                        worker['deadline'] = None
+                        worker['jobs_done'] += 1
+                self.condition.notify_all()
+            if status == 'ready':
+                broadcast_model_status()
+                if all(worker['ready'] for worker in self.workers):
+                    self.log_memory_report()
+            elif status == 'ok':
+                self._finish(job_id, result=value)
+            elif status == 'error':
+                self._finish(job_id, error=RuntimeError(value))
+
+    def _monitor_loop(self):
+        while True:
+            time.sleep(1.0)
+            failed = []
+            with self.condition:
+                for index, worker in enumerate(self.workers):
+                    process = worker['process']
+                    if worker['job'] is not None and time.monotonic() > worker['deadline']:
+                        logger.error(f"Model worker {index} exceeded {self.job_timeout_s}s on job {worker['job']}; restarting")
+                        process.kill()
+                        failed.append((worker['job'], TimeoutError(f"Inference job exceeded {self.job_timeout_s}s")))
+                    elif not process.is_alive():
+                        logger.error(f"Model worker {index} died (exit code {process.exitcode}); restarting")
+                        if worker['job'] is not None:
+                            failed.append((worker['job'], RuntimeError("Model worker crashed")))
+                    else:
+                        continue
+                    process.join(timeout=5)
+                    self.workers[index] = self._spawn(index, worker['restarts'] + 1)
+                self.condition.notify_all()
+            for job_id, error in failed:
+                self._finish(job_id, error=error)
+
+    def memory_report(self):
+        """Shared and private resident memory of this process and of every worker."""
+        with self.condition:
+            pids = [worker['process'].pid for worker in self.workers]
+        return {'parent': process_memory_mb(os.getpid()), 'workers': [process_memory_mb(pid) for pid in pids]}
+
+    def log_memory_report(self):
+        report = self.memory_report()
+        if report['parent'] is None:
+            return
+        for index, memory in enumerate(report['workers']):
+            if memory:
+                logger.info(f"Model worker {index} memory: rss={memory['rss_mb']}MB shared={memory['shared_mb']}MB "
+                            f"private={memory['private_mb']}MB pss={memory['pss_mb']}MB")
+        workers = [memory for memory in report['workers'] if memory]
+        total_pss = report['parent']['pss_mb'] + sum(memory['pss_mb'] for memory in workers)
+        logger.info(f"Model pool memory: {len(workers)} worker(s), parent rss={report['parent']['rss_mb']}MB, "
+                    f"total pss={total_pss:.1f}MB (preload={'on' if INFERENCE_PRELOAD else 'off'})")
+
+    def shutdown(self):
+        with self.condition:
+            for worker in self.workers:
+                if worker['process'].is_alive():
+                    worker['process'].terminate()
+
+    def stats(self):
+        with self.condition:
+            return {
+                'pending_jobs': len(self.pending),
+                'workers': [{
+                    'pid': worker['process'].pid,
+                    'alive': worker['process'].is_alive(),
+                    'ready': worker['ready'],
+                    'busy': worker['job'] is not None,
+                    'jobs_done': worker['jobs_done'],
+                    'restarts': worker['restarts'],
+                    'memory': process_memory_mb(worker['process'].pid),
+                } for worker in self.workers],
+                'parent_memory': process_memory_mb(os.getpid()),
+                'preload': INFERENCE_PRELOAD,
+            }
+
+model_pool = ModelWorkerPool(INFERENCE_WORKERS, INFERENCE_JOB_TIMEOUT_S, INFERENCE_START_METHOD) if INFERENCE_WORKERS > 0 else None
+if model_pool:
+    atexit.register(model_pool.shutdown)
+
+def asr_available():
+    return model_pool.ready('asr') if model_pool else asr_pipeline is not None
+
+def translation_available():
+    return model_pool.ready('mt') if model_pool else (m2m_model is not None and m2m_tokenizer is not None)
+
+def model_status():
+    """Per-model state and load/warmup timings, from the worker pool when there is one."""
+    if model_pool and model_pool.started:
+        return {model: model_pool.model_status(model) for model in ('asr', 'mt')}
+    return copy.deepcopy(model_states)
+
+def wait_for_model(model, timeout=MODEL_WAIT_TIMEOUT_S):
+    """Block until a model is ready; False if it failed to load or the wait timed out."""
+    available = asr_available if model == 'asr' else translation_available
+    deadline = time.monotonic() + timeout
+    while not available():
+        if model_status()[model]['state'] == 'failed' or time.monotonic() >= deadline:
+            return False
+        time.sleep(0.25)
+    return True
+
+def available_languages_payload():
+    return {'languages': AVAILABLE_LANGUAGES, 'asr_ready': asr_available(), 'models': model_status()}
+
+def broadcast_model_status():
+    """Tell every connected client about model readiness (e.g. once loading finishes)."""
+    socketio.emit('available_languages', available_languages_payload())
+
+# ----- Tier routing -----
+# Requests run on the largest loaded tier until the server gets busy: when
+# the requests in flight or the recent p95 latency of the current tier cross
+# their thresholds the router steps down one tier, and it steps back up once
+# both are below TIER_RECOVERY_RATIO of them. Switches are at least
+# TIER_SWITCH_COOLDOWN_S apart so the tier does not flap. A client may also
+# send latency_budget_ms, which caps the tier at the largest one whose recent
+# p95 fits the budget for the rest of its session.
+TIER_MAX_INFLIGHT = int(os.getenv("TIER_MAX_INFLIGHT", "8"))
+TIER_ASR_P95_MS = float(os.getenv("TIER_ASR_P95_MS", "3000"))
+TIER_MT_P95_MS = float(os.getenv("TIER_MT_P95_MS", "1500"))
+TIER_RECOVERY_RATIO = float(os.getenv("TIER_RECOVERY_RATIO", "0.5"))
+TIER_SWITCH_COOLDOWN_S = float(os.getenv("TIER_SWITCH_COOLDOWN_S", "10"))
+TIER_LATENCY_WINDOW_S = float(os.getenv("TIER_LATENCY_WINDOW_S", "60"))
+
+latency_budgets = {}  # sid -> latency budget in ms
+
+def tier_ready(model, tier):
+    if model_pool:
+        status = model_pool.model_status(model)
+        return status['state'] == 'ready' and status.get('tiers', {}).get(tier, {}).get('state') == 'ready'
+    return tier in (asr_models if model == 'asr' else mt_models)
+
+class TierRouter:
+    """Chooses the model tier for each request from current load and the caller's latency budget."""
+
+    def __init__(self, model, tiers, p95_threshold_ms):
+        self.model = model
+        self.tiers = tiers
+        self.p95_threshold_ms = p95_threshold_ms
+        self.latencies = {tier: collections.deque(maxlen=500) for tier in tiers}
+        self.inflight = 0
+        self.downgrade = 0  # Steps below the largest loaded tier
+        self.last_switch = 0.0
+        self.switches = 0
+        self.lock = threading.Lock()
+
+    def _p95(self, tier, since=0.0):
+        cutoff = max(time.monotonic() - TIER_LATENCY_WINDOW_S, since)
+        samples = sorted(ms for at, ms in self.latencies[tier] if at >= cutoff)
+        if not samples:
+            return None
+        return samples[min(len(samples) - 1, int(0.95 * len(samples)))]
+
+    def _adapt(self, loaded):
+        now = time.monotonic()
+        if now - self.last_switch < TIER_SWITCH_COOLDOWN_S:
+            return
+        self.downgrade = min(self.downgrade, len(loaded) - 1)
+        current = loaded[len(loaded) - 1 - self.downgrade]
+        # Only latencies seen since the last switch describe the current load
+        p95 = self._p95(current, since=self.last_switch) or 0.0
+        if self.inflight >= TIER_MAX_INFLIGHT or p95 >= self.p95_threshold_ms:
+            if self.downgrade == len(loaded) - 1:
+                return
+            self.downgrade += 1
+        elif self.inflight <= TIER_MAX_INFLIGHT * TIER_RECOVERY_RATIO and p95 <= self.p95_threshold_ms * TIER_RECOVERY_RATIO:
+            if self.downgrade == 0:
+                return
+            self.downgrade -= 1
+        else:
+            return
+        self.last_switch = now
+        self.switches += 1
+        logger.info(f"{self.model} tier {current} -> {loaded[len(loaded) - 1 - self.downgrade]} "
+                    f"(in flight={self.inflight}, p95={p95:.0f}ms)")
+
+    def select(self, budget_ms=None):
+        """The tier for the next request, or None while no tier is loaded."""
+        loaded = [tier for tier in self.tiers if tier_ready(self.model, tier)]
+        if not loaded:
+            return None
+        with self.lock:
+            self._adapt(loaded)
+            index = len(loaded) - 1 - min(self.downgrade, len(loaded) - 1)
+            if budget_ms:
+                while index > 0 and (self._p95(loaded[index]) or 0.0) > budget_ms:
+                    index -= 1
+            return loaded[index]
+
+    @contextlib.contextmanager
+    def track(self, tier):
+        """Count a request as in flight on a tier and record its latency."""
+        with self.lock:
+            self.inflight += 1
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self.lock:
+                self.inflight -= 1
+                self.latencies[tier].append((time.monotonic(), elapsed_ms))
+
+    def stats(self):
+        loaded = [tier for tier in self.tiers if tier_ready(self.model, tier)]
+        with self.lock:
+            p95s = {tier: self._p95(tier) for tier in self.tiers}
+            return {
+                'loaded': loaded,
+                'current': loaded[len(loaded) - 1 - min(self.downgrade, len(loaded) - 1)] if loaded else None,
+                'inflight': self.inflight,
+                'switches': self.switches,
+                'p95_ms': {tier: round(p95, 1) for tier, p95 in p95s.items() if p95 is not None},
+            }
+
+asr_router = TierRouter('asr', ASR_TIERS, TIER_ASR_P95_MS)
+mt_router = TierRouter('mt', MT_TIERS, TIER_MT_P95_MS)
+
+def session_latency_budget(data):
+    """The latency budget of the calling socket, updated when the request carries latency_budget_ms."""
+    if data.get('latency_budget_ms') is not None:
+        budget_ms = float(data['latency_budget_ms'])
+        latency_budgets[request.sid] = budget_ms if budget_ms > 0 else None
+    return latency_budgets.get(request.sid)
+
+# ----- Voice activity detection -----
+# Frame energy + zero-crossing-rate VAD run before Whisper so silence,
+# breathing and background noise never reach the model. All thresholds can be
+# tuned per deployment.
+VAD_ENABLED = os.getenv("VAD_ENABLED", "1") == "1"
+VAD_FRAME_MS = float(os.getenv("VAD_FRAME_MS", "20"))
+VAD_ENERGY_THRESHOLD_DB = float(os.getenv("VAD_ENERGY_THRESHOLD_DB", "-45"))  # Absolute floor in dBFS
+VAD_NOISE_MARGIN_DB = float(os.getenv("VAD_NOISE_MARGIN_DB", "10"))  # Above the estimated noise floor
+VAD_ZCR_THRESHOLD = float(os.getenv("VAD_ZCR_THRESHOLD", "0.25"))  # Unvoiced consonants
+VAD_ZCR_MARGIN_DB = float(os.getenv("VAD_ZCR_MARGIN_DB", "8"))
+VAD_HANGOVER_MS = float(os.getenv("VAD_HANGOVER_MS", "300"))
+VAD_MIN_SPEECH_MS = float(os.getenv("VAD_MIN_SPEECH_MS", "150"))
+VAD_MAX_PAUSE_S = float(os.getenv("VAD_MAX_PAUSE_S", "1.0"))
+
+vad_stats = {'utterances': 0, 'silent_utterances': 0, 'seconds_in': 0.0, 'seconds_saved': 0.0}
+vad_stats_lock = threading.Lock()
+
+def detect_speech(samples, sample_rate=TARGET_SAMPLE_RATE):
+    """
+    Return a list of (start, end) sample ranges containing speech.
+    A frame is speech if its energy clears both the absolute threshold and
+    the noise floor (10th percentile) plus a margin, or if it is slightly
+    quieter but has a high zero-crossing rate. Speech frames are dilated by
+    the hangover, pauses shorter than VAD_MAX_PAUSE_S are bridged and blips
+    shorter than VAD_MIN_SPEECH_MS are dropped.
+    """
+    frame = max(1, int(sample_rate * VAD_FRAME_MS / 1000))
+    count = len(samples) // frame
+    if count == 0:
+        return []
+    frames = np.asarray(samples[:count * frame], dtype=np.float32).reshape(count, frame)
+    energy_db = 10 * np.log10(np.mean(frames * frames, axis=1) + 1e-10)
+    signs = np.signbit(frames)
+    zcr = np.count_nonzero(signs[:, 1:] != signs[:, :-1], axis=1) / max(frame - 1, 1)
+
+    threshold = max(VAD_ENERGY_THRESHOLD_DB, np.percentile(energy_db, 10) + VAD_NOISE_MARGIN_DB)
+    speech = (energy_db > threshold) | ((energy_db > threshold - VAD_ZCR_MARGIN_DB) & (zcr > VAD_ZCR_THRESHOLD))
+    if not speech.any():
+        return []
+
+    hangover = int(VAD_HANGOVER_MS / VAD_FRAME_MS)
+    if hangover:
+        speech = np.convolve(speech.astype(np.int8), np.ones(2 * hangover + 1, dtype=np.int8), mode='same') > 0
+
+    edges = np.diff(np.concatenate(([0], speech.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+
+    # Bridge short pauses; only pauses of at least VAD_MAX_PAUSE_S split the utterance
+    split = (starts[1:] - ends[:-1]) >= int(VAD_MAX_PAUSE_S * 1000 / VAD_FRAME_MS)
+    starts = np.concatenate((starts[:1], starts[1:][split]))
+    ends = np.concatenate((ends[:-1][split], ends[-1:]))
+
+    # Dilation adds 2 * hangover frames to every segment, so discount it
+    keep = (ends - starts) >= 2 * hangover + int(VAD_MIN_SPEECH_MS / VAD_FRAME_MS)
+    segments = []
+    for start, end in zip(starts[keep], ends[keep]):
+        end_sample = len(samples) if end == count else end * frame
+        segments.append((int(start * frame), int(end_sample)))
+    return segments
+
+def split_speech(samples, sample_rate=TARGET_SAMPLE_RATE):
+    """Trim silence and split on long pauses; returns a list of speech arrays (empty if silent)."""
+    if not VAD_ENABLED:
+        return [samples]
+    segments = detect_speech(samples, sample_rate)
+    total_s = len(samples) / sample_rate
+    kept_s = sum(end - start for start, end in segments) / sample_rate
+    with vad_stats_lock:
+        vad_stats['utterances'] += 1
+        vad_stats['silent_utterances'] += 0 if segments else 1
+        vad_stats['seconds_in'] += total_s
+        vad_stats['seconds_saved'] += total_s - kept_s
+    logger.info(f"VAD kept {kept_s:.2f}s of {total_s:.2f}s in {len(segments)} segment(s)")
+    return [samples[start:end] for start, end in segments]
+
+# ----- Language identification -----
+# Whisper's language ID runs on the first LANGUAGE_ID_SECONDS of a session's
+# audio and the result is cached per socket; later utterances decode with that
+# language forced, which skips the detection step inside generate() and keeps
+# the language from flip-flopping between utterances. The cached language is
+# re-identified every LANGUAGE_RECHECK_S, and clients can pin it instead.
+LANGUAGE_ID_SECONDS = float(os.getenv("LANGUAGE_ID_SECONDS", "5"))
+LANGUAGE_ID_MIN_CONFIDENCE = float(os.getenv("LANGUAGE_ID_MIN_CONFIDENCE", "0.6"))
+LANGUAGE_RECHECK_S = float(os.getenv("LANGUAGE_RECHECK_S", "120"))
+# Whisper knows 17 languages M2M100 cannot translate from (as, bo, eu, te,
+# yue, ...); identification only ever picks one the translation model knows.
+MT_SOURCE_LANGUAGES = frozenset(FAIRSEQ_LANGUAGE_CODES["m2m100"])
+
+LANGUAGE_DECODES = CounterMetric('stt_language_decodes_total', 'Utterances by how their language was chosen', ('source',))
+
+def identify_languages(asr, clips):
+    """
+    Most likely language of each clip and its probability, from the first
+    decoder step over Whisper's language tokens. Only languages in
+    MT_SOURCE_LANGUAGES are picked, but the probability is over all of them,
+    so speech in another language comes out uncertain and the session keeps
+    its cached language. Pipelines without language tokens (English-only
+    checkpoints) give (None, None).
+    """
+    model = getattr(asr, "model", None)
+    lang_to_id = getattr(getattr(model, "generation_config", None), "lang_to_id", None)
+    if not lang_to_id:
+        return [(None, None)] * len(clips)
+    clips = [samples[:int(LANGUAGE_ID_SECONDS * TARGET_SAMPLE_RATE)] for samples in clips]
+    features = asr.feature_extractor(clips, sampling_rate=TARGET_SAMPLE_RATE, return_tensors="pt").input_features
+    features = features.to(model.device, dtype=next(model.parameters()).dtype)
+    codes = [token.strip("<|>") for token in lang_to_id]
+    supported = [index for index, code in enumerate(codes) if code in MT_SOURCE_LANGUAGES]
+    token_ids = torch.tensor(list(lang_to_id.values()), device=model.device)
+    start = torch.full((len(clips), 1), model.generation_config.decoder_start_token_id, dtype=torch.long, device=model.device)
+    with torch.inference_mode():
+        logits = model(input_features=features, decoder_input_ids=start).logits[:, -1]
+    probabilities = logits[:, token_ids].float().softmax(dim=-1)
+    best = [supported[index] for index in probabilities[:, supported].argmax(dim=-1).tolist()]
+    return [(codes[index], round(probabilities[row, index].item(), 3)) for row, index in enumerate(best)]
+
+class SessionLanguage:
+    """
+    Source language of one socket: pinned by the client, or identified from
+    its audio. Identifications below LANGUAGE_ID_MIN_CONFIDENCE never replace
+    a cached language; without one, the next utterance is identified again.
+    """
+
+    def __init__(self):
+        self.pinned = None
+        self.language = None
+        self.confidence = None
+        self.identified_at = None
+        self.identifications = 0
+        self.switches = 0
+        self.lock = threading.Lock()
+
+    def pin(self, language):
+        """Force a language for every utterance, or go back to identification with None"""
+        with self.lock:
+            if language:
+                self.language, self.confidence = language, 1.0
+            elif self.pinned:
+                self.language = self.confidence = None
+            self.pinned = language
+
+    def request(self):
+        """The (language, identify) pair the next utterance decodes with"""
+        with self.lock:
+            if self.pinned:
+                return self.pinned, False
+            due = self.language is None or time.monotonic() - self.identified_at >= LANGUAGE_RECHECK_S
+            return self.language, due
+
+    def observe(self, language, probability):
+        """Record an utterance's language; probability is None when it was forced rather than identified"""
+        with self.lock:
+            if probability is None or self.pinned:
+                LANGUAGE_DECODES.inc(source='pinned' if self.pinned else 'cached')
+                return
+            self.identifications += 1
+            if probability < LANGUAGE_ID_MIN_CONFIDENCE:
+                LANGUAGE_DECODES.inc(source='uncertain')
+                if self.language is not None:
+                    self.identified_at = time.monotonic()
+                return
+            if self.language is not None and language != self.language:
+                self.switches += 1
+                logger.info(f"Session language changed {self.language} -> {language} (p={probability})")
+            LANGUAGE_DECODES.inc(source='identified')
+            self.language, self.confidence = language, probability
+            self.identified_at = time.monotonic()
+
+    def stats(self):
+        with self.lock:
+            return {'language': self.language, 'confidence': self.confidence, 'pinned': self.pinned is not None}
+
+session_languages = {}
+
+def session_language(data):
+    """
+    The SessionLanguage of the calling socket. A source_lang in the request
+    pins it, and source_lang "auto" goes back to identification.
+    """
+    spoken = session_languages.setdefault(request.sid, SessionLanguage())
+    pinned = data.get('source_lang')
+    if pinned == 'auto':
+        spoken.pin(None)
+    elif pinned in AVAILABLE_LANGUAGES.values():
+        spoken.pin(pinned)
+    elif pinned:
+        logger.warning(f"Ignoring unknown source_lang: {pinned}")
+    return spoken
+
+# ----- ASR -----
+def _run_asr_batch_local(batch, tier=None):
+    """
+    Run an ASR tier over (16kHz float32 array, language, identify) items.
+    Items flagged for identification get a language-ID pass first; each
+    language then decodes as one pipeline call with that language forced.
+    """
+    asr = asr_models.get(tier) or asr_pipeline
+    languages = [language for _, language, _ in batch]
+    probabilities = [None] * len(batch)
+    identify = [index for index, (_, _, flag) in enumerate(batch) if flag]
+    if identify:
+        for index, (code, probability) in zip(identify, identify_languages(asr, [batch[index][0] for index in identify])):
+            probabilities[index] = probability
+            # An uncertain identification only wins when there is no language to fall back on
+            if code and (languages[index] is None or probability >= LANGUAGE_ID_MIN_CONFIDENCE):
+                languages[index] = code
+    groups = collections.defaultdict(list)
+    for index, language in enumerate(languages):
+        groups[language].append(index)
+    results = [None] * len(batch)
+    for language, indices in groups.items():
+        inputs = [{"raw": batch[index][0], "sampling_rate": TARGET_SAMPLE_RATE} for index in indices]
+        options = {"generate_kwargs": {"language": language, "task": "transcribe"}} if language else {}
+        for index, result in zip(indices, asr(inputs, batch_size=len(inputs), **options)):
+            results[index] = {**result, "language": language or result.get("language"), "language_probability": probabilities[index]}
+    return results
+
+def _run_asr_batch(batch, tier=None):
+    if model_pool is None:
+        return _run_asr_batch_local(batch, tier)
+    # Copy the batch into one shared-memory block; the worker views it in place
+    lengths = [len(samples) for samples, _, _ in batch]
+    shm = shared_memory.SharedMemory(create=True, size=max(1, sum(lengths) * 4))
+    flat = np.ndarray((sum(lengths),), dtype=np.float32, buffer=shm.buf)
+    offset = 0
+    for samples, _, _ in batch:
+        flat[offset:offset + len(samples)] = samples
+        offset += len(samples)
+    del flat
+
+    def release():
+        shm.close()
+        shm.unlink()
+
+    languages = [(language, identify) for _, language, identify in batch]
+    return model_pool.submit('asr', (shm.name, lengths, tier, languages), cleanup=release).result()
+
+# Requests are only batched together with others on the same tier, but every
+# tier's batches run on the one ASR stage, so loading several tiers does not
+# multiply the ASR thread budget
+asr_stage = ThreadPoolExecutor(max(1, INFERENCE_WORKERS), thread_name_prefix="asr-stage",
+                               initializer=configure_stage_thread, initargs=('asr',))
+asr_batchers = {
+    tier: MicroBatcher(f"asr-{tier}", functools.partial(_run_asr_batch, tier=tier),
+                       ASR_BATCH_MAX_SIZE, ASR_BATCH_MAX_WAIT_MS, concurrency=max(1, INFERENCE_WORKERS), executor=asr_stage)
+    for tier in ASR_TIERS
+}
+
+def transcribe_segments(segments, sample_rate=16000, tier=None, job=None, spoken=None):
+    """
+    Transcribe speech segments of one utterance together and join their text,
+    which is empty when nothing was said. ASR failures raise.
+    Cancelling the admission job drops segments still waiting for a batch.
+    With a SessionLanguage the utterance decodes with the session's language
+    forced, and any identification it needed is recorded back into it.
+    """
+    if not asr_available():
+        raise RuntimeError("ASR model not available")
+    try:
+        segments = [segment for segment in segments if len(segment) > 0]
+        if not segments:
+            return "", "en"
+        if sample_rate != TARGET_SAMPLE_RATE:
+            segments = [to_mono_16k(segment, sample_rate) for segment in segments]
+        # Requests from all sockets share batched forward passes; the
+        # pipeline accepts the ndarray directly, so nothing touches the disk
+        tier = tier or asr_router.select() or ASR_TIERS[-1]
+        language, identify = spoken.request() if spoken else (None, True)
+        with asr_router.track(tier):
+            futures = [asr_batchers[tier].submit((np.asarray(segment, dtype=np.float32), language, identify))
+                       for segment in segments]
+            if job:
+                job.attach(futures)
+            results = [future.result() for future in futures]
+        transcribed_text = " ".join(
+            result.get("text", "").strip() for result in results if result.get("text", "").strip()
+        )
+        # The utterance takes the language of its most confidently identified segment
+        best = max(results, key=lambda result: result.get("language_probability") or 0.0)
+        if spoken:
+            spoken.observe(best.get("language"), best.get("language_probability"))
+        detected_lang = best.get("language") or "en"
+        return transcribed_text, detected_lang
+    except CancelledError:
+        # The job was superseded or its socket left; admission already counts it as cancelled
+        logger.debug("Transcription cancelled with its job")
+        return "", "en"
+    except Exception as e:
+        logger.error(f"Transcription error: {e}")
+        ERRORS.inc(stage='asr', type=type(e).__name__)
+        raise
+
+def transcribe_audio(audio_data, sample_rate=16000, tier=None, spoken=None):
+    return transcribe_segments([audio_data], sample_rate, tier, spoken=spoken)
+
+# ----- Caching -----
+class LRUCache:
+    """
+    Thread-safe LRU cache bounded by entry count and approximate memory, with
+    optional TTL expiry and JSON persistence. Keys must be tuples of strings
+    and values JSON-serialisable so the cache can be saved across restarts.
+    """
+
+    def __init__(self, name, max_entries, max_bytes, ttl_s=0, path=None):
+        self.name = name
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self.path = path
+        self.entries = OrderedDict()  # key -> (value, expires_at, size)
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @staticmethod
+    def _size_of(key, value):
+        return len(json.dumps([key, value], ensure_ascii=False).encode('utf-8')) + 64
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at, size = entry
+            if expires_at and expires_at < time.time():
+                del self.entries[key]
+                self.bytes -= size
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        size = self._size_of(key, value)
+        if self.max_entries <= 0 or size > self.max_bytes:
+            return
+        expires_at = time.time() + self.ttl_s if self.ttl_s else 0
+        with self.lock:
+            previous = self.entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[2]
+            self.entries[key] = (value, expires_at, size)
+            self.bytes += size
+            while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+                _, (_, _, evicted_size) = self.entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.bytes = 0
+
+    def load(self):
+        if not self.path or not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                records = json.load(f)
+            now = time.time()
+            for key, value, expires_at in records:
+                if not expires_at or expires_at > now:
+                    self.put(tuple(key), value)
+            logger.info(f"Loaded {len(self.entries)} entries into {self.name} cache from {self.path}")
+        except Exception as e:
+            logger.warning(f"Could not load {self.name} cache from {self.path}: {e}")
+
+    def save(self):
+        if not self.path:
+            return
+        try:
+            with self.lock:
+                records = [[list(key), value, expires_at] for key, (value, expires_at, _) in self.entries.items()]
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(records, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+            logger.info(f"Saved {len(records)} {self.name} cache entries to {self.path}")
+        except Exception as e:
+            logger.warning(f"Could not save {self.name} cache to {self.path}: {e}")
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self.entries),
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'expirations': self.expirations,
+            'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+translation_cache = LRUCache(
+    "translation",
+    max_entries=int(os.getenv("TRANSLATION_CACHE_SIZE", "10000")),
+    max_bytes=int(float(os.getenv("TRANSLATION_CACHE_MAX_MB", "32")) * 1024 * 1024),
+    ttl_s=float(os.getenv("TRANSLATION_CACHE_TTL_S", "86400")),
+    path=os.getenv("TRANSLATION_CACHE_PATH") or None,
+)
+translation_cache.load()
+atexit.register(translation_cache.save)
+
+def translation_cache_key(text, source_lang, target_lang_code, tier="", decoding=""):
+    """
+    Normalise Unicode form and whitespace so trivially different utterances
+    share an entry. Streamed translations are decoded greedily and are cached
+    apart (decoding="greedy") from the model's default beam search output.
+    """
+    normalized = " ".join(unicodedata.normalize("NFC", text).split())
+    return (normalized, source_lang or "", target_lang_code, tier or "", decoding)
+
+# Finished audio_chunk results, keyed on a hash of the audio payload exactly
+# as received plus everything else that shapes the result. Retries after a
+# reconnect, double stops and replayed kiosk prompts resend identical bytes
+# and are answered without decoding or inference; an identical request that
+# arrives while the first is still running waits for that one instead.
+RESULT_WAIT_TIMEOUT_S = float(os.getenv("RESULT_WAIT_TIMEOUT_S", "120"))
+result_cache = LRUCache(
+    "result",
+    max_entries=int(os.getenv("RESULT_CACHE_SIZE", "1000")),
+    max_bytes=int(float(os.getenv("RESULT_CACHE_MAX_MB", "8")) * 1024 * 1024),
+    ttl_s=float(os.getenv("RESULT_CACHE_TTL_S", "3600")),
+)
+
+def result_cache_key(audio_data, audio_format, data, source_lang):
+    digest = hashlib.blake2b(audio_data, digest_size=16).hexdigest()
+    target_langs = ",".join(str(code) for code in data.get('target_langs') or [])
+    decoding = "greedy" if data.get('stream_translation') else ""
+    return (digest, audio_format, str(data.get('sample_rate') or ""), data.get('target_lang', ''), target_langs, source_lang or "auto", decoding)
+
+def cacheable_result(result):
+    return bool(result and result.get('success') and result.get('original')
+                and not result.get('translated', '').startswith("Translation error"))
+
+class InflightRequests:
+    """
+    Futures of results still being computed. The first request for a key owns
+    it and resolves the future when done (with None if it produced nothing
+    cacheable); identical requests meanwhile wait on that future.
+    """
+
+    def __init__(self):
+        self.futures = {}
+        self.lock = threading.Lock()
+        self.joined = 0
+
+    def claim(self, key):
+        """Return (future, owner); owner is True when the caller has to compute the result."""
+        with self.lock:
+            future = self.futures.get(key)
+            if future is not None:
+                self.joined += 1
+                return future, False
+            future = self.futures[key] = Future()
+            return future, True
+
+    def resolve(self, key, result):
+        with self.lock:
+            future = self.futures.pop(key, None)
+        if future is not None:
+            future.set_result(result)
+
+    def stats(self):
+        with self.lock:
+            return {'inflight': len(self.futures), 'joined': self.joined}
+
+inflight_results = InflightRequests()
+
+# Results answered from the cache are saved to the user's history too, but a
+# client retrying the same bytes (reconnects, double sends) within
+# HISTORY_REPLAY_WINDOW_S of the last save doesn't get a second entry.
+HISTORY_REPLAY_WINDOW_S = float(os.getenv("HISTORY_REPLAY_WINDOW_S", "30"))
+history_saves = {}  # (user, result key) -> monotonic time of the last history save
+history_saves_lock = threading.Lock()
+
+def claim_history_save(user, key):
+    """Record a history save of a keyed result; False if the user saved it within the replay window."""
+    now = time.monotonic()
+    with history_saves_lock:
+        for stale in [entry for entry, saved in history_saves.items() if now - saved > HISTORY_REPLAY_WINDOW_S]:
+            del history_saves[stale]
+        if (user, key) in history_saves:
+            return False
+        history_saves[(user, key)] = now
+        return True
+
+# ----- Translation -----
+TRANSLATION_BATCH_SIZE = int(os.getenv("TRANSLATION_BATCH_SIZE", "8"))
+TRANSLATION_MAX_SENTENCE_CHARS = int(os.getenv("TRANSLATION_MAX_SENTENCE_CHARS", "400"))
+
+# Sentence ends for the scripts in AVAILABLE_LANGUAGES: Latin/Cyrillic/Tamil
+# punctuation, Devanagari/Bengali danda, Arabic/Persian question mark and full
+# stop, and CJK full-width marks (which are not followed by a space). Thai has
+# no sentence punctuation and is split on whitespace by length instead.
+_SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?…।॥؟۔])\s+|(?<=[。！？])')
+UNSPACED_LANGUAGES = {"zh", "ja", "th"}
+
+# The tokenizer's src_lang is shared state, so setting it and encoding must not interleave
+m2m_tokenizer_lock = threading.Lock()
+
+# Clause breaks (CJK and Latin commas and semicolons) to cut an over-long unspaced run at
+_CLAUSE_BREAKS = "、，,；;"
+
+def _split_unspaced(piece):
+    """Cut an unpunctuated run with no spaces into chunks under the limit, after a comma where there is one."""
+    chunks = []
+    while len(piece) > TRANSLATION_MAX_SENTENCE_CHARS:
+        window = piece[:TRANSLATION_MAX_SENTENCE_CHARS]
+        cut = max(window.rfind(mark) for mark in _CLAUSE_BREAKS) + 1
+        if cut <= TRANSLATION_MAX_SENTENCE_CHARS // 2:
+            cut = TRANSLATION_MAX_SENTENCE_CHARS  # No break in the second half: hard cut
+        chunks.append(piece[:cut])
+        piece = piece[cut:]
+    if piece:
+        chunks.append(piece)
+    return chunks
+
+def split_sentences(text, lang=None):
+    """Split a transcript into sentences, keeping each under TRANSLATION_MAX_SENTENCE_CHARS."""
+    text = text.strip()
+    if not text:
+        return []
+    pieces = [text] if lang == "th" else [p.strip() for p in _SENTENCE_BOUNDARY.split(text) if p.strip()]
+    sentences = []
+    for piece in pieces:
+        if len(piece) <= TRANSLATION_MAX_SENTENCE_CHARS:
+            sentences.append(piece)
+            continue
+        if " " not in piece:
+            sentences.extend(_split_unspaced(piece))
+            continue
+        # Unpunctuated run-on: pack whole words up to the length limit
+        current = ""
+        for word in piece.split():
+            if current and len(current) + 1 + len(word) > TRANSLATION_MAX_SENTENCE_CHARS:
+                sentences.append(current)
+                current = word
+            else:
+                current = f"{current} {word}" if current else word
+        if current:
+            sentences.append(current)
+    return sentences
+
+def join_sentences(sentences, lang):
+    return ("" if lang in UNSPACED_LANGUAGES else " ").join(s for s in sentences if s)
+
+def _encode_source(tokenizer, texts, source_lang):
+    with m2m_tokenizer_lock:
+        tokenizer.src_lang = source_lang
+        return tokenizer(texts, return_tensors="pt", padding=True).to(device)
+
+class TranslationStreamer(BaseStreamer):
+    """
+    Incremental detokenizer for one batched generate call. put() receives
+    every row's newest token; on_token(row, delta) fires with the text a row
+    gained, a word at a time (a character at a time for unspaced scripts),
+    so a word still being spelled out by subword pieces is never sent half
+    done. end() flushes whatever is left.
+    """
+
+    def __init__(self, tokenizer, targets, on_token, eos_token_id):
+        self.tokenizer = tokenizer
+        self.targets = targets
+        self.on_token = on_token
+        self.eos_token_id = eos_token_id
+        self.tokens = [[] for _ in targets]
+        self.sent = [0] * len(targets)
+        self.finished = [False] * len(targets)
+        self.primed = False
+
+    def put(self, value):
+        if not self.primed:
+            self.primed = True  # The first call carries the decoder prompt, not generated tokens
+            return
+        for row, token in enumerate(value.reshape(-1).tolist()):
+            if self.finished[row]:
+                continue
+            if token == self.eos_token_id:
+                self.finished[row] = True
+                self._flush(row, final=True)
+                continue
+            self.tokens[row].append(token)
+            self._flush(row)
+
+    def end(self):
+        for row in range(len(self.targets)):
+            if not self.finished[row]:
+                self.finished[row] = True
+                self._flush(row, final=True)
+
+    def _flush(self, row, final=False):
+        text = self.tokenizer.batch_decode([self.tokens[row]], skip_special_tokens=True)[0]
+        if not final:
+            if text.endswith("\ufffd"):
+                return  # A multi-byte character split across tokens
+            if self.targets[row] not in UNSPACED_LANGUAGES:
+                text = text[:text.rfind(" ") + 1]
+        if len(text) > self.sent[row]:
+            self.on_token(row, text[self.sent[row]:])
+            self.sent[row] = len(text)
+
+class StopWhen(StoppingCriteria):
+    """Ends generation for the whole batch once should_stop() turns true, e.g. on disconnect."""
+
+    def __init__(self, should_stop):
+        self.should_stop = should_stop
+
+    def __call__(self, input_ids, scores, **kwargs):
+        return torch.full((input_ids.shape[0],), bool(self.should_stop()), dtype=torch.bool, device=input_ids.device)
+
+def translate_rows(rows, source_lang, on_row=None, tier=None, on_token=None, job=None):
+    """
+    Translate a list of (sentence, target_lang) rows and return the
+    translations in the same order. Cached rows are answered immediately; the
+    rest are sorted by length and run in padded batches of
+    TRANSLATION_BATCH_SIZE. Within a batch each distinct sentence is encoded
+    once and its encoder output is shared by every target that needs it; each
+    row's decoder is primed with its own target-language BOS token.
+    on_row(index, translation) is called as soon as a row's batch finishes;
+    on_token(index, delta) streams each row's text while it is generated.
+    Cancelling the admission job stops generation after the current step
+    and leaves the rows not finished by then as None.
+    """
+    tier = tier or mt_router.select() or MT_TIERS[-1]
+    decoding = "greedy" if on_token else ""
+    results = [None] * len(rows)
+    pending = []
+    for index, (sentence, target) in enumerate(rows):
+        cached = translation_cache.get(translation_cache_key(sentence, source_lang, target, tier, decoding))
+        if cached is None:
+            pending.append(index)
+            continue
+        results[index] = cached
+        if on_token:
+            on_token(index, cached)
+        if on_row:
+            on_row(index, cached)
+
+    pending.sort(key=lambda index: len(rows[index][0]))
+    if not pending:
+        return results
+    batches = [pending[start:start + TRANSLATION_BATCH_SIZE] for start in range(0, len(pending), TRANSLATION_BATCH_SIZE)]
+    # Streamed tokens arrive per row of their batch; map them back to rows of the whole request
+    batch_token = lambda batch: (lambda row, delta: on_token(batch[row], delta)) if on_token else None
+    should_stop = (lambda: job.cancelled) if job else None
+    with mt_router.track(tier):
+        if model_pool:
+            # Every batch is submitted up front so idle workers translate them in parallel
+            futures = [model_pool.submit('translate', ([rows[index] for index in batch], source_lang, tier, on_token is not None),
+                                         on_progress=batch_token(batch)) for batch in batches]
+        else:
+            futures = [mt_stage.submit(_generate_rows, [rows[index] for index in batch], source_lang, tier, batch_token(batch), should_stop)
+                       for batch in batches]
+        if job:
+            job.attach(futures)
+        for batch, future in zip(batches, futures):
+            try:
+                translated = future.result()
+            except CancelledError:
+                break
+            if job and job.cancelled:
+                break  # Cut short mid-sentence: nothing from here on is worth caching
+            for index, translated_text in zip(batch, translated):
+                sentence, target = rows[index]
+                translation_cache.put(translation_cache_key(sentence, source_lang, target, tier, decoding), translated_text)
+                results[index] = translated_text
+                if on_row:
+                    on_row(index, translated_text)
+    return results
+
+def _generate_rows(batch_rows, source_lang, tier=None, on_token=None, should_stop=None):
+    """
+    One padded generate call over (sentence, target_lang) rows; each distinct
+    sentence is encoded once. With on_token(row, delta) the rows are decoded
+    greedily (streamers do not work with beam search) and their text is
+    streamed as it is generated; should_stop() ends generation early.
+    """
+    model, tokenizer = mt_models.get(tier) or (m2m_model, m2m_tokenizer)
+    sentences = list(dict.fromkeys(sentence for sentence, _ in batch_rows))
+    encoded = _encode_source(tokenizer, sentences, source_lang)
+    with torch.no_grad():
+        encoder_outputs = model.get_encoder()(**encoded)
+    row_to_sentence = torch.tensor([sentences.index(sentence) for sentence, _ in batch_rows], device=device)
+    encoder_outputs.last_hidden_state = encoder_outputs.last_hidden_state.index_select(0, row_to_sentence)
+    decoder_start = model.config.decoder_start_token_id
+    decoder_input_ids = torch.tensor(
+        [[decoder_start, tokenizer.get_lang_id(target)] for _, target in batch_rows],
+        device=device
+    )
+    options = {}
+    if on_token:
+        eos_token_id = model.generation_config.eos_token_id
+        options['streamer'] = TranslationStreamer(tokenizer, [target for _, target in batch_rows], on_token,
+                                                  eos_token_id if eos_token_id is not None else model.config.eos_token_id)
+        options['num_beams'] = 1
+    if should_stop:
+        options['stopping_criteria'] = StoppingCriteriaList([StopWhen(should_stop)])
+    generated_tokens = model.generate(
+        encoder_outputs=encoder_outputs,
+        attention_mask=encoded['attention_mask'].index_select(0, row_to_sentence),
+        decoder_input_ids=decoder_input_ids,
+        **options
+    )
+    return tokenizer.batch_decode(generated_tokens, skip_special_tokens=True)
+
+def translate_text(text, source_lang, target_lang_code, on_sentence=None, tier=None, on_delta=None, job=None):
+    """
+    Translate a transcript sentence by sentence in length-sorted batches.
+    on_sentence(target_lang, index, original, translated) fires per sentence
+    as soon as its batch is done; on_delta(target_lang, index, original,
+    delta) streams each sentence's translation as it is generated.
+    """
+    if not text or not translation_available():
+        return ""
+    try:
+        sentences = split_sentences(text, source_lang)
+        callback = token_callback = None
+        if on_sentence:
+            callback = lambda index, translated: on_sentence(target_lang_code, index, sentences[index], translated)
+        if on_delta:
+            token_callback = lambda index, delta: on_delta(target_lang_code, index, sentences[index], delta)
+        translated = translate_rows([(sentence, target_lang_code) for sentence in sentences], source_lang, callback, tier,
+                                    token_callback, job)
+        return join_sentences(translated, target_lang_code)
+    except Exception as e:
+        logger.error(f"Translation error ({source_lang}->{target_lang_code}): {e}")
+        ERRORS.inc(stage='translation', type=type(e).__name__)
+        return f"Translation error: {str(e)}"
+
+def translate_text_multi(text, source_lang, target_lang_codes, on_sentence=None, tier=None, on_delta=None, job=None):
+    """
+    Translate one text into several languages. Every (sentence, target) pair
+    goes through translate_rows together, so each sentence is encoded once
+    and all targets are decoded in the same batched generate calls.
+    Returns a dict of target code -> translation.
+    """
+    targets = list(dict.fromkeys(code for code in target_lang_codes if code))
+    if not targets:
+        return {}
+    if not text or not translation_available():
+        return {code: "" for code in targets}
+    try:
+        sentences = split_sentences(text, source_lang)
+        rows = [(sentence, code) for code in targets for sentence in sentences]
+        callback = token_callback = None
+        if on_sentence:
+            callback = lambda index, translated: on_sentence(
+                rows[index][1], index % len(sentences), rows[index][0], translated
+            )
+        if on_delta:
+            token_callback = lambda index, delta: on_delta(rows[index][1], index % len(sentences), rows[index][0], delta)
+        translated = translate_rows(rows, source_lang, callback, tier, token_callback, job)
+        return {
+            code: join_sentences(translated[i * len(sentences):(i + 1) * len(sentences)], code)
+            for i, code in enumerate(targets)
+        }
+    except Exception as e:
+        logger.error(f"Translation error ({source_lang}->{','.join(targets)}): {e}")
+        ERRORS.inc(stage='translation', type=type(e).__name__)
+        return {code: f"Translation error: {str(e)}" for code in targets}
 
-# Initialize OAuth
-oauth = OAuth(app)
-google = None
+# ----- Streaming ASR -----
+# Clients stream raw mono PCM frames (PCM16 by default, or float32) with
+# stream_start / stream_audio / stream_end. Whisper is re-run every
+# STREAM_STEP_S seconds on a window of at most STREAM_WINDOW_S seconds, so the
+# cost of each pass stays bounded no matter how long the speaker talks.
+# Each stream_audio event runs on its own thread, so frames are numbered (by
+# the client's `seq`, 0, 1, 2, ..., or else by arrival) and appended in that
+# order once decoded. stream_end waits for frames still being decoded; a
+# client that sends `seq` should also send the frame count as `frames`.
+# Audio beyond STREAM_MAX_BACKLOG_S that the passes have not caught up with is
+# dropped, oldest first, to stay real-time.
+STREAM_SAMPLE_RATE = 16000
+STREAM_WINDOW_S = float(os.getenv("STREAM_WINDOW_S", "10"))
+STREAM_STEP_S = float(os.getenv("STREAM_STEP_S", "1.0"))
+STREAM_OVERLAP_S = float(os.getenv("STREAM_OVERLAP_S", "1.0"))
+STREAM_MAX_BACKLOG_S = float(os.getenv("STREAM_MAX_BACKLOG_S", "20"))
+STREAM_END_TIMEOUT_S = float(os.getenv("STREAM_END_TIMEOUT_S", "10"))
+# Frames held back waiting for a missing earlier one before giving up on it
+STREAM_MAX_REORDER = 64
+# Committed words kept to match against the overlap a new window repeats
+STREAM_OVERLAP_UNITS = 12
 
-# Only configure Google OAuth if both values are provided and not empty
-if GOOGLE_CLIENT_ID and GOOGLE_CLIENT_SECRET and len(GOOGLE_CLIENT_ID) > 0 and len(GOOGLE_CLIENT_SECRET) > 0:
-    google = oauth.register(
-        name="google",
-        client_id=GOOGLE_CLIENT_ID,
-        client_secret=GOOGLE_CLIENT_SECRET,
-        authorize_url="https://accounts.google.com/o/oauth2/auth",
-        access_token_url="https://oauth2.googleapis.com/token",
-        api_base_url="https://www.googleapis.com/oauth2/v2/",
-        client_kwargs={"scope": "email profile"},
-    )
-    logger.info("Google OAuth client registered successfully")
-else:
-    logger.info("Google OAuth not configured. Set GOOGLE_CLIENT_ID and GOOGLE_CLIENT_SECRET env vars to enable Google login.")
+stream_sessions = {}
+stream_sessions_lock = threading.Lock()
 
-# ----- Model setup -----
-device = "cuda:0" if torch.cuda.is_available() else "cpu"
-torch_dtype = torch.float16 if torch.cuda.is_available() else torch.float32
+class StreamSession:
+    """Rolling audio buffer and transcript state for one streaming socket."""
 
-asr_pipeline = None
-m2m_model = None
-m2m_tokenizer = None
+    def __init__(self, target_lang, spoken, latency_budget_ms=None):
+        self.target_lang = target_lang
+        self.spoken = spoken
+        self.latency_budget_ms = latency_budget_ms
+        self.detected_lang = None
+        self.samples = np.zeros(0, dtype=np.float32)
+        self.offset = 0  # Stream position of samples[0], which moves as audio is dropped
+        self.pending_samples = 0
+        self.next_seq = 0  # Next frame to append
+        self.received = 0  # Frames numbered so far
+        self.in_flight = 0
+        self.early_frames = {}  # seq -> samples decoded before an earlier frame
+        self.dropped_samples = 0
+        self.committed_units = []  # Only the tail that a new window can repeat
+        self.previous_units = []
+        self.segment_count = 0
+        self.last_tiers = {'asr': None, 'mt': None}
+        # The whole transcript is only joined once, for the stream_end result and history
+        self.originals = []
+        self.translations = []
+        self.timings = collections.Counter()  # Stage -> total ms over the stream
+        self.lock = threading.Lock()
+        self.frames_ready = threading.Condition(self.lock)
+        self.decode_lock = threading.Lock()
 
-def load_models():
-    global asr_pipeline, m2m_model, m2m_tokenizer
+    def reserve(self, seq=None):
+        """Number an incoming frame: the client's seq, or its arrival order."""
+        with self.lock:
+            if seq is None:
+                seq = self.received
+            self.received = max(self.received, seq + 1)
+            self.in_flight += 1
+            return seq
+
+    def append(self, seq, samples):
+        """Add a decoded (or rejected, empty) frame once every frame before it is in."""
+        with self.lock:
+            self.in_flight -= 1
+            if seq >= self.next_seq:
+                self.early_frames[seq] = samples
+            if len(self.early_frames) > STREAM_MAX_REORDER and self.next_seq not in self.early_frames:
+                logger.warning(f"Stream frame {self.next_seq} never arrived; skipping to {min(self.early_frames)}")
+                self.next_seq = min(self.early_frames)
+            chunks = []
+            while self.next_seq in self.early_frames:
+                chunks.append(self.early_frames.pop(self.next_seq))
+                self.next_seq += 1
+            if chunks:
+                self.samples = np.concatenate([self.samples] + chunks)
+                self.pending_samples += sum(len(chunk) for chunk in chunks)
+                excess = len(self.samples) - int(STREAM_MAX_BACKLOG_S * STREAM_SAMPLE_RATE)
+                if excess > 0:
+                    self.samples = self.samples[excess:]
+                    self.offset += excess
+                    self.pending_samples = min(self.pending_samples, len(self.samples))
+                    self.dropped_samples += excess
+            self.frames_ready.notify_all()
+
+    def wait_for_frames(self, count=None, timeout=STREAM_END_TIMEOUT_S):
+        """Block until `count` frames (default: all numbered so far) are appended; False on timeout."""
+        with self.lock:
+            return self.frames_ready.wait_for(
+                lambda: self.next_seq >= (self.received if count is None else count) and not self.in_flight,
+                timeout=timeout,
+            )
+
+    @property
+    def committed_text(self):
+        return " ".join(text for text in self.originals if text)
+
+    @property
+    def translated_text(self):
+        return " ".join(text for text in self.translations if text)
+
+def _split_units(text):
+    """Split a hypothesis into comparable units: words, or characters for unspaced scripts."""
+    text = text.strip()
+    if not text:
+        return [], " "
+    if " " in text:
+        return text.split(), " "
+    return list(text), ""
+
+def _normalize_unit(unit):
+    return ''.join(ch for ch in unit.lower() if ch.isalnum())
+
+def _strip_overlap(committed_units, new_units, max_overlap=STREAM_OVERLAP_UNITS):
+    """Drop leading units of a new window that repeat the tail of the committed transcript."""
+    limit = min(len(committed_units), len(new_units), max_overlap)
+    tail = [_normalize_unit(u) for u in committed_units[-limit:]] if limit else []
+    head = [_normalize_unit(u) for u in new_units[:limit]]
+    for size in range(limit, 0, -1):
+        if tail[-size:] == head[:size]:
+            return new_units[size:]
+    return new_units
+
+def _common_prefix(previous_units, current_units):
+    stable = []
+    for prev, curr in zip(previous_units, current_units):
+        if _normalize_unit(prev) != _normalize_unit(curr):
+            break
+        stable.append(curr)
+    return stable
+
+def stream_step(stream, final=False):
+    """
+    Run one sliding-window pass over a stream's buffer.
+    Words that agree between two consecutive passes are reported as stable;
+    once the window is full (or the stream ends) its hypothesis is committed
+    as a final segment and only STREAM_OVERLAP_S of audio is kept as context.
+    A buffer longer than the window is worked off one window per pass.
+    """
+    window_samples = int(STREAM_WINDOW_S * STREAM_SAMPLE_RATE)
+    overlap_samples = int(STREAM_OVERLAP_S * STREAM_SAMPLE_RATE)
+
+    with stream.lock:
+        window = stream.samples[:window_samples]
+        window_offset = stream.offset
+        stream.pending_samples = len(stream.samples) - len(window)
+    if len(window) == 0:
+        return
+
+    # Windows that are entirely silence skip the Whisper pass
+    text, detected_lang = "", stream.detected_lang or "en"
+    asr_tier = asr_router.select(stream.latency_budget_ms)
+    timings = {}
+    if not VAD_ENABLED or detect_speech(window, STREAM_SAMPLE_RATE):
+        try:
+            with timed_stage('asr', timings):
+                text, detected_lang = transcribe_audio(window, STREAM_SAMPLE_RATE, asr_tier, stream.spoken)
+        except Exception:
+            # Already logged and counted; this window just commits nothing (e.g. while a worker restarts)
+            text = ""
+    units, separator = _split_units(text)
+    units = _strip_overlap(stream.committed_units, units)
+
+    if final or len(window) >= window_samples:
+        segment_text = separator.join(units)
+        if segment_text:
+            stream.detected_lang = detected_lang
+        translated_text = ""
+        tiers = {'asr': asr_tier, 'mt': None}
+        if stream.target_lang and segment_text:
+            tiers['mt'] = mt_router.select(stream.latency_budget_ms)
+            with timed_stage('translation', timings):
+                translated_text = translate_text(segment_text, detected_lang, stream.target_lang, tier=tiers['mt'])
+        stream.committed_units = (stream.committed_units + units)[-STREAM_OVERLAP_UNITS:]
+        stream.previous_units = []
+        segment = {'index': stream.segment_count, 'original': segment_text, 'translated': translated_text, 'tiers': tiers}
+        stream.segment_count += 1
+        stream.last_tiers = tiers
+        stream.originals.append(segment_text)
+        stream.translations.append(translated_text)
+        with stream.lock:
+            # Audio appended (or dropped) during the pass shifts the buffer; cut at the same stream position
+            keep_from = len(stream.samples) if final else max(window_offset + len(window) - overlap_samples - stream.offset, 0)
+            stream.samples = stream.samples[keep_from:]
+            stream.offset += keep_from
+        emit('transcript_segment', {**segment, 'language': stream.target_lang, 'final': True})
+    else:
+        stable = _common_prefix(stream.previous_units, units)
+        stream.previous_units = units
+        # Committed text already went out in transcript_segment events; only the open segment is sent
+        emit('partial_transcript', {
+            'stable': separator.join(stable),
+            'unstable': separator.join(units[len(stable):]),
+            'segment_index': stream.segment_count,
+            'tiers': {'asr': asr_tier},
+        })
+    stream.timings.update(timings)
+
+# ----- Translation history storage -----
+# History pages are read newest first through the (user_id, timestamp, _id)
+# index, using a keyset cursor instead of skip/limit so every page costs the
+# same however far back the user scrolls. _id breaks ties between entries
+# saved with the same timestamp. A text index over original/translated backs
+# the search endpoint; it is language-neutral because entries mix scripts.
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
+HISTORY_MAX_PAGE_SIZE = int(os.getenv("HISTORY_MAX_PAGE_SIZE", "200"))
+
+def ensure_history_indexes():
     try:
-        logger.info("Loading ASR model (Whisper-medium)...")
-        asr_pipeline = pipeline(
-            "automatic-speech-recognition",
-            model="openai/whisper-medium",
-            device=device,
-            torch_dtype=torch_dtype,
-            chunk_length_s=20
+        history = mongo.db.translation_history
+        history.create_index(
+            [('user_id', pymongo.ASCENDING), ('timestamp', pymongo.DESCENDING), ('_id', pymongo.DESCENDING)],
+            name='user_timestamp'
         )
-        logger.info("ASR model loaded successfully")
-        logger.info(f"ASR pipeline device: {asr_pipeline.model.device}")
-
+        history.create_index(
+            [('user_id', pymongo.ASCENDING), ('original', pymongo.TEXT), ('translated', pymongo.TEXT)],
+            name='user_text', default_language='none', language_override='text_language'
+        )
+        logger.info("Translation history indexes ensured")
     except Exception as e:
-        logger.error(f"Failed to load ASR model: {e}")
-        asr_pipeline = None
+        logger.error(f"Could not create translation history indexes: {e}")
 
+def history_page_size(value):
     try:
-        logger.info("Loading M2M100 multilingual translation model...")
-        m2m_model = M2M100ForConditionalGeneration.from_pretrained("facebook/m2m100_418M").to(device)
-        m2m_tokenizer = M2M100Tokenizer.from_pretrained("facebook/m2m100_418M")
-        logger.info("M2M100 model loaded successfully")
-        logger.info(f"Translation model device: {next(m2m_model.parameters()).device}")
-    except Exception as e:
-        logger.error(f"Failed to load M2M100 model: {e}")
-        m2m_model = None
-        m2m_tokenizer = None
+        return min(max(int(value), 1), HISTORY_MAX_PAGE_SIZE)
+    except (TypeError, ValueError):
+        return HISTORY_PAGE_SIZE
 
-# ----- Audio processing -----
-def check_ffmpeg():
-    """Check if ffmpeg is available in the system."""
-    return shutil.which("ffmpeg") is not None
+def encode_history_cursor(entry):
+    raw = json.dumps([entry['timestamp'], str(entry['_id'])]).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
 
-def process_webm_audio(audio_data):
+def history_before_filter(before):
     """
-    Process WebM audio data and convert to 16kHz mono WAV format.
-    Uses ffmpeg to convert WebM to WAV, then torchaudio to process.
-    Falls back to pydub if ffmpeg is not available.
+    Mongo filter for entries older than `before`: a cursor from a previous
+    page, or a plain ISO timestamp to jump to a date.
     """
-    tmp_name = None
-    wav_name = None
     try:
-        # Write audio data to temporary file
-        with tempfile.NamedTemporaryFile(suffix='.webm', delete=False) as tmp:
-            tmp_name = tmp.name
-            tmp.write(audio_data)
-            tmp.flush()
-        
-        # Method 1: Use ffmpeg to convert WebM to WAV, then torchaudio
-        if check_ffmpeg():
-            try:
-                wav_name = tmp_name.replace('.webm', '.wav')
-                # Convert WebM to WAV using ffmpeg
-                ffmpeg_cmd = [
-                    'ffmpeg',
-                    '-i', tmp_name,
-                    '-ar', '16000',  # Sample rate 16kHz
-                    '-ac', '1',      # Mono channel
-                    '-f', 'wav',     # WAV format
-                    '-y',            # Overwrite output file
-                    wav_name
-                ]
-                
-                # Run ffmpeg silently
-                result = subprocess.run(
-                    ffmpeg_cmd,
-                    stdout=subprocess.PIPE,
-                    stderr=subprocess.PIPE,
-                    timeout=10
-                )
-                
-                if result.returncode == 0 and os.path.exists(wav_name):
-                    # Load with torchaudio
-                    waveform, sample_rate = torchaudio.load(wav_name)
-                    # Ensure mono
-                    if waveform.shape[0] > 1:
-                        waveform = waveform.mean(dim=0, keepdim=True)
-                    else:
-                        waveform = waveform.squeeze(0).unsqueeze(0)
-                    
-                    # Convert to numpy
-                    samples = waveform.squeeze(0).numpy().astype(np.float32)
-                    
-                    # Clean up
-                    try:
-                        os.unlink(tmp_name)
-                        os.unlink(wav_name)
-                    except:
-                        pass
-                    
-                    return samples, 16000
-                else:
-                    logger.warning(f"ffmpeg conversion failed: {result.stderr.decode()}")
-            except Exception as ffmpeg_error:
-                logger.warning(f"ffmpeg processing failed: {ffmpeg_error}")
-        
-        # Method 2: Try pydub if available
-        if PYDUB_AVAILABLE:
-            try:
-                audio = AudioSegment.from_file(tmp_name, format="webm")
-                audio = audio.set_channels(1).set_frame_rate(16000)
-                if not wav_name:
-                    wav_name = tmp_name.replace('.webm', '.wav')
-                audio.export(wav_name, format="wav")
-                samples, sample_rate = sf.read(wav_name, dtype='float32')
-                
-                # Clean up
-                try:
-                    os.unlink(tmp_name)
-                    if wav_name and os.path.exists(wav_name):
-                        os.unlink(wav_name)
-                except:
-                    pass
-                
-                return samples, sample_rate
-            except Exception as pydub_error:
-                logger.warning(f"pydub processing failed: {pydub_error}")
-        
-        # Method 3: Try direct torchaudio load (may work if backend supports WebM)
-        try:
-            waveform, sample_rate = torchaudio.load(tmp_name)
-            if waveform.shape[0] > 1:
-                waveform = waveform.mean(dim=0, keepdim=True)
-            else:
-                waveform = waveform.squeeze(0).unsqueeze(0)
-            
-            if sample_rate != 16000:
-                resampler = torchaudio.transforms.Resample(orig_freq=sample_rate, new_freq=16000)
-                waveform = resampler(waveform)
-            
-            samples = waveform.squeeze(0).numpy().astype(np.float32)
-            
-            try:
-                os.unlink(tmp_name)
-            except:
-                pass
-            
-            return samples, 16000
-        except Exception as torch_error:
-            logger.error(f"torchaudio direct load failed: {torch_error}")
-            raise Exception(f"Unable to process WebM audio. Please install ffmpeg or ensure pydub is available. Error: {torch_error}")
-                
-    except Exception as e:
-        logger.error(f"Audio processing error: {e}")
-        if tmp_name:
-            try:
-                os.unlink(tmp_name)
-            except:
-                pass
-        if wav_name and os.path.exists(wav_name):
+        timestamp, entry_id = json.loads(base64.urlsafe_b64decode(before + '=' * (-len(before) % 4)))
+        entry_id = ObjectId(entry_id)
+    except Exception:
+        return {'timestamp': {'$lt': before}}
+    return {'$or': [{'timestamp': {'$lt': timestamp}}, {'timestamp': timestamp, '_id': {'$lt': entry_id}}]}
+
+def stream_history(cursor, user_id, limit, paginate=True):
+    """
+    Stream a history response straight from a Mongo cursor. The first entry
+    is fetched before the response starts so query errors still become a 500.
+    One extra entry is read to tell whether a next page exists.
+    """
+    cursor = cursor.limit(limit + 1)
+    first = next(cursor, None)
+
+    def generate():
+        yield '{"user_id": ' + json.dumps(str(user_id)) + ', "history": ['
+        next_cursor = None
+        for count, entry in enumerate(itertools.chain([first] if first else [], cursor)):
+            if count == limit:
+                next_cursor = encode_history_cursor(previous) if paginate else None
+                break
+            previous = entry
+            item = {key: value for key, value in entry.items() if key not in ('_id', 'user_id')}
+            item['id'] = str(entry['_id'])
+            yield (', ' if count else '') + json.dumps(item, ensure_ascii=False, default=str)
+        yield '], "next_cursor": ' + json.dumps(next_cursor) + '}'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+# ----- History write-behind -----
+# Finished results are saved by the server instead of by a second client
+# request. Records go into an in-memory buffer that a background thread
+# writes with insert_many once HISTORY_FLUSH_BATCH records are waiting or
+# HISTORY_FLUSH_INTERVAL_S has passed. Transient Mongo failures are retried
+# with backoff; records carry their _id from the start, so a retried batch
+# that was partly written cannot create duplicates. Whatever is buffered is
+# flushed at shutdown.
+HISTORY_FLUSH_BATCH = int(os.getenv("HISTORY_FLUSH_BATCH", "100"))
+HISTORY_FLUSH_INTERVAL_S = float(os.getenv("HISTORY_FLUSH_INTERVAL_S", "1.0"))
+HISTORY_BUFFER_MAX = int(os.getenv("HISTORY_BUFFER_MAX", "10000"))
+HISTORY_WRITE_RETRIES = int(os.getenv("HISTORY_WRITE_RETRIES", "5"))
+
+def utc_timestamp():
+    """ISO-8601 UTC with milliseconds and a Z suffix, the same format the browser's toISOString() uses."""
+    return datetime.now(timezone.utc).isoformat(timespec='milliseconds').replace('+00:00', 'Z')
+
+def _is_transient(error):
+    return isinstance(error, ConnectionFailure) or (
+        isinstance(error, PyMongoError) and error.has_error_label('RetryableWriteError')
+    )
+
+class WriteBehindBuffer:
+    """Buffers records and writes them in batches on a background thread."""
+
+    def __init__(self, name, write_batch, batch_size, interval_s, max_buffered, retries):
+        self.name = name
+        self.write_batch = write_batch
+        self.batch_size = max(1, batch_size)
+        self.interval_s = interval_s
+        self.max_buffered = max(self.batch_size, max_buffered)
+        self.retries = retries
+        self.records = collections.deque()
+        self.condition = threading.Condition()
+        self.thread = None
+        self.writing = False
+        self.flushing = False
+        self.closed = False
+        self.counts = collections.Counter()
+
+    def add(self, record):
+        with self.condition:
+            if len(self.records) >= self.max_buffered:
+                # Mongo has been down for a while; keep the newest records
+                self.records.popleft()
+                self.counts['dropped'] += 1
+            self.records.append(record)
+            if self.thread is None and not self.closed:
+                self.thread = threading.Thread(target=self._loop, name=f"{self.name}-writer", daemon=True)
+                self.thread.start()
+            if len(self.records) >= self.batch_size:
+                self.condition.notify_all()
+
+    def _loop(self):
+        while True:
+            with self.condition:
+                deadline = time.monotonic() + self.interval_s
+                while len(self.records) < self.batch_size and not (self.closed or self.flushing):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self.condition.wait(timeout=remaining)
+                batch = [self.records.popleft() for _ in range(min(self.batch_size, len(self.records)))]
+                self.writing = bool(batch)
+            if batch:
+                self._write(batch)
+            with self.condition:
+                self.writing = False
+                self.condition.notify_all()
+                if self.closed and not self.records:
+                    return
+
+    def _write(self, batch):
+        for attempt in range(self.retries + 1):
             try:
-                os.unlink(wav_name)
-            except:
-                pass
-        raise e
+                self.write_batch(batch)
+                self.counts['written'] += len(batch)
+                self.counts['batches'] += 1
+                return
+            except Exception as e:
+                if not _is_transient(e) or attempt == self.retries:
+                    logger.error(f"Dropping {len(batch)} {self.name} record(s) after {attempt + 1} attempt(s): {e}")
+                    ERRORS.inc(stage='mongo_write', type=type(e).__name__)
+                    self.counts['dropped'] += len(batch)
+                    return
+                self.counts['retries'] += 1
+                time.sleep(min(0.5 * 2 ** attempt, 10.0))
 
-# ----- ASR -----
-def transcribe_audio(audio_data, sample_rate=16000):
-    if asr_pipeline is None:
-        return "ASR model not available"
+    def flush(self, timeout=10.0):
+        """Have the writer thread write everything buffered now; False if records remain after `timeout`."""
+        deadline = time.monotonic() + timeout
+        with self.condition:
+            self.flushing = True
+            self.condition.notify_all()
+            while (self.records or self.writing) and self.thread is not None and self.thread.is_alive():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                self.condition.wait(timeout=remaining)
+            self.flushing = False
+            return not self.records
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify_all()
+        if not self.flush():
+            logger.error(f"Shutting down with {len(self.records)} unsaved {self.name} record(s)")
+
+    def stats(self):
+        with self.condition:
+            return {'buffered': len(self.records), **self.counts}
+
+def _insert_history(batch):
     try:
-        if len(audio_data) == 0:
-            return "No audio data"
-        with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as tmp:
-            tmp_name = tmp.name
-            sf.write(tmp_name, audio_data, sample_rate, format='WAV')
+        with timed_stage('mongo_write'):
+            mongo.db.translation_history.insert_many(batch, ordered=False)
+    except BulkWriteError as e:
+        # Duplicate _ids are records an earlier, interrupted attempt already wrote
+        errors = [error for error in e.details.get('writeErrors', []) if error.get('code') != 11000]
+        if errors or e.details.get('writeConcernErrors'):
+            raise
+
+history_writer = WriteBehindBuffer(
+    "history", _insert_history, HISTORY_FLUSH_BATCH, HISTORY_FLUSH_INTERVAL_S, HISTORY_BUFFER_MAX, HISTORY_WRITE_RETRIES
+)
+atexit.register(history_writer.close)
+
+def save_history(user_id, source_lang, target_lang, original, translated):
+    """Queue one finished translation for the user's history; returns its id."""
+    record = {
+        '_id': ObjectId(),
+        'user_id': str(user_id),
+        'timestamp': utc_timestamp(),
+        'sourceLang': source_lang,
+        'targetLang': target_lang,
+        'original': original,
+        'translated': translated,
+    }
+    history_writer.add(record)
+    return record['_id']
+
+# ----- Admission control -----
+# audio_chunk work is admitted through one controller: at most
+# ADMISSION_MAX_RUNNING utterances are processed at once, at most
+# ADMISSION_MAX_QUEUED more wait for a slot, and each user may hold
+# ADMISSION_MAX_PER_USER of them. Anything beyond that gets a `busy` event
+# with a retry-after hint. A socket only keeps its newest utterance waiting:
+# an admitted newer one replaces a still-queued older one, which gets a
+# `cancelled` event. Utterances already running finish. Disconnecting cancels
+# all of the socket's jobs.
+ADMISSION_MAX_RUNNING = int(os.getenv("ADMISSION_MAX_RUNNING", "8"))
+ADMISSION_MAX_QUEUED = int(os.getenv("ADMISSION_MAX_QUEUED", "32"))
+ADMISSION_MAX_PER_USER = int(os.getenv("ADMISSION_MAX_PER_USER", "2"))
+
+class Job:
+    """One admitted utterance; cancelling it also cancels any inference futures it is waiting on."""
+
+    def __init__(self, sid, user):
+        self.sid = sid
+        self.user = user
+        self.state = 'queued'  # queued -> running -> done, or cancelled at any point
+        self.futures = []
+        self.submitted = time.monotonic()
+        self.started = None
+
+    @property
+    def cancelled(self):
+        return self.state == 'cancelled'
+
+    def attach(self, futures):
+        self.futures.extend(futures)
+        if self.cancelled:
+            for future in futures:
+                future.cancel()
+
+class AdmissionController:
+    """Bounded, per-user fair admission for inference jobs, with cancellation of stale ones."""
+
+    def __init__(self, max_running, max_queued, max_per_user):
+        self.max_running = max(1, max_running)
+        self.max_queued = max(0, max_queued)
+        self.max_per_user = max(1, max_per_user)
+        self.condition = threading.Condition()
+        self.running = 0
+        self.waiting = collections.deque()
+        self.jobs_by_sid = {}  # sid -> the socket's unfinished jobs, oldest first
+        self.jobs_by_user = collections.Counter()
+        # Requests waiting on an identical in-flight one hold a socket thread, so they count against the user too
+        self.waiters_by_user = collections.Counter()
+        self.durations = collections.deque(maxlen=50)
+        self.counts = collections.Counter()
+
+    def _retry_after(self, ahead):
+        # Seconds until `ahead` jobs have passed through the running slots
+        average = sum(self.durations) / len(self.durations) if self.durations else 1.0
+        return round(max(1.0, average * ahead / self.max_running), 1)
+
+    def submit(self, sid, user):
+        """
+        Admit a job for a socket, replacing the socket's job that is still
+        queued, if any. Returns (job, None), or (None, retry_after_s) when at
+        capacity; a rejected job leaves the queued one in place.
+        """
+        with self.condition:
+            stale = [job for job in self.jobs_by_sid.get(sid, []) if job.state == 'queued']
+            user_jobs = self.jobs_by_user[user] + self.waiters_by_user[user] - sum(job.user == user for job in stale)
+            if user_jobs >= self.max_per_user:
+                self.counts['rejected_user'] += 1
+                return None, self._retry_after(user_jobs)
+            total = self.running + len(self.waiting) - len(stale)
+            if total >= self.max_running + self.max_queued:
+                self.counts['rejected_full'] += 1
+                return None, self._retry_after(total - self.max_running + 1)
+            for previous in stale:
+                self._cancel(previous)
+                self.counts['superseded'] += 1
+            job = Job(sid, user)
+            self.jobs_by_sid.setdefault(sid, []).append(job)
+            self.jobs_by_user[user] += 1
+            self.waiting.append(job)
+            self.counts['admitted'] += 1
+            return job, None
+
+    def join_wait(self, user):
+        """Count a request waiting on an identical in-flight one; returns retry_after_s when the user is at the limit."""
+        with self.condition:
+            held = self.jobs_by_user[user] + self.waiters_by_user[user]
+            if held >= self.max_per_user:
+                self.counts['rejected_user'] += 1
+                return self._retry_after(held)
+            self.waiters_by_user[user] += 1
+            return None
+
+    def leave_wait(self, user):
+        with self.condition:
+            self.waiters_by_user[user] -= 1
+            if self.waiters_by_user[user] <= 0:
+                del self.waiters_by_user[user]
+
+    def wait_turn(self, job):
+        """Block until the job may run; False if it was cancelled while queued."""
+        with self.condition:
+            while not job.cancelled and (self.waiting[0] is not job or self.running >= self.max_running):
+                self.condition.wait(timeout=1.0)
+            if job.cancelled:
+                return False
+            self.waiting.popleft()
+            self.running += 1
+            job.state = 'running'
+            job.started = time.monotonic()
+            self.condition.notify_all()
+            return True
+
+    def _cancel(self, job):
+        if job.state in ('done', 'cancelled'):
+            return
+        if job.state == 'queued':
+            self.waiting.remove(job)
+        job.state = 'cancelled'
+        for future in job.futures:
+            future.cancel()
+        self._forget(job)
+        self.counts['cancelled'] += 1
+        self.condition.notify_all()
+
+    def _forget(self, job):
+        jobs = self.jobs_by_sid.get(job.sid, [])
+        if job in jobs:
+            jobs.remove(job)
+            if not jobs:
+                del self.jobs_by_sid[job.sid]
+        self.jobs_by_user[job.user] -= 1
+        if self.jobs_by_user[job.user] <= 0:
+            del self.jobs_by_user[job.user]
+
+    def cancel_sid(self, sid):
+        with self.condition:
+            for job in list(self.jobs_by_sid.get(sid, [])):
+                self._cancel(job)
+
+    def release(self, job):
+        """Give back a job's slot once its handler is done with it, cancelled or not."""
+        with self.condition:
+            if job.started is not None:
+                self.running -= 1
+                self.durations.append(time.monotonic() - job.started)
+                job.started = None
+            if job.state in ('queued', 'running'):
+                if job.state == 'queued':
+                    self.waiting.remove(job)
+                job.state = 'done'
+                self._forget(job)
+            self.condition.notify_all()
+
+    def stats(self):
+        with self.condition:
+            return {'running': self.running, 'queued': len(self.waiting), 'waiting_on_duplicate': sum(self.waiters_by_user.values()),
+                    **self.counts}
+
+admission = AdmissionController(ADMISSION_MAX_RUNNING, ADMISSION_MAX_QUEUED, ADMISSION_MAX_PER_USER)
+
+QUEUE_DEPTH = GaugeMetric('stt_queue_depth', 'Work waiting to run, by queue', ('queue',), function=lambda: {
+    'admission': len(admission.waiting),
+    'asr_batch': sum(batcher.queue.qsize() for batcher in asr_batchers.values()),
+    'model_pool': len(model_pool.pending) if model_pool else 0,
+})
+RUNNING_JOBS = GaugeMetric('stt_running_jobs', 'Admitted audio_chunk jobs currently running', function=lambda: admission.running)
+
+# ----- Transcription jobs -----
+# Uploaded recordings are transcribed in the background instead of holding a
+# socket thread. The file stays on disk and is decoded as a stream, one
+# chunk_length_s window at a time; every TRANSCRIPTION_BATCH_SIZE windows go
+# through Whisper as one batched call and their chunks are written to Mongo
+# straight away, so neither the audio nor the transcript of a long recording
+# is held in memory. A job records how many chunks are done, and jobs still
+# queued or running at startup resume from their first missing window.
+TRANSCRIPTION_UPLOAD_DIR = os.getenv("TRANSCRIPTION_UPLOAD_DIR", "uploads")
+TRANSCRIPTION_CHUNK_S = float(os.getenv("TRANSCRIPTION_CHUNK_S", "20"))
+TRANSCRIPTION_BATCH_SIZE = int(os.getenv("TRANSCRIPTION_BATCH_SIZE", "8"))
+TRANSCRIPTION_WORKERS = int(os.getenv("TRANSCRIPTION_WORKERS", "1"))
+TRANSCRIPTION_MAX_UPLOAD_MB = float(os.getenv("TRANSCRIPTION_MAX_UPLOAD_MB", "1024"))
+TRANSCRIPTION_MAX_CHUNK_S = 30.0  # Whisper's input window
+
+def iter_audio_windows(path, window_s, start_s=0.0):
+    """
+    Yield consecutive 16kHz mono float32 windows of an audio file from start_s
+    on. ffmpeg decodes through a pipe; without it soundfile reads the formats
+    libsndfile knows (WAV, FLAC, OGG) block by block.
+    """
+    window_samples = int(window_s * TARGET_SAMPLE_RATE)
+    if check_ffmpeg():
+        command = [
+            'ffmpeg', '-hide_banner', '-loglevel', 'error',
+            '-ss', f"{start_s:.3f}", '-i', path,
+            '-f', 'f32le', '-ac', '1', '-ar', str(TARGET_SAMPLE_RATE),
+            'pipe:1'
+        ]
+        process = subprocess.Popen(command, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
         try:
-            result = asr_pipeline(tmp_name)
-            transcribed_text = result.get("text", "").strip()
-            detected_lang = result.get("language", "en")
-            return transcribed_text if transcribed_text else "No speech detected", detected_lang
+            while True:
+                data = process.stdout.read(window_samples * 4)
+                if not data:
+                    break
+                yield np.frombuffer(data[:len(data) - len(data) % 4], dtype=np.float32)
+            if process.wait() != 0:
+                raise RuntimeError(process.stderr.read().decode(errors='replace').strip())
         finally:
+            if process.poll() is None:
+                process.kill()
+                process.wait()
+        return
+    with sf.SoundFile(path) as audio:
+        audio.seek(min(int(start_s * audio.samplerate), audio.frames))
+        frames = int(window_s * audio.samplerate)
+        while True:
+            block = audio.read(frames, dtype='float32')
+            if len(block) == 0:
+                break
+            yield to_mono_16k(block, audio.samplerate)
+
+def audio_duration(path):
+    """Duration of an audio file in seconds from its header, or None when unknown."""
+    try:
+        return sf.info(path).duration
+    except Exception:
+        pass
+    if shutil.which("ffprobe"):
+        result = subprocess.run(
+            ['ffprobe', '-v', 'error', '-show_entries', 'format=duration', '-of', 'csv=p=0', path],
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE, text=True, timeout=30
+        )
+        try:
+            return float(result.stdout.strip())
+        except ValueError:
+            pass
+    return None
+
+def transcription_job_summary(job):
+    """The API view of a job document."""
+    total = job.get('total_chunks')
+    done = job.get('completed_chunks', 0)
+    if job['status'] == 'done':
+        progress = 1.0
+    else:
+        progress = round(min(done / total, 1.0), 3) if total else None
+    return {
+        'id': str(job['_id']),
+        'status': job['status'],
+        'filename': job.get('filename'),
+        'created_at': job.get('created_at'),
+        'updated_at': job.get('updated_at'),
+        'duration_s': job.get('duration_s'),
+        'processed_s': job.get('processed_s', 0.0),
+        'chunk_length_s': job['chunk_length_s'],
+        'completed_chunks': done,
+        'total_chunks': total,
+        'progress': progress,
+        'source_lang': job.get('source_lang'),
+        'language': job.get('language'),
+        'target_langs': job.get('target_langs', []),
+        'error': job.get('error'),
+    }
+
+class TranscriptionJobRunner:
+    """
+    Background threads that run transcription jobs one batch of windows at a
+    time. Progress lives in Mongo, so resuming a job is just queueing it again.
+    """
+
+    def __init__(self, workers, batch_size):
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self.queue = queue.Queue()
+        self.threads = []
+        self.active = set()
+        self.cancelled = set()
+        self.lock = threading.Lock()
+
+    def submit(self, job_id):
+        self._ensure_started()
+        self.queue.put(job_id)
+
+    def cancel(self, job_id):
+        with self.lock:
+            self.cancelled.add(job_id)
+
+    def _ensure_started(self):
+        # Started lazily, like the micro-batchers
+        with self.lock:
+            self.threads = [thread for thread in self.threads if thread.is_alive()]
+            while len(self.threads) < self.workers:
+                thread = threading.Thread(target=self._loop, name=f"transcription-job-{len(self.threads)}", daemon=True)
+                thread.start()
+                self.threads.append(thread)
+
+    def _loop(self):
+        # Job threads run their ASR batches themselves, within the ASR budget
+        configure_stage_thread('asr')
+        while True:
+            job_id = self.queue.get()
+            with self.lock:
+                self.active.add(job_id)
             try:
-                os.unlink(tmp_name)
-            except:
-                pass
-    except Exception as e:
-        logger.error(f"Transcription error: {e}")
-        return f"Transcription error: {str(e)}", "en"
+                self.run(job_id)
+            except Exception as e:
+                logger.error(f"Transcription job {job_id} failed: {e}", exc_info=True)
+                ERRORS.inc(stage='transcription_job', type=type(e).__name__)
+                self._finish(job_id, 'failed', error=str(e))
+            finally:
+                with self.lock:
+                    self.active.discard(job_id)
+                    self.cancelled.discard(job_id)
 
-# ----- Translation -----
-def translate_text(text, source_lang, target_lang_code):
-    if not text or not m2m_model or not m2m_tokenizer:
-        return ""
+    @staticmethod
+    def _remove_upload(job):
+        try:
+            os.remove(job['file_path'])
+        except (KeyError, FileNotFoundError):
+            pass
+
+    def _finish(self, job_id, status, **fields):
+        """Move an unfinished job to a final status; the upload is not needed past that point."""
+        job = mongo.db.transcription_jobs.find_one_and_update(
+            {'_id': job_id, 'status': {'$in': ['queued', 'running']}},
+            {'$set': {'status': status, 'updated_at': utc_timestamp(), **fields}}
+        )
+        # A job cancelled meanwhile keeps its status but still drops the file
+        self._remove_upload(job or mongo.db.transcription_jobs.find_one({'_id': job_id}) or {})
+
+    def run(self, job_id):
+        jobs = mongo.db.transcription_jobs
+        job = jobs.find_one({'_id': job_id})
+        if job is None:
+            return
+        if job['status'] not in ('queued', 'running') or job_id in self.cancelled:
+            self._remove_upload(job)
+            return
+        if not wait_for_model('asr'):
+            raise RuntimeError("ASR model not loaded")
+        jobs.update_one({'_id': job_id}, {'$set': {'status': 'running', 'updated_at': utc_timestamp()}})
+        chunk_s = job['chunk_length_s']
+        index = job.get('completed_chunks', 0)
+        processed_s = job.get('processed_s', 0.0)
+        if index:
+            logger.info(f"Resuming transcription job {job_id} at chunk {index}")
+        spoken = SessionLanguage()
+        if job.get('source_lang'):
+            spoken.pin(job['source_lang'])
+        targets = job.get('target_langs', [])
+
+        windows = iter_audio_windows(job['file_path'], chunk_s, index * chunk_s)
+        try:
+            while True:
+                batch = list(itertools.islice(windows, self.batch_size))
+                if not batch:
+                    break
+                if job_id in self.cancelled:
+                    self._remove_upload(job)
+                    return
+                language, identify = spoken.request()
+                with timed_stage('job_asr'):
+                    # tier=None runs the largest loaded tier: offline work favours accuracy over latency
+                    results = _run_asr_batch([(samples, language, identify) for samples in batch])
+                best = max(results, key=lambda result: result.get("language_probability") or 0.0)
+                spoken.observe(best.get("language"), best.get("language_probability"))
+
+                chunks = []
+                for samples, result in zip(batch, results):
+                    text = result.get("text", "").strip()
+                    chunk_language = result.get("language") or "en"
+                    translations = {}
+                    if text and targets:
+                        if not translation_available():
+                            wait_for_model('mt')
+                        with timed_stage('job_translation'):
+                            translations = translate_text_multi(text, chunk_language, targets)
+                    duration_s = len(samples) / TARGET_SAMPLE_RATE
+                    chunks.append({
+                        'job_id': job_id,
+                        'index': index,
+                        'start_s': round(index * chunk_s, 3),
+                        'end_s': round(index * chunk_s + duration_s, 3),
+                        'text': text,
+                        'language': chunk_language,
+                        'translations': translations,
+                    })
+                    index += 1
+                    processed_s += duration_s
+                # Upserts keyed by (job_id, index) make a batch rewritten after a crash harmless
+                mongo.db.transcription_chunks.bulk_write(
+                    [pymongo.ReplaceOne({'job_id': job_id, 'index': chunk['index']}, chunk, upsert=True) for chunk in chunks],
+                    ordered=False
+                )
+                AUDIO_SECONDS.inc(sum(len(samples) for samples in batch) / TARGET_SAMPLE_RATE)
+                jobs.update_one({'_id': job_id}, {'$set': {
+                    'completed_chunks': index,
+                    'processed_s': round(processed_s, 3),
+                    'language': spoken.language,
+                    'updated_at': utc_timestamp(),
+                }})
+        finally:
+            # Stops ffmpeg if the job ends early
+            windows.close()
+
+        self._finish(job_id, 'done', total_chunks=index)
+        logger.info(f"Transcription job {job_id} done ({index} chunks, {processed_s:.1f}s of audio)")
+
+    def stats(self):
+        with self.lock:
+            return {'queued': self.queue.qsize(), 'running': len(self.active), 'workers': self.workers}
+
+transcription_jobs = TranscriptionJobRunner(TRANSCRIPTION_WORKERS, TRANSCRIPTION_BATCH_SIZE)
+
+def resume_transcription_jobs():
+    """Create the job indexes and queue every job a previous run left unfinished."""
     try:
-        m2m_tokenizer.src_lang = source_lang
-        encoded = m2m_tokenizer(text, return_tensors="pt").to(device)
-        generated_tokens = m2m_model.generate(
-            **encoded,
-            forced_bos_token_id=m2m_tokenizer.get_lang_id(target_lang_code)
+        mongo.db.transcription_jobs.create_index(
+            [('user_id', pymongo.ASCENDING), ('created_at', pymongo.DESCENDING)], name='user_created'
+        )
+        mongo.db.transcription_chunks.create_index(
+            [('job_id', pymongo.ASCENDING), ('index', pymongo.ASCENDING)], name='job_index', unique=True
         )
-        translated_text = m2m_tokenizer.batch_decode(generated_tokens, skip_special_tokens=True)[0]
-        return translated_text
+        unfinished = mongo.db.transcription_jobs.find(
+            {'status': {'$in': ['queued', 'running']}}, {'_id': 1}
+        ).sort('created_at', pymongo.ASCENDING)
+        count = 0
+        for job in unfinished:
+            transcription_jobs.submit(job['_id'])
+            count += 1
+        if count:
+            logger.info(f"Resuming {count} unfinished transcription job(s)")
     except Exception as e:
-        logger.error(f"Translation error ({source_lang}->{target_lang_code}): {e}")
-        return f"Translation error: {str(e)}"
+        logger.error(f"Could not resume transcription jobs: {e}")
+
+# ----- Socket connection context -----
+# The user is resolved from the session once, in connect, and cached per sid
+# so later events never touch the session store. Logout revokes every socket
+# opened from that session; the TTL bounds how long a socket outlives it.
+SOCKET_AUTH_TTL_S = float(os.getenv("SOCKET_AUTH_TTL_S", "3600"))
+
+class ConnectionContext:
+    def __init__(self, sid, user, session_id):
+        self.sid = sid
+        self.user = user
+        self.session_id = session_id
+        self.expires_at = time.monotonic() + SOCKET_AUTH_TTL_S
+
+connections = {}
+connections_lock = threading.Lock()
+
+def session_cookie():
+    """Session id cookie of the current request; Flask-SocketIO's session copy carries no sid of its own"""
+    return request.cookies.get(app.config["SESSION_COOKIE_NAME"])
+
+def open_connection(user):
+    """Cache the authenticated user for the calling socket"""
+    context = ConnectionContext(request.sid, user, session_cookie())
+    with connections_lock:
+        connections[request.sid] = context
+    return context
+
+def close_connection(sid):
+    with connections_lock:
+        return connections.pop(sid, None)
+
+def socket_user():
+    """User of the calling socket, or None if it never logged in, expired or was revoked"""
+    context = connections.get(request.sid)
+    if context is None:
+        return None
+    if context.expires_at < time.monotonic():
+        close_connection(request.sid)
+        logger.info(f"Socket auth expired (user={context.user})")
+        return None
+    return context.user
+
+def revoke_connections(user, session_id=None):
+    """Drop and disconnect the sockets of a user, or only those of one session when session_id is given"""
+    with connections_lock:
+        revoked = [sid for sid, context in connections.items()
+                   if context.user == user and (session_id is None or context.session_id == session_id)]
+        for sid in revoked:
+            del connections[sid]
+    for sid in revoked:
+        socketio.emit('error', {'message': 'Logged out'}, to=sid)
+        socketio.server.disconnect(sid, namespace='/')
+    return len(revoked)
+
+def connection_stats():
+    with connections_lock:
+        return {'authenticated': len(connections), 'ttl_s': SOCKET_AUTH_TTL_S, 'session_backend': SESSION_BACKEND}
 
 # ----- Routes -----
+@app.route('/metrics')
+def metrics():
+    """Prometheus text exposition of the counters, gauges and stage histograms"""
+    return render_metrics(), 200, {'Content-Type': 'text/plain; version=0.0.4; charset=utf-8'}
+
 @app.route('/health')
 def health():
     """Health check endpoint for Docker"""
-    return {'status': 'healthy', 'asr_ready': asr_pipeline is not None}, 200
+    return {
+        'status': 'healthy',
+        'asr_ready': asr_available(),
+        'models': model_status(),
+        'asr_batching': {tier: batcher.stats() for tier, batcher in asr_batchers.items()},
+        'stages': stage_stats(),
+        'tiers': {'asr': asr_router.stats(), 'mt': mt_router.stats()},
+        'translation_cache': translation_cache.stats(),
+        'result_cache': {**result_cache.stats(), **inflight_results.stats()},
+        'vad': {key: round(value, 2) for key, value in vad_stats.items()},
+        'model_workers': model_pool.stats() if model_pool else None,
+        'admission': admission.stats(),
+        'history_writer': history_writer.stats(),
+        'sockets': connection_stats(),
+        'transcription_jobs': transcription_jobs.stats(),
+    }, 200
 
 @app.route('/api/session_check')
 def session_check():
@@ -374,47 +2998,179 @@ def get_translation_history():
     
     try:
         logger.info(f"Fetching translation history for user_id: {user_id}")
-        
-        history = list(mongo.db.translation_history.find(
-            {'user_id': str(user_id)},
-            {'_id': 0}  # Exclude MongoDB _id field to keep it clean
-        ).sort('timestamp', -1).limit(50))
-        
-        logger.info(f"Retrieved {len(history)} translations for user {user_id}")
-        return {'history': history, 'user_id': str(user_id)}, 200
+        query = {'user_id': str(user_id)}
+        if request.args.get('before'):
+            query.update(history_before_filter(request.args['before']))
+        cursor = mongo.db.translation_history.find(query).sort([('timestamp', -1), ('_id', -1)])
+        return stream_history(cursor, user_id, history_page_size(request.args.get('limit')))
     except Exception as e:
         logger.error(f"Error retrieving translation history: {e}", exc_info=True)
         return {'error': str(e)}, 500
 
+@app.route('/api/translation_history/search', methods=['GET'])
+def search_translation_history():
+    """Full-text search over the user's original and translated texts, best matches first"""
+    user_id = session.get("user")
+    if not user_id:
+        return {'error': 'Not logged in'}, 401
+    text = request.args.get('q', '').strip()
+    if not text:
+        return {'error': 'Missing search query q'}, 400
+
+    try:
+        cursor = mongo.db.translation_history.find(
+            {'user_id': str(user_id), '$text': {'$search': text}},
+            {'score': {'$meta': 'textScore'}}
+        ).sort([('score', {'$meta': 'textScore'})])
+        return stream_history(cursor, user_id, history_page_size(request.args.get('limit')), paginate=False)
+    except Exception as e:
+        logger.error(f"Error searching translation history: {e}", exc_info=True)
+        return {'error': str(e)}, 500
+
 @app.route('/api/translation_history', methods=['POST'])
 def save_translation():
-    """Save a translation to the user's history"""
+    """Queue a translation for the user's history (results from audio_chunk are saved automatically)"""
     user_id = session.get("user")
     if not user_id:
         logger.warning("Save translation request: User not found in session")
         return {'error': 'Not logged in'}, 401
-    
+
+    data = request.get_json(silent=True) or {}
+    if not data.get('original'):
+        return {'error': 'Missing original text'}, 400
+    entry_id = save_history(user_id, data.get('sourceLang'), data.get('targetLang'), data.get('original'), data.get('translated'))
+    return {'success': True, 'id': str(entry_id)}, 202
+
+@app.route('/api/transcriptions', methods=['POST'])
+def create_transcription():
+    """
+    Upload an audio file (multipart field "file") for background transcription.
+    Optional form fields: target_langs (comma separated), source_lang, chunk_length_s.
+    """
+    user_id = session.get("user")
+    if not user_id:
+        return {'error': 'Not logged in'}, 401
+    if request.content_length and request.content_length > TRANSCRIPTION_MAX_UPLOAD_MB * 1024 * 1024:
+        return {'error': f'File larger than {TRANSCRIPTION_MAX_UPLOAD_MB:g} MB'}, 413
+    upload = request.files.get('file')
+    if upload is None or not upload.filename:
+        return {'error': 'Missing audio file'}, 400
+
+    languages = AVAILABLE_LANGUAGES.values()
+    target_langs = [code.strip() for code in request.form.get('target_langs', '').split(',') if code.strip() in languages]
+    source_lang = request.form.get('source_lang') or None
+    if source_lang not in (None, 'auto') and source_lang not in languages:
+        return {'error': f'Unknown source_lang: {source_lang}'}, 400
     try:
-        data = request.get_json()
-        logger.info(f"Saving translation for user_id: {user_id}, data: {data}")
-        
-        translation_record = {
-            'user_id': str(user_id),
-            'timestamp': data.get('timestamp', __import__('datetime').datetime.utcnow().isoformat()),
-            'sourceLang': data.get('sourceLang'),
-            'targetLang': data.get('targetLang'),
-            'original': data.get('original'),
-            'translated': data.get('translated')
-        }
-        
-        logger.info(f"Translation record to insert: {translation_record}")
-        result = mongo.db.translation_history.insert_one(translation_record)
-        logger.info(f"Translation saved with ID: {result.inserted_id}")
-        
-        return {'success': True, 'id': str(result.inserted_id)}, 201
+        chunk_length_s = float(request.form.get('chunk_length_s') or TRANSCRIPTION_CHUNK_S)
+    except ValueError:
+        return {'error': 'chunk_length_s must be a number'}, 400
+    chunk_length_s = min(max(chunk_length_s, 1.0), TRANSCRIPTION_MAX_CHUNK_S)
+
+    job_id = ObjectId()
+    os.makedirs(TRANSCRIPTION_UPLOAD_DIR, exist_ok=True)
+    file_path = os.path.join(TRANSCRIPTION_UPLOAD_DIR, f"{job_id}{os.path.splitext(secure_filename(upload.filename))[1]}")
+    upload.save(file_path)
+    duration_s = audio_duration(file_path)
+    now = utc_timestamp()
+    job = {
+        '_id': job_id,
+        'user_id': str(user_id),
+        'status': 'queued',
+        'filename': upload.filename,
+        'file_path': file_path,
+        'created_at': now,
+        'updated_at': now,
+        'duration_s': duration_s,
+        'chunk_length_s': chunk_length_s,
+        'completed_chunks': 0,
+        'total_chunks': int(-(-duration_s // chunk_length_s)) if duration_s else None,
+        'source_lang': None if source_lang == 'auto' else source_lang,
+        'target_langs': target_langs,
+    }
+    try:
+        mongo.db.transcription_jobs.insert_one(job)
     except Exception as e:
-        logger.error(f"Error saving translation: {e}", exc_info=True)
+        os.remove(file_path)
+        logger.error(f"Could not create transcription job: {e}", exc_info=True)
         return {'error': str(e)}, 500
+    transcription_jobs.submit(job_id)
+    logger.info(f"Transcription job {job_id} queued (user={user_id}, {duration_s or 0:.1f}s)")
+    return transcription_job_summary(job), 202
+
+def find_transcription_job(job_id):
+    """The calling user's job with this id, or None."""
+    if not ObjectId.is_valid(job_id):
+        return None
+    return mongo.db.transcription_jobs.find_one({'_id': ObjectId(job_id), 'user_id': str(session.get("user"))})
+
+@app.route('/api/transcriptions', methods=['GET'])
+def list_transcriptions():
+    """The user's transcription jobs, newest first"""
+    user_id = session.get("user")
+    if not user_id:
+        return {'error': 'Not logged in'}, 401
+    cursor = mongo.db.transcription_jobs.find({'user_id': str(user_id)}).sort('created_at', pymongo.DESCENDING)
+    return {'jobs': [transcription_job_summary(job) for job in cursor.limit(history_page_size(request.args.get('limit')))]}, 200
+
+@app.route('/api/transcriptions/<job_id>', methods=['GET'])
+def get_transcription(job_id):
+    """Status and progress of one transcription job"""
+    if not session.get("user"):
+        return {'error': 'Not logged in'}, 401
+    job = find_transcription_job(job_id)
+    if job is None:
+        return {'error': 'Job not found'}, 404
+    return transcription_job_summary(job), 200
+
+@app.route('/api/transcriptions/<job_id>', methods=['DELETE'])
+def cancel_transcription(job_id):
+    """Cancel a queued or running job; chunks already transcribed are kept"""
+    if not session.get("user"):
+        return {'error': 'Not logged in'}, 401
+    job = find_transcription_job(job_id)
+    if job is None:
+        return {'error': 'Job not found'}, 404
+    if job['status'] in ('queued', 'running'):
+        transcription_jobs.cancel(job['_id'])
+        job = mongo.db.transcription_jobs.find_one_and_update(
+            {'_id': job['_id']},
+            {'$set': {'status': 'cancelled', 'updated_at': utc_timestamp()}},
+            return_document=pymongo.ReturnDocument.AFTER
+        )
+    return transcription_job_summary(job), 200
+
+@app.route('/api/transcriptions/<job_id>/transcript', methods=['GET'])
+def get_transcript(job_id):
+    """
+    The chunks transcribed so far, streamed from Mongo in order. format=text
+    returns plain text instead: the transcript, or its translation with lang=<code>.
+    """
+    if not session.get("user"):
+        return {'error': 'Not logged in'}, 401
+    job = find_transcription_job(job_id)
+    if job is None:
+        return {'error': 'Job not found'}, 404
+    cursor = mongo.db.transcription_chunks.find({'job_id': job['_id']}, {'_id': 0, 'job_id': 0}).sort('index', pymongo.ASCENDING)
+
+    if request.args.get('format') == 'text':
+        lang = request.args.get('lang')
+
+        def generate_text():
+            for chunk in cursor:
+                text = chunk['translations'].get(lang, '') if lang else chunk['text']
+                if text:
+                    yield text + "\n"
+
+        return Response(stream_with_context(generate_text()), mimetype='text/plain')
+
+    def generate():
+        yield '{"job": ' + json.dumps(transcription_job_summary(job)) + ', "chunks": ['
+        for count, chunk in enumerate(cursor):
+            yield (', ' if count else '') + json.dumps(chunk, ensure_ascii=False)
+        yield ']}'
+
+    return Response(stream_with_context(generate()), mimetype='application/json')
 
 @app.route('/')
 def index():
@@ -455,7 +3211,9 @@ def login():
 
 @app.route('/logout')
 def logout():
-    session.pop("user", None)
+    user = session.pop("user", None)
+    if user:
+        revoke_connections(user, session_cookie())
     flash("Logged out")
     return redirect(url_for('index'))
 
@@ -473,7 +3231,7 @@ def debug_oauth():
         'google_client_secret_set': bool(GOOGLE_CLIENT_SECRET),
         'google_oauth_configured': google is not None,
         'flask_secret_set': bool(app.config.get('SECRET_KEY')),
-        'session_type': app.config.get('SESSION_TYPE'),
+        'session_type': SESSION_BACKEND,
         'mongo_uri_set': bool(app.config.get('MONGO_URI')),
         'redirect_uri_example': url_for('google_callback', _external=True)
     }
@@ -618,6 +3376,7 @@ def google_callback():
 @socketio.on('connect')
 def handle_connect(auth):
     """Handle WebSocket connection with session authentication"""
+    ACTIVE_SOCKETS.inc()
     try:
         # Try to get user from session
         user = session.get("user")
@@ -629,11 +3388,9 @@ def handle_connect(auth):
             emit('error', {'message': 'Please login first'})
             return
         
+        open_connection(user)
         logger.info(f'Client connected (user={user})')
-        emit('available_languages', {
-            'languages': AVAILABLE_LANGUAGES,
-            'asr_ready': asr_pipeline is not None
-        })
+        emit('available_languages', available_languages_payload())
         emit('status', {'message': 'Connected to server'})
     except Exception as e:
         logger.error(f'Error in WebSocket connect: {e}', exc_info=True)
@@ -641,40 +3398,303 @@ def handle_connect(auth):
 
 @socketio.on('disconnect')
 def handle_disconnect():
+    ACTIVE_SOCKETS.dec()
+    close_connection(request.sid)
+    with stream_sessions_lock:
+        stream_sessions.pop(request.sid, None)
+    latency_budgets.pop(request.sid, None)
+    session_languages.pop(request.sid, None)
+    admission.cancel_sid(request.sid)
     logger.info('Client disconnected')
 
+def tagged(data, payload):
+    """Echo the client's request_id, when it sent one, so replies can be matched to requests."""
+    request_id = data.get('request_id') if isinstance(data, dict) else None
+    return payload if request_id is None else {**payload, 'request_id': request_id}
+
 @socketio.on('audio_chunk')
 def handle_audio_chunk(data):
+    REQUESTS.inc(event='audio_chunk')
+    user = socket_user()
+    if not user:
+        ERRORS.inc(stage='auth', type='Unauthorized')
+        emit('error', tagged(data, {'message': 'Unauthorized - please login first'}))
+        disconnect()
+        return
+    if requested_sample_rate(data, TARGET_SAMPLE_RATE) is None:
+        ERRORS.inc(stage='audio_chunk', type='UnsupportedSampleRate')
+        emit('error', tagged(data, {'message': f"Unsupported sample_rate: {data.get('sample_rate')}"}))
+        return
+
+    started = time.monotonic()
+    key, owner, payload = None, False, None
     try:
-        # Check authentication on first message
-        user = session.get("user")
-        if not user:
-            emit('error', {'message': 'Unauthorized - please login first'})
-            disconnect()
+        # Legacy base64 payloads are decoded here once and handed on to processing
+        payload = read_audio_payload(data)
+        # no_cache lets load tests replay a corpus through the pipeline rather than the cache
+        if not data.get('no_cache'):
+            key = result_cache_key(*payload, data, session_language(data).pinned)
+    except Exception as e:
+        logger.warning(f"Could not hash audio payload: {e}")
+    if key:
+        result = result_cache.get(key)
+        if result is None:
+            future, owner = inflight_results.claim(key)
+            if not owner:
+                retry_after = admission.join_wait(user)
+                if retry_after is not None:
+                    ERRORS.inc(stage='admission', type='Busy')
+                    emit('busy', tagged(data, {'message': 'Server is busy - please retry shortly', 'retry_after_s': retry_after}))
+                    return
+                try:
+                    result = future.result(timeout=RESULT_WAIT_TIMEOUT_S)
+                except FutureTimeoutError:
+                    result = None
+                finally:
+                    admission.leave_wait(user)
+        if result is not None:
+            # Answered by the cache or by an identical request that was already running
+            emit('transcription_result', tagged(data, {**result, 'cached': True, 'timings': {'total_ms': round((time.monotonic() - started) * 1000, 1)}}))
+            if result.get('translated') and claim_history_save(user, key):
+                save_history(user, result['source_lang'], result['language'], result['original'], result['translated'])
             return
-        
-        if asr_pipeline is None:
+
+    result = None
+    job, retry_after = admission.submit(request.sid, user)
+    if job is None:
+        ERRORS.inc(stage='admission', type='Busy')
+        emit('busy', tagged(data, {'message': 'Server is busy - please retry shortly', 'retry_after_s': retry_after}))
+        if owner:
+            inflight_results.resolve(key, None)
+        return
+    try:
+        if admission.wait_turn(job):
+            result = process_audio_chunk(data, job, payload)
+        if job.cancelled:
+            emit('cancelled', tagged(data, {'message': 'Replaced by a newer recording before it was processed'}))
+    except Exception as e:
+        logger.error(f"Error processing audio chunk: {e}")
+        ERRORS.inc(stage='audio_chunk', type=type(e).__name__)
+        emit('error', tagged(data, {'message': f'Processing error: {str(e)}'}))
+    finally:
+        admission.release(job)
+        if owner:
+            if cacheable_result(result):
+                result = {field: value for field, value in result.items() if field != 'timings'}
+                result_cache.put(key, result)
+                if result.get('translated'):
+                    claim_history_save(user, key)  # process_audio_chunk saved it already
+            else:
+                result = None
+            inflight_results.resolve(key, result)
+
+def process_audio_chunk(data, job, payload=None):
+    """
+    Decode, transcribe and translate one utterance, stopping early once the
+    job is cancelled. payload is the (buffer, format) already read from
+    data, if any. The result carries per-stage timings in milliseconds
+    and is returned once emitted, for the result cache.
+    """
+    timings = {'queue_ms': round((job.started - job.submitted) * 1000, 1)}
+    if not asr_available():
+        # Requests that arrive while the models load wait instead of failing
+        emit('status', {'message': 'Models are still loading - your request is queued'})
+        if not wait_for_model('asr'):
+            emit('error', tagged(data, {'message': 'ASR model not loaded'}))
+            return
+        timings['model_wait_ms'] = round((time.monotonic() - job.started) * 1000, 1)
+    audio_data, audio_format = payload or read_audio_payload(data)
+    target_lang = data.get('target_lang', '')
+    # Meeting rooms may ask for several languages at once; target_lang stays the primary one
+    target_langs = [code for code in (data.get('target_langs') or []) if code in AVAILABLE_LANGUAGES.values()]
+    if target_langs and not target_lang:
+        target_lang = target_langs[0]
+    if len(audio_data) < 100:
+        emit('transcription_result', tagged(data, {'original': 'Audio too short','translated': '', 'language': target_lang,'success': False}))
+        return
+    with timed_stage('decode', timings):
+        samples, sample_rate = decode_stage.submit(decode_audio_payload, audio_data, audio_format, requested_sample_rate(data, TARGET_SAMPLE_RATE)).result()
+    AUDIO_SECONDS.inc(len(samples) / sample_rate)
+    with timed_stage('vad', timings):
+        speech_segments = split_speech(samples, sample_rate)
+    if not speech_segments:
+        emit('transcription_result', tagged(data, {'original': 'No speech detected','translated': '', 'language': target_lang,'success': True,'timings': timings}))
+        return
+    if job.cancelled:
+        return
+    budget_ms = session_latency_budget(data)
+    started = time.perf_counter()
+    tiers = {'asr': asr_router.select(budget_ms), 'mt': None}
+    with timed_stage('asr', timings):
+        transcribed_text, detected_lang = transcribe_segments(speech_segments, sample_rate, tiers['asr'], job, session_language(data))
+    if job.cancelled:
+        return
+    translated_text = ""
+    translations = {}
+    on_sentence = on_delta = None
+    if data.get('sentence_updates'):
+        # Long dictations: push each sentence as soon as its batch is translated
+        on_sentence = lambda lang, index, original, translated: emit('translation_sentence', {
+            'language': lang, 'index': index, 'original': original, 'translated': translated
+        })
+    if data.get('stream_translation'):
+        # Tokens are detokenized on the MT thread (or the pool's result thread), outside this request context
+        sid = request.sid
+        on_delta = lambda lang, index, original, delta: socketio.emit('translation_delta', tagged(data, {
+            'language': lang, 'index': index, 'original': original, 'delta': delta
+        }), to=sid)
+    if target_lang and transcribed_text:
+        if not translation_available():
+            wait_for_model('mt')
+        # Translation gets whatever is left of the budget after ASR
+        if budget_ms:
+            budget_ms = max(budget_ms - (time.perf_counter() - started) * 1000, 1.0)
+        tiers['mt'] = mt_router.select(budget_ms)
+        with timed_stage('translation', timings):
+            if target_langs:
+                translations = translate_text_multi(transcribed_text, detected_lang, [target_lang] + target_langs, on_sentence, tiers['mt'],
+                                                    on_delta, job)
+                translated_text = translations.get(target_lang, "")
+            else:
+                translated_text = translate_text(transcribed_text, detected_lang, target_lang, on_sentence, tiers['mt'], on_delta, job)
+    if job.cancelled:
+        return
+    timings['total_ms'] = round((time.monotonic() - job.submitted) * 1000, 1)
+    result = {'original': transcribed_text or "No speech detected",'translated': translated_text,'language': target_lang,'source_lang': detected_lang,'success': True,'tiers': tiers,'timings': timings}
+    if target_langs:
+        result['translations'] = translations
+    emit('transcription_result', tagged(data, result))
+    if transcribed_text and translated_text and not translated_text.startswith("Translation error"):
+        save_history(job.user, detected_lang, target_lang, transcribed_text, translated_text)
+    return result
+
+@socketio.on('stream_start')
+def handle_stream_start(data):
+    """Open a streaming session; audio then arrives as raw PCM frames via stream_audio"""
+    REQUESTS.inc(event='stream_start')
+    user = socket_user()
+    if not user:
+        ERRORS.inc(stage='auth', type='Unauthorized')
+        emit('error', {'message': 'Unauthorized - please login first'})
+        disconnect()
+        return
+    if not asr_available():
+        emit('status', {'message': 'Models are still loading - your stream is queued'})
+        if not wait_for_model('asr'):
             emit('error', {'message': 'ASR model not loaded'})
             return
-        audio_data = base64.b64decode(data['audio'].split(',')[1])
-        target_lang = data.get('target_lang', '')
-        if len(audio_data) < 100:
-            emit('transcription_result', {'original': 'Audio too short','translated': '', 'language': target_lang,'success': False})
+    data = data or {}
+    stream = StreamSession(data.get('target_lang', ''), session_language(data), session_latency_budget(data))
+    with stream_sessions_lock:
+        stream_sessions[request.sid] = stream
+    logger.info(f"Stream started (user={user}, target={stream.target_lang})")
+    emit('stream_started', {
+        'sample_rate': STREAM_SAMPLE_RATE,
+        'window_s': STREAM_WINDOW_S,
+        'step_s': STREAM_STEP_S,
+    })
+
+@socketio.on('stream_audio')
+def handle_stream_audio(data):
+    REQUESTS.inc(event='stream_audio')
+    stream = stream_sessions.get(request.sid)
+    if stream is None:
+        emit('error', {'message': 'No active stream - send stream_start first'})
+        return
+    seq = data.get('seq') if isinstance(data, dict) else None
+    if seq is not None and (not isinstance(seq, int) or seq < 0):
+        emit('error', {'message': f'Invalid stream frame seq: {seq}'})
+        return
+    seq = stream.reserve(seq)
+    samples = np.zeros(0, dtype=np.float32)
+    try:
+        # A rejected frame is still appended, empty, so the frames after it are not held back
+        try:
+            audio_data, audio_format = read_audio_payload(data, default_format='pcm16')
+            if audio_format not in PCM_FORMATS:
+                emit('error', {'message': f'Unsupported stream audio format: {audio_format}'})
+                return
+            sample_rate = requested_sample_rate(data, STREAM_SAMPLE_RATE)
+            if sample_rate is None:
+                emit('error', {'message': f"Unsupported sample_rate: {data.get('sample_rate')}"})
+                return
+            timings = {}
+            with timed_stage('decode', timings):
+                samples, _ = decode_stage.submit(decode_audio_payload, audio_data, audio_format, sample_rate).result()
+            AUDIO_SECONDS.inc(len(samples) / STREAM_SAMPLE_RATE)
+            stream.timings.update(timings)
+        finally:
+            stream.append(seq, samples)
+
+        # Only one pass runs per stream; audio that arrives meanwhile is
+        # picked up by the next iteration of the running pass.
+        if not stream.decode_lock.acquire(blocking=False):
             return
-        samples, sample_rate = process_webm_audio(audio_data)
-        transcribed_text, detected_lang = transcribe_audio(samples, sample_rate)
-        translated_text = ""
-        if target_lang and transcribed_text and not transcribed_text.startswith("Transcription error"):
-            translated_text = translate_text(transcribed_text, detected_lang, target_lang)
-        emit('transcription_result', {'original': transcribed_text,'translated': translated_text,'language': target_lang,'success': True})
+        try:
+            step_samples = int(STREAM_STEP_S * STREAM_SAMPLE_RATE)
+            while stream.pending_samples >= step_samples:
+                stream_step(stream)
+        finally:
+            stream.decode_lock.release()
     except Exception as e:
-        logger.error(f"Error processing audio chunk: {e}")
+        logger.error(f"Error processing stream audio: {e}")
+        ERRORS.inc(stage='stream_audio', type=type(e).__name__)
+        emit('error', {'message': f'Processing error: {str(e)}'})
+
+@socketio.on('stream_end')
+def handle_stream_end(data=None):
+    REQUESTS.inc(event='stream_end')
+    stream = stream_sessions.get(request.sid)
+    if stream is None:
+        emit('error', {'message': 'No active stream'})
+        return
+    frames = data.get('frames') if isinstance(data, dict) else None
+    if not stream.wait_for_frames(frames if isinstance(frames, int) else None):
+        logger.warning(f"Stream ended with frames still missing ({stream.next_seq} of {frames or stream.received} appended)")
+    with stream_sessions_lock:
+        if stream_sessions.get(request.sid) is stream:
+            del stream_sessions[request.sid]
+    try:
+        window_samples = int(STREAM_WINDOW_S * STREAM_SAMPLE_RATE)
+        with stream.decode_lock:
+            while len(stream.samples) > window_samples:
+                stream_step(stream)
+            stream_step(stream, final=True)
+        if stream.dropped_samples:
+            logger.warning(f"Stream fell behind and dropped {stream.dropped_samples / STREAM_SAMPLE_RATE:.1f}s of audio")
+        original = stream.committed_text
+        translated = stream.translated_text
+        user = socket_user()
+        if original and translated and user:
+            save_history(user, stream.detected_lang, stream.target_lang, original, translated)
+        emit('transcription_result', {
+            'original': original or "No speech detected",
+            'translated': translated,
+            'language': stream.target_lang,
+            'success': True,
+            'tiers': stream.last_tiers,
+            'timings': {stage: round(ms, 1) for stage, ms in stream.timings.items()},
+        })
+    except Exception as e:
+        logger.error(f"Error finishing stream: {e}")
+        ERRORS.inc(stage='stream_end', type=type(e).__name__)
         emit('error', {'message': f'Processing error: {str(e)}'})
 
 # ----- Main -----
 if __name__ == '__main__':
-    logger.info("Loading models...")
-    load_models()
+    # docker stop sends SIGTERM; exit normally so atexit flushes history and caches
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    threading.Thread(target=ensure_history_indexes, name="history-indexes", daemon=True).start()
+    threading.Thread(target=resume_transcription_jobs, name="transcription-resume", daemon=True).start()
+    if model_pool and INFERENCE_PRELOAD:
+        logger.info(f"Preloading models, then forking {INFERENCE_WORKERS} model worker process(es)...")
+        start_model_loading(then=model_pool.start)
+    elif model_pool:
+        logger.info(f"Starting {INFERENCE_WORKERS} model worker process(es)...")
+        model_pool.start()
+    else:
+        logger.info("Loading models in the background...")
+        start_model_loading()
     logger.info("Starting Flask-SocketIO server on http://0.0.0.0:5000")
     # Running with the Werkzeug reloader or debug mode can cause WSGI
     # lifecycle issues when using Flask-SocketIO with certain async modes
@@ -0,0 +1,862 @@
+"""
+Benchmarks for the audio pipeline in app.py.
+
+Usage:
+    python benchmark.py decode [--seconds 5] [--iterations 50]
+    python benchmark.py precision --manifest samples/manifest.jsonl [--precisions fp32 int8]
+    python benchmark.py pipeline [--models stub|real] [--output results.json] [--baseline baseline.json]
+    python benchmark.py serve [--models stub|real] [--port 5000]
+    python benchmark.py load [--url http://127.0.0.1:5000] [--concurrency 1 2 4 8 16] [--rate 0.5] [--corpus DIR]
+
+The decode benchmark compares the old tempfile-based decode + ASR hand-off
+(WebM -> temp file -> ffmpeg -> temp WAV -> torchaudio, then array -> temp WAV
+for the pipeline) against the in-memory path used by process_webm_audio and
+transcribe_audio. No models are loaded.
+
+The precision benchmark loads the real models once per INFERENCE_PRECISION
+(each in its own process, so RSS is comparable) and reports WER/BLEU, the
+drift of each precision against the first one, and ASR/MT latency and model
+memory. The manifest is a JSON-lines file of local samples:
+
+    {"audio": "clip01.wav", "reference": "expected transcript",
+     "source_lang": "en", "target_lang": "es", "translation_reference": "..."}
+
+Audio paths are relative to the manifest; translation_reference is optional.
+No sample set ships with the repo, since WER and drift only mean something
+on real speech: record a few dozen clips in the languages you serve, write
+their reference transcripts, and keep that set fixed between runs.
+
+The pipeline benchmark times each stage (decode, VAD, ASR, translation) on
+its own and end to end, over deterministic synthetic WebM/Opus (needs
+ffmpeg) and WAV inputs of several lengths. --models stub swaps in a
+length-proportional ASR stand-in and a tiny random M2M100, so it runs on a
+CPU box with no network; --models real loads the configured tiers. Each
+case reports p50/p95/p99 latency, throughput, peak RSS and the tracemalloc
+peak (Python and NumPy allocations; torch's allocator is not traced).
+--output writes the results as JSON; --baseline compares against an
+earlier results file and exits non-zero when a case got slower than
+--tolerance allows.
+
+The load benchmark drives a running server the way browsers do: each client
+logs in through /login (--register creates the accounts first, one per
+client unless --users says otherwise) and opens its own Socket.IO
+connection, then replays audio_chunk events from a corpus - the .webm/.ogg/
+.wav files in --corpus, or synthetic WebM utterances of --seconds - as a
+Poisson process of --rate utterances per second. Arrivals don't wait for
+replies, so an overloaded server shows up as queueing latency, busy
+replies and drops (no result within --timeout) rather than as a slower
+client. The server keeps only each socket's newest utterance waiting, so a
+request still queued when the same client sends the next one is cancelled;
+those are counted as superseded, and keeping --rate below one utterance per
+expected latency models a single speaker. Each concurrency level runs for --duration seconds and reports
+connect time, end-to-end latency percentiles, errors and throughput; the
+saturation point is the first level whose p99 exceeds --sla-ms or whose
+errors, busy, superseded and dropped requests exceed --max-failure-rate. Requests bypass
+the result cache unless --use-result-cache is given. For a soak test, run
+one level for a long --duration and watch the p99 drift across --window.
+`serve --models stub` runs app.py with the stub models (INFERENCE_WORKERS=0)
+so the whole loop works offline; logins still need MongoDB.
+"""
+import argparse
+import importlib.util
+import io
+import json
+import math
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+import unicodedata
+from collections import Counter
+
+import numpy as np
+import requests
+import socketio
+import soundfile as sf
+import torch
+import torchaudio
+from transformers import BatchEncoding, M2M100Config, M2M100ForConditionalGeneration
+
+import app
+
+
+def synthetic_audio(seconds, sample_rate=48000, seed=0):
+    """Deterministic speech-like signal: a few harmonics with an envelope and noise."""
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    envelope = 0.5 * (1 + np.sin(2 * np.pi * 3 * t))
+    signal = sum(np.sin(2 * np.pi * f * t) / (i + 1) for i, f in enumerate((180, 360, 720, 1440)))
+    signal = 0.3 * envelope * signal + 0.01 * rng.standard_normal(len(t))
+    return signal.astype(np.float32), sample_rate
+
+
+def encode_input(samples, sample_rate, container=None):
+    """Encode to WebM/Opus when ffmpeg exists (or container='wav' is asked for), otherwise WAV bytes."""
+    wav = io.BytesIO()
+    sf.write(wav, samples, sample_rate, format='WAV')
+    if container == 'wav' or not app.check_ffmpeg():
+        return wav.getvalue(), 'wav'
+    result = subprocess.run(
+        ['ffmpeg', '-hide_banner', '-loglevel', 'error', '-i', 'pipe:0', '-fflags', '+bitexact',
+         '-c:a', 'libopus', '-b:a', '16k', '-f', 'webm', 'pipe:1'],
+        input=wav.getvalue(), stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True
+    )
+    return result.stdout, 'webm'
+
+
+def legacy_decode(audio_data):
+    """The tempfile-based decode path that process_webm_audio used to take."""
+    with tempfile.NamedTemporaryFile(suffix='.webm', delete=False) as tmp:
+        tmp_name = tmp.name
+        tmp.write(audio_data)
+    wav_name = tmp_name.replace('.webm', '.wav')
+    try:
+        if app.check_ffmpeg():
+            subprocess.run(
+                ['ffmpeg', '-i', tmp_name, '-ar', '16000', '-ac', '1', '-f', 'wav', '-y', wav_name],
+                stdout=subprocess.PIPE, stderr=subprocess.PIPE, timeout=10, check=True
+            )
+            waveform, _ = torchaudio.load(wav_name)
+            return waveform.mean(dim=0).numpy().astype(np.float32)
+        waveform, sample_rate = torchaudio.load(tmp_name)
+        waveform = waveform.mean(dim=0, keepdim=True)
+        if sample_rate != 16000:
+            waveform = torchaudio.transforms.Resample(orig_freq=sample_rate, new_freq=16000)(waveform)
+        return waveform.squeeze(0).numpy().astype(np.float32)
+    finally:
+        for name in (tmp_name, wav_name):
+            if os.path.exists(name):
+                os.unlink(name)
+
+
+def legacy_handoff(samples):
+    """The temp WAV round trip transcribe_audio used to make before calling the pipeline."""
+    with tempfile.NamedTemporaryFile(suffix='.wav', delete=False) as tmp:
+        tmp_name = tmp.name
+    try:
+        sf.write(tmp_name, samples, 16000, format='WAV')
+        data, _ = sf.read(tmp_name, dtype='float32')
+        return data
+    finally:
+        os.unlink(tmp_name)
+
+
+def inmemory_handoff(samples):
+    """What transcribe_audio hands to the pipeline now."""
+    return {"raw": np.asarray(samples, dtype=np.float32), "sampling_rate": 16000}
+
+
+def time_call(fn, arg, iterations):
+    fn(arg)  # warm caches (resampler kernels, page cache) outside the timed loop
+    timings = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn(arg)
+        timings.append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def summarize(timings):
+    ordered = sorted(timings)
+    return {
+        'mean_ms': statistics.fmean(ordered),
+        'p50_ms': ordered[len(ordered) // 2],
+        'p95_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))],
+        'p99_ms': ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))],
+    }
+
+
+def run_decode(args):
+    samples, sample_rate = synthetic_audio(args.seconds)
+    audio_data, container = encode_input(samples, sample_rate)
+    decoded, _ = app.process_webm_audio(audio_data)
+    print(f"Input: {args.seconds:.1f}s {container}, {len(audio_data)} bytes, "
+          f"ffmpeg={'yes' if app.check_ffmpeg() else 'no'}, iterations={args.iterations}")
+
+    legacy = [d + h for d, h in zip(time_call(legacy_decode, audio_data, args.iterations),
+                                    time_call(legacy_handoff, decoded, args.iterations))]
+    inmemory = [d + h for d, h in zip(time_call(lambda data: app.process_webm_audio(data)[0], audio_data, args.iterations),
+                                      time_call(inmemory_handoff, decoded, args.iterations))]
+
+    legacy_stats, inmemory_stats = summarize(legacy), summarize(inmemory)
+    print(f"{'path':<12}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    for name, stats in (('tempfile', legacy_stats), ('in-memory', inmemory_stats)):
+        print(f"{name:<12}{stats['mean_ms']:>10.2f}{stats['p50_ms']:>10.2f}{stats['p95_ms']:>10.2f}")
+    saving = legacy_stats['mean_ms'] - inmemory_stats['mean_ms']
+    print(f"Per-request saving: {saving:.2f} ms ({100 * saving / legacy_stats['mean_ms']:.1f}%)")
+
+
+def _proc_status_mb(field):
+    try:
+        with open('/proc/self/status') as f:
+            for line in f:
+                if line.startswith(f'{field}:'):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def rss_mb():
+    """Current resident set size of this process in MB (Linux)."""
+    return _proc_status_mb('VmRSS')
+
+
+def peak_rss_mb():
+    """Peak resident set size in MB since the last reset_peak_rss() (Linux), else since start."""
+    return _proc_status_mb('VmHWM')
+
+
+def reset_peak_rss():
+    try:
+        with open('/proc/self/clear_refs', 'w') as f:
+            f.write('5')
+    except OSError:
+        pass
+
+
+def _tokens(text, lang):
+    """Lower-cased, punctuation-free words (characters for unspaced scripts)."""
+    # Strip punctuation/symbols by category; \W would also drop Indic vowel signs
+    text = ''.join(' ' if unicodedata.category(ch)[0] in 'PS' else ch for ch in text.lower())
+    if lang in app.UNSPACED_LANGUAGES:
+        return [ch for ch in text if not ch.isspace()]
+    return text.split()
+
+
+def word_error_rate(references, hypotheses, langs):
+    errors = words = 0
+    for reference, hypothesis, lang in zip(references, hypotheses, langs):
+        ref, hyp = _tokens(reference, lang), _tokens(hypothesis, lang)
+        row = list(range(len(hyp) + 1))
+        for i, ref_token in enumerate(ref, 1):
+            previous, row[0] = row[0], i
+            for j, hyp_token in enumerate(hyp, 1):
+                previous, row[j] = row[j], min(row[j] + 1, row[j - 1] + 1, previous + (ref_token != hyp_token))
+        errors += row[-1]
+        words += len(ref)
+    return errors / words if words else 0.0
+
+
+def corpus_bleu(references, hypotheses, langs, max_n=4):
+    """Corpus BLEU (0-100) with add-one smoothing for the higher n-gram orders."""
+    matches, totals = [0] * max_n, [0] * max_n
+    ref_length = hyp_length = 0
+    for reference, hypothesis, lang in zip(references, hypotheses, langs):
+        ref, hyp = _tokens(reference, lang), _tokens(hypothesis, lang)
+        ref_length += len(ref)
+        hyp_length += len(hyp)
+        for n in range(1, max_n + 1):
+            ref_ngrams = Counter(tuple(ref[i:i + n]) for i in range(len(ref) - n + 1))
+            hyp_ngrams = Counter(tuple(hyp[i:i + n]) for i in range(len(hyp) - n + 1))
+            matches[n - 1] += sum(min(count, ref_ngrams[gram]) for gram, count in hyp_ngrams.items())
+            totals[n - 1] += max(len(hyp) - n + 1, 0)
+    if not hyp_length or not matches[0]:
+        return 0.0
+    log_precision = sum(
+        math.log((matches[n] + (n > 0)) / (totals[n] + (n > 0))) for n in range(max_n)
+    ) / max_n
+    brevity = min(0.0, 1 - ref_length / hyp_length)
+    return 100 * math.exp(log_precision + brevity)
+
+
+def load_manifest(path):
+    if not os.path.exists(path):
+        raise SystemExit(f"Manifest not found: {path} (see the module docstring for its format)")
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path, encoding='utf-8') as f:
+        samples = [json.loads(line) for line in f if line.strip()]
+    for sample in samples:
+        sample['audio'] = os.path.join(base, sample['audio'])
+    return samples
+
+
+def run_precision_worker(args):
+    """Runs inside a child process with INFERENCE_PRECISION already set; prints one JSON line."""
+    samples = load_manifest(args.manifest)
+    audio = []
+    for sample in samples:
+        with open(sample['audio'], 'rb') as f:
+            audio.append(app.process_webm_audio(f.read())[0])
+
+    baseline_rss = rss_mb()
+    app.load_asr_model()
+    app.load_translation_model()
+    if app.asr_pipeline is None or app.m2m_model is None:
+        raise SystemExit(f"Model loading failed: {app.model_states}")
+    model_rss = rss_mb() - baseline_rss
+
+    transcripts, translations, asr_ms, mt_ms = [], [], [], []
+    for sample, samples_16k in zip(samples, audio):
+        start = time.perf_counter()
+        text = app.asr_pipeline({"raw": samples_16k, "sampling_rate": app.TARGET_SAMPLE_RATE}).get("text", "").strip()
+        asr_ms.append((time.perf_counter() - start) * 1000)
+        start = time.perf_counter()
+        translated = app._generate_rows([(text, sample['target_lang'])], sample['source_lang'])[0] if text else ""
+        mt_ms.append((time.perf_counter() - start) * 1000)
+        transcripts.append(text)
+        translations.append(translated)
+
+    print(json.dumps({
+        'precision': app.INFERENCE_PRECISION,
+        'model_rss_mb': model_rss,
+        'asr_ms': asr_ms,
+        'mt_ms': mt_ms,
+        'transcripts': transcripts,
+        'translations': translations,
+    }, ensure_ascii=False))
+
+
+def run_precision(args):
+    if args.worker:
+        return run_precision_worker(args)
+    samples = load_manifest(args.manifest)
+    source_langs = [sample['source_lang'] for sample in samples]
+    target_langs = [sample['target_lang'] for sample in samples]
+    with_translation_refs = [i for i, sample in enumerate(samples) if sample.get('translation_reference')]
+
+    runs = {}
+    for precision in args.precisions:
+        print(f"Loading models with INFERENCE_PRECISION={precision}...", file=sys.stderr)
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), 'precision', '--manifest', args.manifest, '--worker'],
+            env={**os.environ, 'INFERENCE_PRECISION': precision},
+            stdout=subprocess.PIPE, text=True, check=True
+        )
+        runs[precision] = json.loads(proc.stdout.strip().splitlines()[-1])
+
+    baseline = runs[args.precisions[0]]
+    report = {}
+    for precision, run in runs.items():
+        report[precision] = {
+            'wer': word_error_rate([s['reference'] for s in samples], run['transcripts'], source_langs),
+            'bleu': corpus_bleu(
+                [samples[i]['translation_reference'] for i in with_translation_refs],
+                [run['translations'][i] for i in with_translation_refs],
+                [target_langs[i] for i in with_translation_refs]
+            ) if with_translation_refs else None,
+            'wer_vs_baseline': word_error_rate(baseline['transcripts'], run['transcripts'], source_langs),
+            'bleu_vs_baseline': corpus_bleu(baseline['translations'], run['translations'], target_langs),
+            'asr_p50_ms': statistics.median(run['asr_ms']),
+            'mt_p50_ms': statistics.median(run['mt_ms']),
+            'model_rss_mb': run['model_rss_mb'],
+        }
+
+    print(f"{len(samples)} samples from {args.manifest}; baseline = {args.precisions[0]}")
+    print(f"{'precision':<10}{'WER':>8}{'BLEU':>8}{'dWER':>8}{'BLEU/base':>11}{'ASR p50':>10}{'MT p50':>9}{'RSS MB':>9}")
+    for precision, row in report.items():
+        bleu = f"{row['bleu']:.1f}" if row['bleu'] is not None else '-'
+        print(f"{precision:<10}{row['wer']:>8.3f}{bleu:>8}{row['wer_vs_baseline']:>8.3f}{row['bleu_vs_baseline']:>11.1f}"
+              f"{row['asr_p50_ms']:>10.0f}{row['mt_p50_ms']:>9.0f}{row['model_rss_mb']:>9.0f}")
+    base = report[args.precisions[0]]
+    for precision, row in list(report.items())[1:]:
+        print(f"{precision} vs {args.precisions[0]}: ASR {base['asr_p50_ms'] / row['asr_p50_ms']:.2f}x, "
+              f"MT {base['mt_p50_ms'] / row['mt_p50_ms']:.2f}x, RSS {base['model_rss_mb'] - row['model_rss_mb']:+.0f} MB saved")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({'report': report, 'runs': runs}, f, ensure_ascii=False, indent=2)
+
+
+SAMPLE_TEXT = (
+    "Good morning everyone and thank you for joining the call. "
+    "Today we will review the release schedule for the next quarter. "
+    "Please send me your questions before Friday so we can answer them in writing. "
+    "The new dashboard should make it easier to follow the translations live."
+)
+
+
+def sample_text(seconds):
+    """About 2.5 words per second of speech, cut from SAMPLE_TEXT and repeated as needed."""
+    words = SAMPLE_TEXT.split()
+    count = max(1, int(seconds * 2.5))
+    return " ".join(words[i % len(words)] for i in range(count))
+
+
+class StubASR:
+    """Stands in for the Whisper pipeline: no weights, but its cost and output grow with the audio."""
+
+    def __call__(self, inputs, batch_size=None, generate_kwargs=None):
+        single = isinstance(inputs, dict)
+        results = []
+        for item in ([inputs] if single else inputs):
+            samples = np.asarray(item['raw'], dtype=np.float32)
+            if len(samples) >= 400:
+                # A log-spectrogram front end, like the feature extractor's share of the real work
+                frames = np.lib.stride_tricks.sliding_window_view(samples, 400)[::160]
+                np.log1p(np.abs(np.fft.rfft(frames * np.hanning(400), axis=1)))
+            results.append({'text': sample_text(len(samples) / app.TARGET_SAMPLE_RATE), 'language': 'en'})
+        return results[0] if single else results
+
+
+class StubTokenizer:
+    """Byte-level stand-in for M2M100Tokenizer, sized for the stub translation model."""
+    languages = sorted(set(app.AVAILABLE_LANGUAGES.values()))
+
+    def __init__(self):
+        self.src_lang = 'en'
+
+    def get_lang_id(self, lang):
+        return 260 + self.languages.index(lang)
+
+    def __call__(self, texts, return_tensors=None, padding=False):
+        texts = [texts] if isinstance(texts, str) else texts
+        rows = [[self.get_lang_id(self.src_lang)] + [4 + b for b in text.encode('utf-8')[:200]] + [2] for text in texts]
+        width = max(len(row) for row in rows)
+        input_ids = torch.tensor([row + [1] * (width - len(row)) for row in rows])
+        return BatchEncoding({'input_ids': input_ids, 'attention_mask': (input_ids != 1).long()})
+
+    def batch_decode(self, tokens, skip_special_tokens=True):
+        return [bytes(int(t) - 4 for t in row if 4 <= int(t) < 260).decode('utf-8', errors='ignore') for row in tokens]
+
+
+def install_stub_models():
+    """Register the stubs as the largest ASR and MT tiers, as if they had just loaded."""
+    torch.manual_seed(0)
+    config = M2M100Config(
+        vocab_size=260 + len(StubTokenizer.languages), d_model=64, encoder_layers=2, decoder_layers=2,
+        encoder_attention_heads=4, decoder_attention_heads=4, encoder_ffn_dim=128, decoder_ffn_dim=128,
+        max_position_embeddings=256, pad_token_id=1, bos_token_id=0, eos_token_id=2, decoder_start_token_id=2
+    )
+    model = M2M100ForConditionalGeneration(config).to(app.device).eval()
+    model.generation_config.max_length = 64
+    asr_tier, mt_tier = app.ASR_TIERS[-1], app.MT_TIERS[-1]
+    app.asr_models[asr_tier] = app.asr_pipeline = StubASR()
+    app.mt_models[mt_tier] = (model, StubTokenizer())
+    app.m2m_model, app.m2m_tokenizer = app.mt_models[mt_tier]
+    app._set_model_state('asr', asr_tier, 'ready')
+    app._set_model_state('mt', mt_tier, 'ready')
+
+
+def measure(fn, iterations, audio_seconds):
+    """Latency percentiles and throughput over `iterations` calls, then peak RSS and allocations."""
+    fn()  # warm-up outside the timed loop
+    reset_peak_rss()
+    timings = []
+    started = time.perf_counter()
+    for _ in range(iterations):
+        start = time.perf_counter()
+        fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    elapsed = time.perf_counter() - started
+    peak_rss = peak_rss_mb()
+
+    # One extra traced call: tracemalloc slows everything down, so it stays out of the timings
+    tracemalloc.start()
+    fn()
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        **{key: round(value, 3) for key, value in summarize(timings).items()},
+        'iterations': iterations,
+        'throughput_per_s': round(iterations / elapsed, 2),
+        'audio_s_per_s': round(iterations * audio_seconds / elapsed, 2),
+        'peak_rss_mb': round(peak_rss, 1),
+        'alloc_peak_mb': round(peak / 2 ** 20, 2),
+        'alloc_retained_kb': round(retained / 1024, 1),
+    }
+
+
+def pipeline_cases(args):
+    """Yield (name, audio seconds, callable) for every requested stage, container and length."""
+    containers = [c for c in args.containers if c == 'wav' or app.check_ffmpeg()]
+    if len(containers) < len(args.containers):
+        print("ffmpeg not found: skipping WebM inputs", file=sys.stderr)
+
+    def translate(text):
+        app.translation_cache.clear()  # Time the model, not the cache
+        return app.translate_text(text, 'en', args.target_lang)
+
+    def end_to_end(audio_data, fmt):
+        samples, _ = app.decode_audio_payload(memoryview(audio_data), fmt)
+        segments = app.split_speech(samples)
+        text, lang = app.transcribe_segments(segments) if segments else ("", "en")
+        return translate(text) if text else ""
+
+    for seconds in args.seconds:
+        samples, sample_rate = synthetic_audio(seconds, seed=int(seconds * 1000))
+        inputs = {container: encode_input(samples, sample_rate, container) for container in containers}
+        decoded, _ = app.decode_audio_payload(memoryview(next(iter(inputs.values()))[0]), next(iter(inputs.values()))[1])
+        segments = app.split_speech(decoded) or [decoded]
+        text = sample_text(seconds)
+        for container, (audio_data, fmt) in inputs.items():
+            if 'decode' in args.stages:
+                yield f"decode/{container}/{seconds:g}s", seconds, lambda d=audio_data, f=fmt: app.decode_audio_payload(memoryview(d), f)
+            if 'e2e' in args.stages:
+                yield f"e2e/{container}/{seconds:g}s", seconds, lambda d=audio_data, f=fmt: end_to_end(d, f)
+        if 'vad' in args.stages:
+            yield f"vad/{seconds:g}s", seconds, lambda d=decoded: app.split_speech(d)
+        if 'asr' in args.stages:
+            yield f"asr/{seconds:g}s", seconds, lambda s=segments: app.transcribe_segments(s)
+        if 'translate' in args.stages:
+            yield f"translate/{seconds:g}s", seconds, lambda t=text: translate(t)
+
+
+def compare_results(baseline, results, tolerance):
+    """Print p50/p95 against a baseline run and return the cases that regressed beyond tolerance."""
+    if baseline.get('meta', {}).get('models') != results['meta']['models']:
+        print(f"Warning: baseline used {baseline.get('meta', {}).get('models')} models, this run {results['meta']['models']}")
+    regressions = []
+    print(f"{'case':<24}{'p50 base':>10}{'p50 now':>10}{'change':>9}{'p95 base':>10}{'p95 now':>10}{'change':>9}")
+    for name, row in results['results'].items():
+        base = baseline.get('results', {}).get(name)
+        if base is None:
+            print(f"{name:<24}{'(new case)':>20}")
+            continue
+        changes = [row[key] / base[key] - 1 if base[key] else 0.0 for key in ('p50_ms', 'p95_ms')]
+        flag = "  REGRESSION" if max(changes) > tolerance else ""
+        if flag:
+            regressions.append(name)
+        print(f"{name:<24}{base['p50_ms']:>10.2f}{row['p50_ms']:>10.2f}{changes[0]:>+9.1%}"
+              f"{base['p95_ms']:>10.2f}{row['p95_ms']:>10.2f}{changes[1]:>+9.1%}{flag}")
+    return regressions
+
+
+def run_pipeline(args):
+    if args.models == 'stub':
+        install_stub_models()
+    else:
+        app.load_models()
+        if not (app.asr_available() and app.translation_available()):
+            raise SystemExit(f"Model loading failed: {app.model_states}")
+
+    results = {
+        'meta': {
+            'models': args.models,
+            'asr_tier': app.ASR_TIERS[-1] if args.models == 'real' else 'stub',
+            'mt_tier': app.MT_TIERS[-1] if args.models == 'real' else 'stub',
+            'precision': app.INFERENCE_PRECISION,
+            'device': app.device,
+            'torch_threads': torch.get_num_threads(),
+            'ffmpeg': app.check_ffmpeg(),
+            'iterations': args.iterations,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': {},
+    }
+    print(f"{'case':<24}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}{'audio x':>9}{'RSS MB':>9}{'alloc MB':>10}")
+    for name, seconds, fn in pipeline_cases(args):
+        row = measure(fn, args.iterations, seconds)
+        results['results'][name] = row
+        print(f"{name:<24}{row['p50_ms']:>10.2f}{row['p95_ms']:>10.2f}{row['p99_ms']:>10.2f}{row['throughput_per_s']:>9.1f}"
+              f"{row['audio_s_per_s']:>9.1f}{row['peak_rss_mb']:>9.0f}{row['alloc_peak_mb']:>10.2f}")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Results written to {args.output}")
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare_results(baseline, results, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} case(s) slower than the baseline by more than {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+def run_serve(args):
+    """Run app.py's server, with the stub models when asked, for the load tool to hit offline."""
+    if args.models == 'stub':
+        if app.model_pool:
+            raise SystemExit("--models stub needs INFERENCE_WORKERS=0: model workers load their own models")
+        install_stub_models()
+    elif app.model_pool and app.INFERENCE_PRELOAD:
+        app.start_model_loading(then=app.model_pool.start)
+    elif app.model_pool:
+        app.model_pool.start()
+    else:
+        app.start_model_loading()
+    threading.Thread(target=app.ensure_history_indexes, name="history-indexes", daemon=True).start()
+    print(f"Serving with {args.models} models on http://{args.host}:{args.port}")
+    app.socketio.run(app.app, host=args.host, port=args.port, debug=False, use_reloader=False, allow_unsafe_werkzeug=True)
+
+
+def load_corpus(args):
+    """(name, bytes, format) per utterance: the audio files in --corpus, else synthetic clips of --seconds."""
+    utterances = []
+    if args.corpus:
+        for name in sorted(os.listdir(args.corpus)):
+            fmt = os.path.splitext(name)[1].lower().lstrip('.')
+            if fmt in ('webm', 'ogg', 'wav'):
+                with open(os.path.join(args.corpus, name), 'rb') as f:
+                    utterances.append((name, f.read(), fmt))
+        if not utterances:
+            raise SystemExit(f"No .webm, .ogg or .wav files in {args.corpus}")
+    else:
+        for seconds in args.seconds:
+            # 16 kHz keeps the WAV fallback's payloads well under the server's message size limit
+            samples, sample_rate = synthetic_audio(seconds, sample_rate=app.TARGET_SAMPLE_RATE, seed=int(seconds * 1000))
+            audio_data, fmt = encode_input(samples, sample_rate)
+            utterances.append((f"synthetic-{seconds:g}s", audio_data, fmt))
+        if fmt == 'wav':
+            print("ffmpeg not found: replaying WAV instead of WebM", file=sys.stderr)
+    # The polling transport base64-encodes binary, and the server drops clients sending over 1 MB messages
+    oversized = [name for name, audio_data, _ in utterances if len(audio_data) * 4 / 3 > 1_000_000]
+    if oversized:
+        print(f"Warning: {', '.join(oversized)} may exceed the server's 1 MB message limit", file=sys.stderr)
+    return utterances
+
+
+def login(url, username, password, register=False):
+    """Log in through /login (after /register if asked) and return the session Cookie header."""
+    http = requests.Session()
+    form = {'username': username, 'password': password}
+    if register:
+        http.post(f"{url}/register", data=form, allow_redirects=False, timeout=30)
+    response = http.post(f"{url}/login", data=form, allow_redirects=False, timeout=30)
+    # A successful login redirects to the dashboard, a failed one back to /login
+    if response.status_code != 302 or '/login' in response.headers.get('Location', ''):
+        raise SystemExit(f"Login failed for {username} (use --register to create the load-test accounts)")
+    return "; ".join(f"{cookie.name}={cookie.value}" for cookie in http.cookies)
+
+
+class LoadClient:
+    """One Socket.IO connection replaying the corpus as a Poisson arrival process and timing each reply."""
+
+    def __init__(self, index, cookie, utterances, args):
+        self.index = index
+        self.cookie = cookie
+        self.utterances = utterances
+        self.args = args
+        self.sio = socketio.Client(reconnection=False)
+        self.lock = threading.Lock()
+        self.pending = {}  # request_id -> (send time, seconds into the run), oldest first
+        self.latencies = []  # (seconds into the run, latency ms)
+        self.counts = Counter()
+        self.connect_ms = None
+        self.sio.on('transcription_result', lambda data: self._on_reply(data, 'ok'))
+        self.sio.on('busy', lambda data: self._on_reply(data, 'busy'))
+        self.sio.on('error', lambda data: self._on_reply(data, 'errors'))
+        self.sio.on('cancelled', lambda data: self._on_reply(data, 'superseded'))
+
+    def connect(self):
+        start = time.perf_counter()
+        try:
+            # Without websocket-client only polling works; ask for it rather than log a failed upgrade per connection
+            transports = None if importlib.util.find_spec('websocket') else ['polling']
+            self.sio.connect(self.args.url, headers={'Cookie': self.cookie}, transports=transports, wait_timeout=self.args.timeout)
+            self.connect_ms = (time.perf_counter() - start) * 1000
+        except Exception as e:
+            self.counts['connect_failures'] += 1
+            print(f"client {self.index}: connect failed: {e}", file=sys.stderr)
+
+    def _on_reply(self, data, outcome):
+        now = time.perf_counter()
+        with self.lock:
+            sent = self.pending.pop((data or {}).get('request_id'), None)
+            if sent is None:
+                # Not ours to time: late replies already counted as dropped, or errors on the connection itself
+                self.counts['untagged_' + outcome] += 1
+                return
+            self.counts[outcome] += 1
+            if outcome == 'ok':
+                self.latencies.append((sent[1], (now - sent[0]) * 1000))
+
+    def run(self, started, duration):
+        """Send until the duration is up; arrivals don't wait on replies, so a slow server builds a backlog."""
+        rng = random.Random(self.index)
+        next_at = started + rng.expovariate(self.args.rate)
+        sent = 0
+        while self.sio.connected and next_at < started + duration:
+            time.sleep(max(0.0, next_at - time.perf_counter()))
+            name, audio_data, fmt = rng.choice(self.utterances)
+            request_id = f"{self.index}-{sent}"
+            with self.lock:
+                self.pending[request_id] = (time.perf_counter(), next_at - started)
+            try:
+                self.sio.emit('audio_chunk', {
+                    'audio': audio_data, 'format': fmt, 'target_lang': self.args.target_lang,
+                    'request_id': request_id, 'no_cache': not self.args.use_result_cache,
+                })
+            except Exception:
+                with self.lock:
+                    self.pending.pop(request_id, None)
+                self.counts['errors'] += 1
+            sent += 1
+            self.counts['sent'] += 1
+            next_at += rng.expovariate(self.args.rate)
+
+    def finish(self):
+        """Count what is still unanswered, or was answered after --timeout, as dropped."""
+        with self.lock:
+            self.counts['dropped'] += len(self.pending)
+            self.pending.clear()
+            late = [row for row in self.latencies if row[1] > self.args.timeout * 1000]
+            self.counts['dropped'] += len(late)
+            self.counts['ok'] -= len(late)
+            self.latencies = [row for row in self.latencies if row[1] <= self.args.timeout * 1000]
+        if self.sio.connected:
+            self.sio.disconnect()
+
+
+def run_level(concurrency, cookies, utterances, args):
+    """Connect `concurrency` clients at once, replay for --duration seconds, drain, and summarize."""
+    clients = [LoadClient(i, cookies[i % len(cookies)], utterances, args) for i in range(concurrency)]
+    connecting = [threading.Thread(target=client.connect) for client in clients]
+    for thread in connecting:
+        thread.start()
+    for thread in connecting:
+        thread.join()
+
+    started = time.perf_counter()
+    senders = [threading.Thread(target=client.run, args=(started, args.duration)) for client in clients]
+    for thread in senders:
+        thread.start()
+    for thread in senders:
+        thread.join()
+    drain_until = time.perf_counter() + args.timeout
+    while time.perf_counter() < drain_until and any(client.pending for client in clients):
+        time.sleep(0.05)
+    elapsed = time.perf_counter() - started
+    for client in clients:
+        client.finish()
+
+    counts = sum((client.counts for client in clients), Counter())
+    latencies = [row for client in clients for row in client.latencies]
+    connect_ms = [client.connect_ms for client in clients if client.connect_ms is not None]
+    failed = counts['errors'] + counts['busy'] + counts['superseded'] + counts['dropped']
+    row = {
+        'concurrency': concurrency,
+        'offered_per_s': round(concurrency * args.rate, 2),
+        **{key: counts[key] for key in ('sent', 'ok', 'errors', 'busy', 'superseded', 'dropped', 'connect_failures')},
+        'failure_rate': round(failed / counts['sent'], 4) if counts['sent'] else 0.0,
+        'throughput_per_s': round(counts['ok'] / elapsed, 2),
+        'latency': {key: round(value, 1) for key, value in summarize([ms for _, ms in latencies]).items()} if latencies else None,
+        'connect': {key: round(value, 1) for key, value in summarize(connect_ms).items()} if connect_ms else None,
+        'windows': [],
+    }
+    # Per-window percentiles show drift over a long (soak) run: leaks, cache growth, queue build-up
+    for start in range(0, int(math.ceil(args.duration)), args.window):
+        window = [ms for at, ms in latencies if start <= at < start + args.window]
+        row['windows'].append({'start_s': start, 'ok': len(window),
+                               **({key: round(value, 1) for key, value in summarize(window).items()} if window else {})})
+    try:
+        row['health'] = requests.get(f"{args.url}/health", timeout=10).json()
+    except Exception:
+        pass
+    return row
+
+
+def saturation_point(levels, sla_ms, max_failure_rate):
+    """(last level within the SLA, first level past it): p99 over sla_ms or too many failed requests."""
+    sustained = None
+    for row in levels:
+        p99 = row['latency']['p99_ms'] if row['latency'] else float('inf')
+        if p99 > sla_ms or row['failure_rate'] > max_failure_rate:
+            return sustained, row
+        sustained = row
+    return sustained, None
+
+
+def run_load(args):
+    args.url = args.url.rstrip('/')
+    utterances = load_corpus(args)
+    accounts = args.users or max(args.concurrency)
+    print(f"Logging in {accounts} account(s) as {args.user_prefix}0..{accounts - 1}")
+    cookies = [login(args.url, f"{args.user_prefix}{i}", args.password, args.register) for i in range(accounts)]
+    print(f"Corpus: {len(utterances)} utterance(s) ({', '.join(name for name, _, _ in utterances[:5])}"
+          f"{', ...' if len(utterances) > 5 else ''}); {args.rate:g} utterance(s)/s per client for {args.duration:g}s per level")
+
+    levels = []
+    print(f"{'clients':>8}{'offered/s':>10}{'sent':>7}{'ok':>7}{'errors':>7}{'busy':>7}{'superseded':>11}{'dropped':>8}"
+          f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'ok/s':>8}{'conn p95':>9}")
+    for concurrency in sorted(args.concurrency):
+        row = run_level(concurrency, cookies, utterances, args)
+        levels.append(row)
+        latency = row['latency'] or {'p50_ms': float('nan'), 'p95_ms': float('nan'), 'p99_ms': float('nan')}
+        connect_p95 = row['connect']['p95_ms'] if row['connect'] else float('nan')
+        print(f"{concurrency:>8}{row['offered_per_s']:>10.2f}{row['sent']:>7}{row['ok']:>7}{row['errors']:>7}{row['busy']:>7}"
+              f"{row['superseded']:>11}{row['dropped']:>8}{latency['p50_ms']:>9.0f}{latency['p95_ms']:>9.0f}{latency['p99_ms']:>9.0f}"
+              f"{row['throughput_per_s']:>8.2f}{connect_p95:>9.0f}")
+        windows = [window for window in row['windows'] if window['ok']]
+        if len(windows) > 1:
+            drift = " ".join(f"{window['p99_ms']:.0f}" for window in windows)
+            print(f"{'':>8}p99 by {args.window}s window: {drift}")
+
+    sustained, saturated = saturation_point(levels, args.sla_ms, args.max_failure_rate)
+    if saturated is None:
+        print(f"No saturation up to {levels[-1]['concurrency']} clients (p99 <= {args.sla_ms:g} ms, "
+              f"failures <= {args.max_failure_rate:.0%})")
+    else:
+        print(f"Saturation at {saturated['concurrency']} clients ({saturated['offered_per_s']:g} utterances/s offered); "
+              f"last level within p99 <= {args.sla_ms:g} ms and failures <= {args.max_failure_rate:.0%}: "
+              f"{sustained['concurrency'] if sustained else 'none'}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump({
+                'meta': {'url': args.url, 'rate_per_client': args.rate, 'duration_s': args.duration, 'timeout_s': args.timeout,
+                         'sla_ms': args.sla_ms, 'corpus': [name for name, _, _ in utterances],
+                         'result_cache': args.use_result_cache, 'created': time.strftime('%Y-%m-%dT%H:%M:%S')},
+                'levels': levels,
+                'saturation': {'sustained_concurrency': sustained['concurrency'] if sustained else None,
+                               'saturated_concurrency': saturated['concurrency'] if saturated else None},
+            }, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    decode = subparsers.add_parser('decode', help='tempfile vs in-memory decode and ASR hand-off')
+    decode.add_argument('--seconds', type=float, default=5.0, help='length of the synthetic utterance')
+    decode.add_argument('--iterations', type=int, default=50)
+    decode.set_defaults(func=run_decode)
+
+    precision = subparsers.add_parser('precision', help='fp32 vs int8 accuracy drift, latency and memory on real models')
+    precision.add_argument('--manifest', required=True, help='JSON-lines sample set of local clips (see module docstring)')
+    precision.add_argument('--precisions', nargs='+', default=['fp32', 'int8'], help='first one is the baseline')
+    precision.add_argument('--output', help='write the full report and raw outputs as JSON')
+    precision.add_argument('--worker', action='store_true', help=argparse.SUPPRESS)
+    precision.set_defaults(func=run_precision)
+
+    bench = subparsers.add_parser('pipeline', help='per-stage and end-to-end latency, throughput and memory')
+    bench.add_argument('--models', choices=['stub', 'real'], default='stub')
+    bench.add_argument('--seconds', type=float, nargs='+', default=[1.0, 5.0, 15.0], help='utterance lengths')
+    bench.add_argument('--containers', nargs='+', choices=['webm', 'wav'], default=['webm', 'wav'])
+    bench.add_argument('--stages', nargs='+', choices=['decode', 'vad', 'asr', 'translate', 'e2e'],
+                       default=['decode', 'vad', 'asr', 'translate', 'e2e'])
+    bench.add_argument('--iterations', type=int, default=20)
+    bench.add_argument('--target-lang', default='es')
+    bench.add_argument('--output', help='write the results as JSON')
+    bench.add_argument('--baseline', help='results JSON from an earlier run to compare against')
+    bench.add_argument('--tolerance', type=float, default=0.15, help='allowed p50/p95 slowdown before failing')
+    bench.set_defaults(func=run_pipeline)
+
+    serve = subparsers.add_parser('serve', help='run the app server, with stub models for offline load tests')
+    serve.add_argument('--models', choices=['stub', 'real'], default='stub')
+    serve.add_argument('--host', default='127.0.0.1')
+    serve.add_argument('--port', type=int, default=5000)
+    serve.set_defaults(func=run_serve)
+
+    load = subparsers.add_parser('load', help='Socket.IO load test: latency vs concurrency and the saturation point')
+    load.add_argument('--url', default='http://127.0.0.1:5000')
+    load.add_argument('--user-prefix', default='loadtest', help='accounts are <prefix>0, <prefix>1, ...')
+    load.add_argument('--password', default='loadtest')
+    load.add_argument('--users', type=int, default=0, help='accounts to spread clients over (default: one per client)')
+    load.add_argument('--register', action='store_true', help='register the accounts before logging in')
+    load.add_argument('--corpus', help='directory of recorded .webm/.ogg/.wav utterances to replay')
+    load.add_argument('--seconds', type=float, nargs='+', default=[2.0, 4.0, 8.0], help='synthetic utterance lengths')
+    load.add_argument('--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16], help='client counts, one level each')
+    load.add_argument('--rate', type=float, default=0.5, help='utterances per second per client (Poisson arrivals)')
+    load.add_argument('--duration', type=float, default=30.0, help='seconds of arrivals per level')
+    load.add_argument('--timeout', type=float, default=30.0, help='seconds before a reply counts as dropped')
+    load.add_argument('--window', type=int, default=60, help='seconds per drift window in long runs')
+    load.add_argument('--target-lang', default='es')
+    load.add_argument('--use-result-cache', action='store_true', help="let repeated utterances hit the server's result cache")
+    load.add_argument('--sla-ms', type=float, default=5000.0, help='p99 latency a level must stay under')
+    load.add_argument('--max-failure-rate', type=float, default=0.01, help='share of errors, busy, superseded and dropped requests allowed')
+    load.add_argument('--output', help='write every level as JSON')
+    load.set_defaults(func=run_load)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -5,8 +5,10 @@ import axios from "axios";
 import "./Dashboard.css";
 
 function Dashboard({ user, onLogout }) {
-  const [sourceLang, setSourceLang] = useState("en");
+  const [sourceLang, setSourceLang] = useState("auto");
   const [targetLang, setTargetLang] = useState("es");
+  // Streamed translations arrive word by word but are decoded greedily (no beam search)
+  const [streamTranslation, setStreamTranslation] = useState(false);
   const [isRecording, setIsRecording] = useState(false);
   const [originalText, setOriginalText] = useState(
     "Your original speech will appear here..."
@@ -16,6 +18,7 @@ function Dashboard({ user, onLogout }) {
   );
   const [availableLanguages, setAvailableLanguages] = useState({});
   const [translationHistory, setTranslationHistory] = useState([]);
+  const [historyCursor, setHistoryCursor] = useState(null);
   const [status, setStatus] = useState("Ready to start");
   const [loading, setLoading] = useState(false);
   const [isProcessing, setIsProcessing] = useState(false);
@@ -24,6 +27,8 @@ function Dashboard({ user, onLogout }) {
   const mediaRecorderRef = useRef(null);
   const streamRef = useRef(null);
   const audioContextRef = useRef(null);
+  // Sentences of the utterance being translated, filled in by translation_delta events
+  const partialRef = useRef({ original: [], translated: [] });
   const navigate = useNavigate();
 
   useEffect(() => {
@@ -50,6 +55,7 @@ function Dashboard({ user, onLogout }) {
         });
         if (historyResponse.data.history) {
           setTranslationHistory(historyResponse.data.history);
+          setHistoryCursor(historyResponse.data.next_cursor);
           console.log(
             "Loaded translation history:",
             historyResponse.data.history
@@ -109,6 +115,15 @@ function Dashboard({ user, onLogout }) {
         }
       });
 
+      socketRef.current.on("translation_delta", (data) => {
+        const partial = partialRef.current;
+        partial.original[data.index] = data.original;
+        partial.translated[data.index] =
+          (partial.translated[data.index] || "") + data.delta;
+        setOriginalText(partial.original.filter(Boolean).join(" "));
+        setTranslatedText(partial.translated.filter(Boolean).join(" "));
+      });
+
       socketRef.current.on("transcription_result", (data) => {
         console.log("Received transcription result:", data);
         if (data.success) {
@@ -122,32 +137,17 @@ function Dashboard({ user, onLogout }) {
           setIsProcessing(false);
           setStatus("Processing complete");
 
-          // Add to history and save to database
+          // The server saves finished results to history itself
           if (data.original && data.translated) {
             const historyItem = {
+              id: `local-${Date.now()}`,
               timestamp: new Date().toISOString(),
-              sourceLang: sourceLang,
+              sourceLang: data.source_lang || sourceLang,
               targetLang: targetLang,
               original: data.original,
               translated: data.translated,
             };
 
-            // Save to database
-            axios
-              .post("/api/translation_history", historyItem, {
-                withCredentials: true,
-              })
-              .then((response) => {
-                console.log("Translation saved successfully:", response.data);
-              })
-              .catch((err) => {
-                console.error("Failed to save translation:", {
-                  status: err.response?.status,
-                  data: err.response?.data,
-                  message: err.message,
-                });
-              });
-
             // Update local state
             setTranslationHistory((prev) =>
               [historyItem, ...prev].slice(0, 50)
@@ -160,6 +160,18 @@ function Dashboard({ user, onLogout }) {
         }
       });
 
+      // A newer recording replaced this one while it was queued; the newer one is still processing
+      socketRef.current.on("cancelled", (data) => {
+        console.log("Recording cancelled:", data);
+        setStatus(data.message);
+      });
+
+      socketRef.current.on("busy", (data) => {
+        setLoading(false);
+        setIsProcessing(false);
+        setStatus(`${data.message} (try again in ${data.retry_after_s}s)`);
+      });
+
       socketRef.current.on("error", (data) => {
         console.error("WebSocket error:", data);
         setLoading(false);
@@ -229,19 +241,22 @@ function Dashboard({ user, onLogout }) {
         setIsProcessing(true);
         setLoading(true);
         setStatus("Translating...");
+        partialRef.current = { original: [], translated: [] };
         const blob = new Blob(chunks, { type: "audio/webm" });
         chunks = [];
 
-        const reader = new FileReader();
-        reader.onload = () => {
+        // Send the WebM bytes as a binary attachment instead of a base64 data URL
+        blob.arrayBuffer().then((buffer) => {
           if (socketRef.current && socketRef.current.connected) {
             socketRef.current.emit("audio_chunk", {
-              audio: reader.result,
+              audio: buffer,
+              format: "webm",
+              source_lang: sourceLang,
               target_lang: targetLang,
+              stream_translation: streamTranslation,
             });
           }
-        };
-        reader.readAsDataURL(blob);
+        });
       };
 
       mediaRecorder.start(1000);
@@ -285,6 +300,20 @@ function Dashboard({ user, onLogout }) {
 
   const clearHistory = () => {
     setTranslationHistory([]);
+    setHistoryCursor(null);
+  };
+
+  const loadMoreHistory = async () => {
+    try {
+      const response = await axios.get("/api/translation_history", {
+        params: { before: historyCursor },
+        withCredentials: true,
+      });
+      setTranslationHistory((prev) => [...prev, ...response.data.history]);
+      setHistoryCursor(response.data.next_cursor);
+    } catch (err) {
+      console.error("Failed to load older history:", err.message);
+    }
   };
 
   const formatDate = (dateString) => {
@@ -353,15 +382,12 @@ function Dashboard({ user, onLogout }) {
                   onChange={(e) => setSourceLang(e.target.value)}
                   disabled={isRecording}
                 >
-                  {Object.keys(availableLanguages).length === 0 ? (
-                    <option value="">Loading languages...</option>
-                  ) : (
-                    Object.entries(availableLanguages).map(([name, code]) => (
-                      <option key={code} value={code}>
-                        {name} {code === "en" ? "(US)" : ""}
-                      </option>
-                    ))
-                  )}
+                  <option value="auto">Auto-detect</option>
+                  {Object.entries(availableLanguages).map(([name, code]) => (
+                    <option key={code} value={code}>
+                      {name} {code === "en" ? "(US)" : ""}
+                    </option>
+                  ))}
                 </select>
               </div>
 
@@ -390,6 +416,20 @@ function Dashboard({ user, onLogout }) {
                   )}
                 </select>
               </div>
+
+              <div className="language-group">
+                <label htmlFor="translationOutput">Translation Output</label>
+                <select
+                  id="translationOutput"
+                  className="select"
+                  value={streamTranslation ? "stream" : "complete"}
+                  onChange={(e) => setStreamTranslation(e.target.value === "stream")}
+                  disabled={isRecording}
+                >
+                  <option value="complete">When complete (best quality)</option>
+                  <option value="stream">Word by word (faster, slightly lower quality)</option>
+                </select>
+              </div>
             </div>
 
             <div className="recording-controls">
@@ -453,6 +493,11 @@ function Dashboard({ user, onLogout }) {
                   </div>
                 ))
               )}
+              {historyCursor && (
+                <button className="btn-clear" onClick={loadMoreHistory}>
+                  Load older
+                </button>
+              )}
             </div>
           </div>
         </div>
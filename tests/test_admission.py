@@ -0,0 +1,120 @@
+import threading
+
+import app
+from app import AdmissionController
+
+
+def test_new_utterance_supersedes_the_sockets_previous_job():
+    admission = AdmissionController(max_running=1, max_queued=4, max_per_user=2)
+    first, _ = admission.submit("sid-1", "alice")
+    second, _ = admission.submit("sid-1", "alice")
+    assert first.cancelled
+    assert not second.cancelled
+    assert admission.stats()['superseded'] == 1
+    assert admission.stats()['cancelled'] == 1
+    assert admission.stats()['queued'] == 1
+
+
+def test_running_job_is_not_superseded():
+    admission = AdmissionController(max_running=2, max_queued=4, max_per_user=2)
+    first, _ = admission.submit("sid-1", "alice")
+    assert admission.wait_turn(first)
+    second, _ = admission.submit("sid-1", "alice")
+    assert first.state == 'running'
+    assert second is not None
+    assert 'superseded' not in admission.stats()
+    # Disconnecting cancels both
+    admission.cancel_sid("sid-1")
+    assert first.cancelled and second.cancelled
+    assert not admission.jobs_by_sid
+
+
+def test_rejected_submit_keeps_the_queued_job():
+    admission = AdmissionController(max_running=1, max_queued=1, max_per_user=1)
+    running, _ = admission.submit("sid-1", "alice")
+    assert admission.wait_turn(running)
+    queued, _ = admission.submit("sid-2", "bob")
+    rejected, _ = admission.submit("sid-2", "alice")  # alice is at her limit
+    assert rejected is None
+    assert queued.state == 'queued'
+    # bob replacing his own queued job fits in the freed queue slot and user quota
+    newer, _ = admission.submit("sid-2", "bob")
+    assert newer is not None
+    assert queued.cancelled
+
+
+def test_per_user_limit_rejects_with_retry_hint():
+    admission = AdmissionController(max_running=4, max_queued=4, max_per_user=1)
+    job, _ = admission.submit("sid-1", "alice")
+    rejected, retry_after = admission.submit("sid-2", "alice")
+    assert job is not None
+    assert rejected is None
+    assert retry_after >= 1.0
+    assert admission.stats()['rejected_user'] == 1
+    # Other users are unaffected
+    other, _ = admission.submit("sid-3", "bob")
+    assert other is not None
+
+
+def test_full_queue_rejects():
+    admission = AdmissionController(max_running=1, max_queued=1, max_per_user=5)
+    assert admission.submit("sid-1", "alice")[0] is not None
+    assert admission.submit("sid-2", "bob")[0] is not None
+    job, retry_after = admission.submit("sid-3", "carol")
+    assert job is None
+    assert retry_after >= 1.0
+    assert admission.stats()['rejected_full'] == 1
+
+
+def test_jobs_run_in_order_and_release_frees_the_slot():
+    admission = AdmissionController(max_running=1, max_queued=4, max_per_user=2)
+    first, _ = admission.submit("sid-1", "alice")
+    second, _ = admission.submit("sid-2", "bob")
+    assert admission.wait_turn(first)
+    assert first.state == 'running'
+
+    started = threading.Event()
+    thread = threading.Thread(target=lambda: admission.wait_turn(second) and started.set())
+    thread.start()
+    assert not started.wait(timeout=0.2)
+
+    admission.release(first)
+    assert started.wait(timeout=2.0)
+    thread.join()
+    assert first.state == 'done'
+    assert admission.stats()['running'] == 1
+    admission.release(second)
+    assert admission.stats()['running'] == 0
+    assert not admission.jobs_by_sid and not admission.jobs_by_user
+
+
+def test_cancel_while_queued_and_disconnect():
+    admission = AdmissionController(max_running=1, max_queued=4, max_per_user=2)
+    running, _ = admission.submit("sid-1", "alice")
+    assert admission.wait_turn(running)
+    queued, _ = admission.submit("sid-2", "bob")
+
+    result = []
+    thread = threading.Thread(target=lambda: result.append(admission.wait_turn(queued)))
+    thread.start()
+    admission.cancel_sid("sid-2")
+    thread.join(timeout=2.0)
+    assert result == [False]
+    assert admission.stats()['queued'] == 0
+    # Releasing a cancelled job must not change the counts again
+    admission.release(queued)
+    assert admission.stats()['cancelled'] == 1
+    admission.release(running)
+
+
+def test_cancelling_a_job_cancels_its_futures():
+    admission = AdmissionController(max_running=1, max_queued=4, max_per_user=2)
+    job, _ = admission.submit("sid-1", "alice")
+    future = app.Future()
+    job.attach([future])
+    admission.cancel_sid("sid-1")
+    assert future.cancelled()
+    # Futures attached after the cancel are cancelled straight away
+    late = app.Future()
+    job.attach([late])
+    assert late.cancelled()
@@ -0,0 +1,58 @@
+import base64
+
+import numpy as np
+import pytest
+
+from app import TARGET_SAMPLE_RATE, pcm_to_float32, read_audio_payload, requested_sample_rate, to_mono_16k
+
+
+def test_pcm16_is_scaled_to_unit_range():
+    samples = pcm_to_float32(np.array([0, 16384, -32768], dtype='<i2').tobytes())
+    assert samples.dtype == np.float32
+    assert samples.tolist() == [0.0, 0.5, -1.0]
+
+
+def test_float32_is_viewed_without_a_copy_and_odd_bytes_are_ignored():
+    raw = bytearray(np.array([0.25, -0.5], dtype='<f4').tobytes() + b"\x01")
+    samples = pcm_to_float32(raw, 'f32le')
+    assert samples.tolist() == [0.25, -0.5]
+    raw[0:4] = np.array([1.0], dtype='<f4').tobytes()
+    assert samples[0] == 1.0
+
+
+def test_binary_payload_is_wrapped_not_copied():
+    audio = b"\x00\x01" * 100
+    buffer, fmt = read_audio_payload({'audio': audio, 'format': 'PCM16'})
+    assert isinstance(buffer, memoryview)
+    assert buffer.obj is audio
+    assert fmt == 'pcm16'
+
+
+def test_legacy_data_url_is_decoded():
+    audio = b"webm bytes"
+    data_url = "data:audio/webm;codecs=opus;base64," + base64.b64encode(audio).decode('ascii')
+    buffer, fmt = read_audio_payload({'audio': data_url})
+    assert bytes(buffer) == audio
+    assert fmt == 'webm'
+    # Bare base64 without the data: prefix also works
+    assert bytes(read_audio_payload({'audio': base64.b64encode(audio).decode('ascii')})[0]) == audio
+
+
+def test_declared_sample_rates_must_be_common_device_rates():
+    assert requested_sample_rate({}, TARGET_SAMPLE_RATE) == TARGET_SAMPLE_RATE
+    assert requested_sample_rate({'sample_rate': '48000'}, TARGET_SAMPLE_RATE) == 48000
+    assert requested_sample_rate({'sample_rate': 44111}, TARGET_SAMPLE_RATE) is None
+    assert requested_sample_rate({'sample_rate': 'abc'}, TARGET_SAMPLE_RATE) is None
+
+
+@pytest.mark.parametrize("rate", [8000, 11025, 12000, 22050, 44100, 48000, 88200, 96000])
+def test_decoded_audio_is_resampled_from_any_reasonable_rate(rate):
+    samples = to_mono_16k(np.zeros((rate, 2), dtype=np.float32), rate)
+    assert samples.ndim == 1
+    assert abs(len(samples) - TARGET_SAMPLE_RATE) <= 1
+
+
+@pytest.mark.parametrize("rate", [44111, 7999, 0])
+def test_rates_with_huge_resample_kernels_are_rejected(rate):
+    with pytest.raises(ValueError):
+        to_mono_16k(np.zeros(100, dtype=np.float32), rate)
@@ -0,0 +1,80 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import app
+from app import MicroBatcher
+
+
+def test_batches_of_every_tier_run_on_the_shared_stage():
+    stage = ThreadPoolExecutor(1, thread_name_prefix="test-stage")
+    threads = []
+
+    def run_batch(items):
+        threads.append(threading.current_thread().name)
+        return items
+
+    batchers = [MicroBatcher(f"tier-{index}", run_batch, 4, 0, executor=stage) for index in range(3)]
+    futures = [batcher.submit(index) for index, batcher in enumerate(batchers)]
+    assert [future.result(timeout=2.0) for future in futures] == [0, 1, 2]
+    assert len(threads) == 3
+    assert all(name.startswith("test-stage") for name in threads)
+    stage.shutdown()
+
+
+def test_asr_tiers_share_one_stage():
+    assert len({batcher.executor for batcher in app.asr_batchers.values()}) == 1
+    assert app.asr_stage._max_workers == max(1, app.INFERENCE_WORKERS)
+
+
+def test_concurrent_requests_share_a_batch_up_to_the_size_limit():
+    batches = []
+
+    def run_batch(items):
+        batches.append(list(items))
+        return [item * 10 for item in items]
+
+    batcher = MicroBatcher("test", run_batch, max_batch_size=2, max_wait_ms=200)
+    futures = [batcher.submit(item) for item in range(5)]
+    assert [future.result(timeout=2.0) for future in futures] == [0, 10, 20, 30, 40]
+    assert all(len(batch) <= 2 for batch in batches)
+    assert batcher.stats()['items'] == 5
+    assert batcher.stats()['avg_batch_size'] > 1
+
+
+def test_a_lone_request_is_dispatched_after_the_wait():
+    batcher = MicroBatcher("test", lambda items: items, max_batch_size=8, max_wait_ms=10)
+    assert batcher.submit("only").result(timeout=2.0) == "only"
+    assert batcher.stats()['batches'] == 1
+
+
+def test_cancelled_requests_are_dropped_from_the_batch():
+    running = threading.Event()
+    unblock = threading.Event()
+    seen = []
+
+    def run_batch(items):
+        running.set()
+        unblock.wait(timeout=2.0)
+        seen.extend(items)
+        return items
+
+    batcher = MicroBatcher("test", run_batch, max_batch_size=8, max_wait_ms=0)
+    first = batcher.submit("first")
+    assert running.wait(timeout=2.0)
+    stale = batcher.submit("stale")
+    assert stale.cancel()
+    fresh = batcher.submit("fresh")
+    unblock.set()
+    assert fresh.result(timeout=2.0) == "fresh"
+    assert first.result(timeout=2.0) == "first"
+    assert "stale" not in seen
+
+
+def test_a_failed_batch_fails_every_request_in_it():
+    def run_batch(items):
+        raise RuntimeError("out of memory")
+
+    batcher = MicroBatcher("test", run_batch, max_batch_size=4, max_wait_ms=100)
+    futures = [batcher.submit(item) for item in range(2)]
+    for future in futures:
+        assert isinstance(future.exception(timeout=2.0), RuntimeError)
@@ -0,0 +1,66 @@
+from app import LRUCache, translation_cache_key
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = LRUCache("test", max_entries=2, max_bytes=1 << 20)
+    cache.put(("a",), "1")
+    cache.put(("b",), "2")
+    assert cache.get(("a",)) == "1"  # "b" is now the oldest
+    cache.put(("c",), "3")
+    assert cache.get(("b",)) is None
+    assert cache.get(("a",)) == "1"
+    assert cache.get(("c",)) == "3"
+    assert cache.stats()['evictions'] == 1
+
+
+def test_memory_bound_evicts_and_skips_oversized_values():
+    cache = LRUCache("test", max_entries=100, max_bytes=300)
+    cache.put(("big",), "x" * 1000)
+    assert cache.get(("big",)) is None
+    for i in range(10):
+        cache.put((str(i),), "y" * 50)
+    assert cache.bytes <= 300
+    assert cache.stats()['entries'] < 10
+    assert cache.get(("9",)) == "y" * 50
+
+
+def test_replacing_a_key_keeps_byte_count_exact():
+    cache = LRUCache("test", max_entries=10, max_bytes=1 << 20)
+    cache.put(("a",), "short")
+    cache.put(("a",), "a much longer value")
+    assert cache.bytes == LRUCache._size_of(("a",), "a much longer value")
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.time.time", lambda: now[0])
+    cache = LRUCache("test", max_entries=10, max_bytes=1 << 20, ttl_s=60)
+    cache.put(("a",), "1")
+    now[0] += 30
+    assert cache.get(("a",)) == "1"
+    now[0] += 31
+    assert cache.get(("a",)) is None
+    assert cache.stats()['expirations'] == 1
+    assert cache.bytes == 0
+
+
+def test_save_and_load_round_trip(tmp_path):
+    path = str(tmp_path / "cache.json")
+    cache = LRUCache("test", max_entries=10, max_bytes=1 << 20, path=path)
+    cache.put(("hello", "en", "fr"), "bonjour")
+    cache.save()
+    restored = LRUCache("test", max_entries=10, max_bytes=1 << 20, path=path)
+    restored.load()
+    assert restored.get(("hello", "en", "fr")) == "bonjour"
+
+
+def test_hit_rate():
+    cache = LRUCache("test", max_entries=10, max_bytes=1 << 20)
+    cache.put(("a",), "1")
+    cache.get(("a",))
+    cache.get(("b",))
+    assert cache.stats()['hit_rate'] == 0.5
+
+
+def test_translation_key_normalises_whitespace():
+    assert translation_cache_key("  hello   world ", "en", "fr") == translation_cache_key("hello world", "en", "fr")
@@ -0,0 +1,21 @@
+from bson import ObjectId
+
+from app import encode_history_cursor, history_before_filter
+
+
+def test_cursor_round_trips_into_a_keyset_filter():
+    entry = {'_id': ObjectId(), 'timestamp': "2024-05-01T10:00:00.000Z"}
+    cursor = encode_history_cursor(entry)
+    assert "=" not in cursor
+    assert history_before_filter(cursor) == {'$or': [
+        {'timestamp': {'$lt': entry['timestamp']}},
+        {'timestamp': entry['timestamp'], '_id': {'$lt': entry['_id']}},
+    ]}
+
+
+def test_plain_timestamp_jumps_to_a_date():
+    assert history_before_filter("2024-05-01T00:00:00Z") == {'timestamp': {'$lt': "2024-05-01T00:00:00Z"}}
+
+
+def test_malformed_cursor_is_treated_as_a_timestamp():
+    assert history_before_filter("not-a-cursor") == {'timestamp': {'$lt': "not-a-cursor"}}
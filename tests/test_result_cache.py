@@ -0,0 +1,54 @@
+import threading
+
+from app import AdmissionController, InflightRequests, result_cache_key
+
+
+def test_key_depends_on_bytes_and_everything_that_shapes_the_result():
+    base = result_cache_key(b"audio", "webm", {'target_lang': 'es'}, None)
+    assert base == result_cache_key(memoryview(b"audio"), "webm", {'target_lang': 'es'}, None)
+    assert base != result_cache_key(b"audio!", "webm", {'target_lang': 'es'}, None)
+    assert base != result_cache_key(b"audio", "wav", {'target_lang': 'es'}, None)
+    assert base != result_cache_key(b"audio", "webm", {'target_lang': 'fr'}, None)
+    assert base != result_cache_key(b"audio", "webm", {'target_lang': 'es', 'target_langs': ['de']}, None)
+    assert base != result_cache_key(b"audio", "webm", {'target_lang': 'es', 'sample_rate': 48000}, None)
+    assert base != result_cache_key(b"audio", "webm", {'target_lang': 'es'}, "fr")
+    assert base != result_cache_key(b"audio", "webm", {'target_lang': 'es', 'stream_translation': True}, None)
+
+
+def test_first_claim_owns_and_later_ones_wait_for_its_result():
+    inflight = InflightRequests()
+    future, owner = inflight.claim("key")
+    waiter, waiter_owner = inflight.claim("key")
+    assert owner and not waiter_owner
+    assert waiter is future
+    results = []
+    thread = threading.Thread(target=lambda: results.append(waiter.result(timeout=2.0)))
+    thread.start()
+    inflight.resolve("key", {'original': 'hi'})
+    thread.join()
+    assert results == [{'original': 'hi'}]
+    assert inflight.stats() == {'inflight': 0, 'joined': 1}
+    # Once resolved, the next claim computes again
+    assert inflight.claim("key")[1]
+
+
+def test_resolving_with_nothing_releases_waiters():
+    inflight = InflightRequests()
+    inflight.claim("key")
+    waiter, _ = inflight.claim("key")
+    inflight.resolve("key", None)
+    assert waiter.result(timeout=1.0) is None
+
+
+def test_waiters_count_against_the_per_user_limit():
+    admission = AdmissionController(max_running=4, max_queued=4, max_per_user=2)
+    assert admission.join_wait("alice") is None
+    assert admission.join_wait("alice") is None
+    assert admission.join_wait("alice") is not None
+    job, retry_after = admission.submit("sid-1", "alice")
+    assert job is None and retry_after >= 1.0
+    assert admission.stats()['waiting_on_duplicate'] == 2
+    admission.leave_wait("alice")
+    assert admission.submit("sid-1", "alice")[0] is not None
+    admission.leave_wait("alice")
+    assert not admission.waiters_by_user
@@ -0,0 +1,41 @@
+import app
+from app import split_sentences
+
+
+def test_splits_on_sentence_punctuation():
+    assert split_sentences("Hello there. How are you? Fine!") == ["Hello there.", "How are you?", "Fine!"]
+    assert split_sentences("你好。今天天气很好！") == ["你好。", "今天天气很好！"]
+    assert split_sentences("   ") == []
+
+
+def test_long_run_on_is_packed_by_words(monkeypatch):
+    monkeypatch.setattr(app, "TRANSLATION_MAX_SENTENCE_CHARS", 20)
+    sentences = split_sentences("one two three four five six seven eight nine ten")
+    assert all(len(s) <= 20 for s in sentences)
+    assert " ".join(sentences) == "one two three four five six seven eight nine ten"
+
+
+def test_thai_is_split_by_length_only(monkeypatch):
+    monkeypatch.setattr(app, "TRANSLATION_MAX_SENTENCE_CHARS", 10)
+    sentences = split_sentences("สวัสดี ครับ. วันนี้ อากาศ ดี", lang="th")
+    assert all(len(s) <= 10 for s in sentences)
+    assert "." in "".join(sentences)  # No split on the full stop
+
+
+def test_unspaced_run_is_cut_after_a_comma(monkeypatch):
+    monkeypatch.setattr(app, "TRANSLATION_MAX_SENTENCE_CHARS", 10)
+    sentences = split_sentences("今天天气很好，我们去公园散步吧")
+    assert sentences == ["今天天气很好，", "我们去公园散步吧"]
+
+
+def test_unspaced_run_without_breaks_is_hard_cut(monkeypatch):
+    monkeypatch.setattr(app, "TRANSLATION_MAX_SENTENCE_CHARS", 400)
+    sentences = split_sentences("字" * 1050)
+    assert [len(s) for s in sentences] == [400, 400, 250]
+
+
+def test_comma_too_early_falls_back_to_hard_cut(monkeypatch):
+    monkeypatch.setattr(app, "TRANSLATION_MAX_SENTENCE_CHARS", 10)
+    sentences = split_sentences("字，" + "字" * 20)
+    assert all(len(s) == 10 for s in sentences[:-1])
+    assert "".join(sentences) == "字，" + "字" * 20
@@ -0,0 +1,94 @@
+import types
+
+import numpy as np
+import torch
+
+import app
+from app import SessionLanguage, identify_languages
+
+
+class FakeWhisper:
+    """Returns fixed language-token logits for every clip."""
+
+    def __init__(self, logits_by_code):
+        codes = list(logits_by_code)
+        self.generation_config = types.SimpleNamespace(
+            lang_to_id={f"<|{code}|>": 10 + index for index, code in enumerate(codes)},
+            decoder_start_token_id=1,
+        )
+        self.device = torch.device("cpu")
+        self.logits = torch.full((10 + len(codes),), -100.0)
+        for index, code in enumerate(codes):
+            self.logits[10 + index] = logits_by_code[code]
+
+    def parameters(self):
+        yield torch.zeros(1)
+
+    def __call__(self, input_features, decoder_input_ids):
+        return types.SimpleNamespace(logits=self.logits.expand(len(input_features), 1, -1))
+
+
+def fake_asr(logits_by_code):
+    extractor = lambda clips, sampling_rate, return_tensors: types.SimpleNamespace(input_features=torch.zeros(len(clips), 80, 10))
+    return types.SimpleNamespace(model=FakeWhisper(logits_by_code), feature_extractor=extractor)
+
+
+def test_identification_picks_the_most_likely_language():
+    asr = fake_asr({"en": 0.0, "es": 3.0, "fr": 1.0})
+    [(code, probability)] = identify_languages(asr, [np.zeros(16000, dtype=np.float32)])
+    assert code == "es"
+    assert probability > 0.8
+
+
+def test_identification_skips_languages_the_translation_model_lacks():
+    assert "te" not in app.MT_SOURCE_LANGUAGES
+    asr = fake_asr({"te": 5.0, "ta": 1.0, "en": 0.0})
+    [(code, probability)] = identify_languages(asr, [np.zeros(16000, dtype=np.float32)])
+    assert code == "ta"
+    assert probability < app.LANGUAGE_ID_MIN_CONFIDENCE
+
+
+def test_checkpoints_without_language_tokens_identify_nothing():
+    asr = types.SimpleNamespace(model=types.SimpleNamespace(generation_config=types.SimpleNamespace(lang_to_id=None)))
+    assert identify_languages(asr, [np.zeros(10), np.zeros(10)]) == [(None, None), (None, None)]
+
+
+def test_first_utterance_is_identified_then_cached():
+    spoken = SessionLanguage()
+    assert spoken.request() == (None, True)
+    spoken.observe("es", 0.9)
+    assert spoken.request() == ("es", False)
+    spoken.observe("es", None)  # A forced decode does not count as an identification
+    assert spoken.identifications == 1
+
+
+def test_uncertain_identification_keeps_the_cached_language():
+    spoken = SessionLanguage()
+    spoken.observe("de", 0.2)
+    assert spoken.request() == (None, True)
+    spoken.observe("es", 0.9)
+    spoken.observe("fr", 0.3)
+    assert spoken.language == "es"
+    spoken.observe("fr", 0.8)
+    assert spoken.language == "fr"
+    assert spoken.switches == 1
+
+
+def test_cached_language_is_rechecked(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr("app.time.monotonic", lambda: now[0])
+    spoken = SessionLanguage()
+    spoken.observe("es", 0.9)
+    now[0] += app.LANGUAGE_RECHECK_S
+    assert spoken.request() == ("es", True)
+
+
+def test_pinned_language_overrides_identification():
+    spoken = SessionLanguage()
+    spoken.observe("es", 0.9)
+    spoken.pin("it")
+    assert spoken.request() == ("it", False)
+    spoken.observe("fr", 0.99)
+    assert spoken.language == "it"
+    spoken.pin(None)
+    assert spoken.request() == (None, True)
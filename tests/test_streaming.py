@@ -0,0 +1,96 @@
+import threading
+
+import numpy as np
+
+import app
+from app import StreamSession, _common_prefix, _strip_overlap
+
+
+def test_overlap_with_committed_tail_is_stripped():
+    committed = "we went to the market".split()
+    assert _strip_overlap(committed, "the Market, and bought bread".split()) == ["and", "bought", "bread"]
+    assert _strip_overlap(committed, "and bought bread".split()) == ["and", "bought", "bread"]
+    assert _strip_overlap([], ["hello"]) == ["hello"]
+
+
+def test_overlap_is_limited_to_the_last_units():
+    committed = ["a", "b", "c", "d"]
+    assert _strip_overlap(committed, ["c", "d", "e"], max_overlap=1) == ["c", "d", "e"]
+    assert _strip_overlap(committed, ["d", "e"], max_overlap=1) == ["e"]
+
+
+def test_common_prefix_ignores_case_and_punctuation():
+    assert _common_prefix("Hello there my".split(), "hello, there friend".split()) == ["hello,", "there"]
+    assert _common_prefix([], ["hello"]) == []
+
+
+def frame(value, size=2):
+    return np.full(size, value, dtype=np.float32)
+
+
+def test_frames_decoded_out_of_order_are_appended_in_order():
+    stream = StreamSession("", None)
+    seqs = [stream.reserve() for _ in range(4)]
+    assert seqs == [0, 1, 2, 3]
+    for seq in (2, 0, 3, 1):
+        stream.append(seq, frame(seq))
+    assert stream.samples.tolist() == [0, 0, 1, 1, 2, 2, 3, 3]
+    assert stream.pending_samples == 8
+
+
+def test_client_sequence_numbers_reorder_frames():
+    stream = StreamSession("", None)
+    stream.append(stream.reserve(1), frame(1))
+    assert len(stream.samples) == 0
+    stream.append(stream.reserve(0), frame(0))
+    assert stream.samples.tolist() == [0, 0, 1, 1]
+    # A duplicate of an appended frame is ignored
+    stream.append(stream.reserve(0), frame(9))
+    assert stream.samples.tolist() == [0, 0, 1, 1]
+
+
+def test_missing_frame_is_skipped_once_too_many_are_held_back(monkeypatch):
+    monkeypatch.setattr(app, "STREAM_MAX_REORDER", 2)
+    stream = StreamSession("", None)
+    for seq in (1, 2, 3):
+        stream.append(stream.reserve(seq), frame(seq, 1))
+    assert stream.samples.tolist() == [1, 2, 3]
+
+
+def test_wait_for_frames_blocks_until_in_flight_frames_are_appended():
+    stream = StreamSession("", None)
+    seq = stream.reserve()
+    timer = threading.Timer(0.1, stream.append, (seq, frame(0)))
+    timer.start()
+    assert stream.wait_for_frames(timeout=2.0)
+    assert len(stream.samples) == 2
+    assert not stream.wait_for_frames(count=5, timeout=0.05)
+
+
+def test_backlog_is_bounded_by_dropping_the_oldest_audio(monkeypatch):
+    monkeypatch.setattr(app, "STREAM_MAX_BACKLOG_S", 1.0)
+    stream = StreamSession("", None)
+    stream.append(stream.reserve(), np.arange(app.STREAM_SAMPLE_RATE * 3, dtype=np.float32))
+    assert len(stream.samples) == app.STREAM_SAMPLE_RATE
+    assert stream.samples[0] == app.STREAM_SAMPLE_RATE * 2
+    assert stream.offset == stream.dropped_samples == app.STREAM_SAMPLE_RATE * 2
+
+
+def test_each_pass_covers_at_most_one_window(monkeypatch):
+    passes = []
+
+    def transcribe(samples, sample_rate, tier=None, spoken=None):
+        passes.append(len(samples))
+        return "", "en"
+
+    monkeypatch.setattr(app, "VAD_ENABLED", False)
+    monkeypatch.setattr(app, "transcribe_audio", transcribe)
+    monkeypatch.setattr(app, "emit", lambda *args, **kwargs: None)
+    window = int(app.STREAM_WINDOW_S * app.STREAM_SAMPLE_RATE)
+    stream = StreamSession("", None)
+    stream.append(stream.reserve(), np.zeros(window * 3 // 2, dtype=np.float32))
+    app.stream_step(stream)
+    assert passes == [window]
+    overlap = int(app.STREAM_OVERLAP_S * app.STREAM_SAMPLE_RATE)
+    assert len(stream.samples) == window // 2 + overlap
+    assert stream.offset == window - overlap
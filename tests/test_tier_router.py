@@ -0,0 +1,86 @@
+import time
+
+import pytest
+
+import app
+from app import TierRouter
+
+TIERS = ["tiny", "small", "medium"]
+
+
+@pytest.fixture
+def loaded(monkeypatch):
+    tiers = list(TIERS)
+    monkeypatch.setattr(app, "tier_ready", lambda model, tier: tier in tiers)
+    monkeypatch.setattr(app, "TIER_SWITCH_COOLDOWN_S", 0.0)
+    return tiers
+
+
+def record(router, tier, ms, count=20):
+    for _ in range(count):
+        router.latencies[tier].append((time.monotonic(), ms))
+
+
+def test_idle_server_uses_the_largest_loaded_tier(loaded):
+    router = TierRouter("asr", TIERS, 1000)
+    assert router.select() == "medium"
+    loaded.remove("medium")
+    assert router.select() == "small"
+    loaded.clear()
+    assert router.select() is None
+
+
+def test_load_steps_down_one_tier_at_a_time_and_recovers(loaded):
+    router = TierRouter("asr", TIERS, 1000)
+    router.inflight = app.TIER_MAX_INFLIGHT
+    assert router.select() == "small"
+    assert router.select() == "tiny"
+    assert router.select() == "tiny"  # Already at the smallest tier
+    router.inflight = 0
+    assert router.select() == "small"
+    assert router.select() == "medium"
+    assert router.switches == 4
+
+
+def test_slow_tier_is_downgraded(loaded):
+    router = TierRouter("asr", TIERS, 1000)
+    record(router, "medium", 1500)
+    assert router.select() == "small"
+    # Latencies from before the switch no longer count; small is fast enough to climb back
+    record(router, "small", 100)
+    assert router.select() == "medium"
+
+
+def test_between_thresholds_the_tier_holds(loaded):
+    router = TierRouter("asr", TIERS, 1000)
+    router.downgrade = 1
+    record(router, "small", 700)  # Below the threshold but above the recovery ratio of it
+    assert router.select() == "small"
+    assert router.switches == 0
+
+
+def test_cooldown_prevents_flapping(loaded, monkeypatch):
+    monkeypatch.setattr(app, "TIER_SWITCH_COOLDOWN_S", 60.0)
+    router = TierRouter("asr", TIERS, 1000)
+    router.inflight = app.TIER_MAX_INFLIGHT
+    assert router.select() == "small"
+    assert router.select() == "small"
+    assert router.switches == 1
+
+
+def test_latency_budget_caps_the_tier(loaded):
+    router = TierRouter("asr", TIERS, 10000)
+    record(router, "medium", 900)
+    record(router, "small", 300)
+    assert router.select(budget_ms=500) == "small"
+    assert router.select(budget_ms=100) == "tiny"
+    assert router.select() == "medium"
+
+
+def test_track_counts_in_flight_requests_and_latency(loaded):
+    router = TierRouter("asr", TIERS, 1000)
+    with router.track("small"):
+        assert router.inflight == 1
+    assert router.inflight == 0
+    assert len(router.latencies["small"]) == 1
+    assert "small" in router.stats()['p95_ms']
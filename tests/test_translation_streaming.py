@@ -0,0 +1,55 @@
+import torch
+
+from app import StopWhen, TranslationStreamer, translation_cache_key
+
+EOS = 2
+PIECES = {10: "Hel", 11: "lo", 12: " wor", 13: "ld", 14: "!", 20: "你", 21: "好", 30: "\ufffd"}
+
+
+class FakeTokenizer:
+    def batch_decode(self, sequences, skip_special_tokens=True):
+        return ["".join(PIECES[token] for token in tokens) for tokens in sequences]
+
+
+def stream(targets, steps):
+    deltas = []
+    streamer = TranslationStreamer(FakeTokenizer(), targets, lambda row, delta: deltas.append((row, delta)), EOS)
+    streamer.put(torch.tensor([[0]] * len(targets)))  # Decoder prompt
+    for step in steps:
+        streamer.put(torch.tensor(step))
+    streamer.end()
+    return deltas
+
+
+def test_spaced_text_is_sent_a_word_at_a_time():
+    deltas = stream(["en"], [[10], [11], [12], [13], [14], [EOS]])
+    assert deltas == [(0, "Hello "), (0, "world!")]
+
+
+def test_unspaced_text_is_sent_a_character_at_a_time():
+    deltas = stream(["zh"], [[20], [21], [EOS]])
+    assert deltas == [(0, "你"), (0, "好")]
+
+
+def test_rows_finish_independently_and_end_flushes_the_rest():
+    deltas = stream(["en", "zh"], [[10, 20], [EOS, 21], [EOS, 21]])
+    assert deltas == [(1, "你"), (0, "Hel"), (1, "好"), (1, "好")]
+
+
+def test_incomplete_multibyte_characters_are_held_back():
+    deltas = stream(["zh"], [[30]])
+    # Only sent once the stream ends, never half way
+    assert deltas == [(0, "\ufffd")]
+
+
+def test_stop_when_stops_every_row():
+    flag = [False]
+    criteria = StopWhen(lambda: flag[0])
+    input_ids = torch.zeros((3, 4), dtype=torch.long)
+    assert criteria(input_ids, None).tolist() == [False, False, False]
+    flag[0] = True
+    assert criteria(input_ids, None).tolist() == [True, True, True]
+
+
+def test_greedy_translations_are_cached_apart_from_beam_search():
+    assert translation_cache_key("hello", "en", "fr") != translation_cache_key("hello", "en", "fr", decoding="greedy")
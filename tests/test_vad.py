@@ -0,0 +1,44 @@
+import numpy as np
+
+from app import TARGET_SAMPLE_RATE, detect_speech
+
+RATE = TARGET_SAMPLE_RATE
+
+
+def tone(seconds, amplitude=0.3, freq=220.0):
+    t = np.arange(int(seconds * RATE)) / RATE
+    return (amplitude * np.sin(2 * np.pi * freq * t)).astype(np.float32)
+
+
+def silence(seconds):
+    return np.zeros(int(seconds * RATE), dtype=np.float32)
+
+
+def test_silence_has_no_speech():
+    assert detect_speech(silence(2.0)) == []
+
+
+def test_too_short_input_has_no_speech():
+    assert detect_speech(silence(0.005)) == []
+
+
+def test_speech_is_trimmed_to_the_voiced_part():
+    samples = np.concatenate([silence(1.0), tone(1.0), silence(1.0)])
+    segments = detect_speech(samples)
+    assert len(segments) == 1
+    start, end = segments[0]
+    # Within the hangover of the tone's edges
+    assert 0.6 * RATE <= start <= 1.0 * RATE
+    assert 2.0 * RATE <= end <= 2.4 * RATE
+
+
+def test_long_pause_splits_and_short_pause_is_bridged():
+    long_pause = np.concatenate([silence(0.5), tone(0.5), silence(2.0), tone(0.5), silence(0.5)])
+    assert len(detect_speech(long_pause)) == 2
+    short_pause = np.concatenate([silence(0.5), tone(0.5), silence(0.5), tone(0.5), silence(0.5)])
+    assert len(detect_speech(short_pause)) == 1
+
+
+def test_short_blips_are_dropped():
+    samples = np.concatenate([silence(1.0), tone(0.03), silence(1.0)])
+    assert detect_speech(samples) == []
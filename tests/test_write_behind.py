@@ -0,0 +1,81 @@
+import threading
+
+from pymongo.errors import ConnectionFailure
+
+from app import WriteBehindBuffer
+
+
+def make_buffer(write_batch, batch_size=2, interval_s=60.0, max_buffered=100, retries=2):
+    return WriteBehindBuffer("test", write_batch, batch_size, interval_s, max_buffered, retries)
+
+
+def test_writes_full_batches_and_flushes_the_rest():
+    batches = []
+    buffer = make_buffer(batches.append, batch_size=2)
+    for i in range(5):
+        buffer.add({'n': i})
+    assert buffer.flush(timeout=5.0)
+    assert [record['n'] for batch in batches for record in batch] == [0, 1, 2, 3, 4]
+    assert all(len(batch) <= 2 for batch in batches)
+    assert buffer.stats()['written'] == 5
+    buffer.close()
+
+
+def test_interval_writes_a_partial_batch():
+    written = threading.Event()
+    buffer = make_buffer(lambda batch: written.set(), batch_size=10, interval_s=0.1)
+    buffer.add({'n': 0})
+    assert written.wait(timeout=2.0)
+    buffer.close()
+
+
+def test_transient_errors_are_retried(monkeypatch):
+    monkeypatch.setattr("app.time.sleep", lambda seconds: None)
+    attempts = []
+
+    def write_batch(batch):
+        attempts.append(batch)
+        if len(attempts) == 1:
+            raise ConnectionFailure("mongo restarting")
+
+    buffer = make_buffer(write_batch, batch_size=1)
+    buffer.add({'n': 0})
+    assert buffer.flush(timeout=5.0)
+    assert len(attempts) == 2
+    assert buffer.stats()['retries'] == 1
+    assert buffer.stats()['written'] == 1
+    buffer.close()
+
+
+def test_permanent_errors_drop_the_batch():
+    def write_batch(batch):
+        raise ValueError("bad document")
+
+    buffer = make_buffer(write_batch, batch_size=1)
+    buffer.add({'n': 0})
+    assert buffer.flush(timeout=5.0)
+    assert buffer.stats()['dropped'] == 1
+    assert 'written' not in buffer.stats()
+    buffer.close()
+
+
+def test_full_buffer_keeps_the_newest_records():
+    writing = threading.Event()
+    unblock = threading.Event()
+    batches = []
+
+    def write_batch(batch):
+        writing.set()
+        unblock.wait(timeout=5.0)
+        batches.append(batch)
+
+    buffer = make_buffer(write_batch, batch_size=1, max_buffered=2)
+    buffer.add({'n': 0})
+    assert writing.wait(timeout=2.0)  # Writer is now stuck on record 0
+    for i in range(1, 5):
+        buffer.add({'n': i})
+    assert buffer.stats()['buffered'] == 2
+    assert buffer.stats()['dropped'] == 2
+    unblock.set()
+    buffer.close()
+    assert [record['n'] for batch in batches for record in batch] == [0, 3, 4]